@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.postgres.search import TrigramWordDistance
+from django.db import connection
+from django.db.models import BooleanField, CharField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Medico, Paciente
+
+# Búsqueda de pacientes y médicos para los campos de autocompletado
+# (GET /paciente/buscar/?q=... y /medico/buscar/?q=...).
+#
+# Devuelve los `limite` mejores resultados sin descargar el listado completo:
+# - identificadores por prefijo (DNI, teléfono, email, número de colegiado)
+#   sobre índices varchar_pattern_ops, primero en los resultados;
+# - nombres aproximados: pg_trgm compara el texto con cada palabra del nombre
+#   completo (word_similarity), así que sirve tanto para lo que se está
+#   escribiendo ("garc") como para errores ("garcia" -> García). El índice
+#   GiST (migración 0008) filtra y ordena por similitud y la consulta se
+#   detiene al llegar al límite, también con millones de pacientes.
+# Sin PostgreSQL (desarrollo) los nombres se buscan por subcadena.
+
+LIMITE = 10
+LIMITE_MAX = 50
+LONGITUD_MINIMA = 2  # Caracteres a partir de los que se busca
+
+# Expresiones de los índices de la migración 0008 (deben coincidir)
+NOMBRE_PACIENTE = "UPPER(nombre || ' ' || apellido)"
+NOMBRE_MEDICO = "UPPER(nombre || ' ' || especialidad)"
+
+
+class PalabraSimilar(Func):
+    """`expresion %> texto` (pg_trgm): alguna palabra de la expresión se parece al texto."""
+    arg_joiner = ' %%> '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+def _limite(valor):
+    try:
+        return min(max(int(valor), 1), LIMITE_MAX)
+    except (TypeError, ValueError):
+        return LIMITE
+
+
+def _por_prefijo(queryset, filtros, limite):
+    if not filtros:
+        return []
+    condicion = Q()
+    for filtro in filtros:
+        condicion |= Q(**filtro)
+    return list(queryset.filter(condicion)[:limite])
+
+
+def _por_nombre(queryset, expresion, campos, texto, limite):
+    if connection.vendor == 'postgresql':
+        nombre = RawSQL(expresion, (), output_field=CharField())
+        texto = Value(texto.upper())
+        return list(
+            queryset.filter(PalabraSimilar(nombre, texto))
+            .order_by(TrigramWordDistance(texto, nombre))[:limite]
+        )
+    # Cada palabra debe aparecer en alguno de los campos
+    for palabra in texto.split():
+        condicion = Q()
+        for campo in campos:
+            condicion |= Q(**{f'{campo}__icontains': palabra})
+        queryset = queryset.filter(condicion)
+    return list(queryset.order_by(*campos)[:limite])
+
+
+def _combinar(clave, *listas, limite):
+    # Sin repetidos y en el orden de las listas (primero las coincidencias exactas)
+    vistos, resultado = set(), []
+    for lista in listas:
+        for fila in lista:
+            if fila[clave] not in vistos:
+                vistos.add(fila[clave])
+                resultado.append(fila)
+    return resultado[:limite]
+
+
+def buscar_pacientes(texto, limite=LIMITE):
+    """Pacientes por DNI, teléfono o email (prefijo) y por nombre y apellido (aproximado)."""
+    texto, limite = (texto or '').strip(), _limite(limite)
+    if len(texto) < LONGITUD_MINIMA:
+        return []
+    pacientes = Paciente.objects.values('id_paciente', 'dni', 'nombre', 'apellido', 'email', 'telefono')
+
+    compacto = re.sub(r'[\s-]', '', texto)
+    filtros = []
+    if '@' in texto or ' ' not in texto:
+        filtros.append({'email__istartswith': texto})
+    if any(c.isdigit() for c in compacto):
+        filtros.append({'dni__startswith': compacto.upper()})
+        if compacto.lstrip('+').isdigit():
+            filtros.append({'telefono__startswith': compacto})
+    exactos = _por_prefijo(pacientes, filtros, limite)
+
+    # Con números o @ no es un nombre
+    nombres = []
+    if '@' not in texto and not any(c.isdigit() for c in texto):
+        nombres = _por_nombre(pacientes, NOMBRE_PACIENTE, ('apellido', 'nombre'), texto, limite)
+    return _combinar('id_paciente', exactos, nombres, limite=limite)
+
+
+def buscar_medicos(texto, limite=LIMITE):
+    """Médicos por número de colegiado (prefijo) y por nombre o especialidad (aproximado)."""
+    texto, limite = (texto or '').strip(), _limite(limite)
+    if len(texto) < LONGITUD_MINIMA:
+        return []
+    medicos = Medico.objects.values('id_medico', 'ncolegiado', 'nombre', 'especialidad')
+
+    if texto.isdigit():
+        return _por_prefijo(medicos, [{'ncolegiado__startswith': texto}], limite)
+    return _por_nombre(medicos, NOMBRE_MEDICO, ('nombre', 'especialidad'), texto, limite)
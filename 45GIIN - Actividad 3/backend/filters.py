@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .referencias import normalizar_refcita
+
+
+# Búsqueda de citas en el servidor
+class CitaBusquedaFilter(BaseFilterBackend):
+    """
+    Filtra el listado de citas por un único campo.
+    Parámetros: `campo` (id_cita, refcita, paciente, medico, especialidad,
+    fecha o estado) y `busqueda` (valor a buscar).
+    """
+    campos = ('id_cita', 'refcita', 'paciente', 'medico', 'especialidad', 'fecha', 'estado')
+    formatos_fecha = ('%Y-%m-%d', '%d-%m-%Y')  # Formatos aceptados para `fecha`
+
+    def filter_queryset(self, request, queryset, view):
+        campo = request.query_params.get('campo', 'id_cita')
+        valor = request.query_params.get('busqueda', '').strip()
+
+        # Sin valor o con un campo desconocido no se filtra
+        if not valor or campo not in self.campos:
+            return queryset
+        return getattr(self, f'filtrar_{campo}')(queryset, valor)
+
+    def filtrar_id_cita(self, queryset, valor):
+        if not valor.isdigit():
+            return queryset.none()
+        return queryset.filter(id_cita=int(valor))
+
+    def filtrar_refcita(self, queryset, valor):
+        # refcita se guarda en mayúsculas: búsqueda por prefijo sobre el índice único
+        # (con I/L leídas como 1 y O como 0, que no forman parte de las referencias)
+        return queryset.filter(refcita__startswith=normalizar_refcita(valor))
+
+    def filtrar_paciente(self, queryset, valor):
+        # Cada palabra debe coincidir con el nombre o el apellido del paciente
+        for palabra in valor.split():
+            queryset = queryset.filter(
+                Q(id_paciente__nombre__icontains=palabra) | Q(id_paciente__apellido__icontains=palabra)
+            )
+        return queryset
+
+    def filtrar_medico(self, queryset, valor):
+        return queryset.filter(id_medico__nombre__icontains=valor)
+
+    def filtrar_especialidad(self, queryset, valor):
+        return queryset.filter(especialidad__icontains=valor)
+
+    def filtrar_fecha(self, queryset, valor):
+        for formato in self.formatos_fecha:
+            try:
+                return queryset.filter(fecha=datetime.strptime(valor, formato).date())
+            except ValueError:
+                continue
+        return queryset.none()  # Fecha con formato no válido
+
+    def filtrar_estado(self, queryset, valor):
+        return queryset.filter(estado=valor.lower())
+
+
+# Ordenación de citas en el servidor
+class CitaOrderingFilter(OrderingFilter):
+    """
+    Ordenación compatible con la paginación por cursor.
+    Añade siempre `id_cita` como desempate para que el orden sea estable
+    cuando el campo elegido tiene valores repetidos (fecha, estado...);
+    CitaCursorPagination guarda en el cursor los dos valores.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        ordering = list(ordering)
+        if ordering[0].lstrip('-') != 'id_cita':
+            ordering.append('-id_cita' if ordering[0].startswith('-') else 'id_cita')
+        return ordering
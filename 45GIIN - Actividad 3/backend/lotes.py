@@ -0,0 +1,250 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+
+from .disponibilidad import ESTADOS_LIBRES
+from .metricas import citas_canceladas, citas_conflictos, citas_reprogramadas, citas_reservadas
+from .models import Cita, Medico, Notificaciones, OcupacionMedico, Paciente
+from .notificaciones import nueva_notificacion
+from .referencias import generar_refcitas
+from .serializers import CitaSerializer
+
+# Operaciones por lotes sobre citas (crear, cancelar y reprogramar).
+#
+# Todo el lote se resuelve con un número fijo de consultas:
+# - una por tabla para comprobar citas, pacientes y médicos referenciados,
+# - una sobre `cita` con la ocupación de los médicos y fechas afectados,
+# - bulk_create/bulk_update para las citas, el índice de disponibilidad y
+#   las notificaciones a los pacientes.
+# Las operaciones se aplican en orden, así que cancelar una cita libera su
+# horario para una operación posterior del mismo lote.
+
+# Número máximo de operaciones por petición
+CITAS_LOTE_MAX = getattr(settings, "CITAS_LOTE_MAX", 5000)
+
+
+# Serializer para las operaciones de un lote de citas
+class CitaLoteSerializer(serializers.Serializer):
+    """
+    Valida una operación de un lote sobre citas (crear, cancelar o reprogramar).
+    No consulta la base de datos: la existencia de paciente, médico y cita
+    se comprueba después para todo el lote a la vez.
+    """
+    CAMPOS_REQUERIDOS = {
+        "crear": ("id_paciente_id", "id_medico_id", "fecha", "hora"),
+        "cancelar": ("id_cita",),
+        "reprogramar": ("id_cita", "fecha", "hora"),
+    }
+
+    operacion = serializers.ChoiceField(choices=list(CAMPOS_REQUERIDOS))  # Tipo de operación
+    id_cita = serializers.IntegerField(required=False)  # Cita a cancelar o reprogramar
+    id_paciente_id = serializers.IntegerField(required=False)  # Paciente de la cita nueva
+    id_medico_id = serializers.IntegerField(required=False)  # Médico de la cita nueva
+    fecha = serializers.DateField(required=False)  # Fecha nueva
+    hora = serializers.TimeField(required=False)  # Hora nueva
+    especialidad = serializers.CharField(max_length=100, required=False, allow_null=True)  # Por defecto la del médico
+    estado = serializers.CharField(max_length=20, required=False, default="confirmada")  # Estado de la cita nueva
+
+    # Mismas validaciones de fecha y hora que CitaSerializer
+    validate_fecha = CitaSerializer.validate_fecha
+    validate_hora = CitaSerializer.validate_hora
+
+    def validate(self, data):
+        faltan = [campo for campo in self.CAMPOS_REQUERIDOS[data["operacion"]] if data.get(campo) is None]
+        if faltan:
+            raise serializers.ValidationError({campo: ["Este campo es requerido."] for campo in faltan})
+        return data
+
+
+def _resultado(indice, codigo, **datos):
+    return {"indice": indice, "status": codigo, **datos}
+
+
+def procesar_lote(operaciones):
+    """
+    Aplica una lista de operaciones sobre citas.
+    Devuelve un resultado por operación, en el mismo orden.
+    """
+    resultados = [None] * len(operaciones)
+
+    # 1. Validación de cada operación (sin consultas). Se reutiliza un único
+    # serializer: crear uno por operación copia todos sus campos cada vez.
+    validador = CitaLoteSerializer()
+    validas = []
+    for indice, datos in enumerate(operaciones):
+        try:
+            validas.append((indice, validador.run_validation(datos)))
+        except ValidationError as e:
+            resultados[indice] = _resultado(indice, status.HTTP_400_BAD_REQUEST, error=e.detail)
+
+    creaciones = [d for _, d in validas if d["operacion"] == "crear"]
+    ids_cita = {d["id_cita"] for _, d in validas if d["operacion"] != "crear"}
+
+    with transaction.atomic():
+        # 2. Entidades referenciadas: una consulta por tabla
+        # (el paciente se lee con la cita para la notificación; solo se bloquea la cita)
+        citas = Cita.objects.select_for_update(of=("self",)).select_related("id_paciente").in_bulk(ids_cita)
+        pacientes = dict(  # id_paciente -> email
+            Paciente.objects.filter(pk__in={d["id_paciente_id"] for d in creaciones}).values_list("pk", "email")
+        )
+        medicos = dict(
+            Medico.objects.filter(pk__in={d["id_medico_id"] for d in creaciones}).values_list("pk", "especialidad")
+        )
+
+        # 3. Ocupación actual de los médicos y fechas afectados (una consulta)
+        ids_medico = set(medicos) | {c.id_medico_id for c in citas.values()}
+        fechas = {d["fecha"] for _, d in validas if d.get("fecha")} | {c.fecha for c in citas.values()}
+        ocupados = set()  # Horarios exactos (id_medico, fecha, hora) con cita activa
+        horas = Counter()  # Citas activas por (id_medico, fecha, hora del día)
+        activas = (
+            Cita.objects.filter(id_medico__in=ids_medico, fecha__in=fechas)
+            .exclude(estado__in=ESTADOS_LIBRES)
+            .values_list("id_medico", "fecha", "hora")
+        )
+        for id_medico, fecha, hora in activas:
+            ocupados.add((id_medico, fecha, hora))
+            horas[(id_medico, fecha, hora.hour)] += 1
+
+        def liberar(cita):
+            ocupados.discard((cita.id_medico_id, cita.fecha, cita.hora))
+            horas[(cita.id_medico_id, cita.fecha, cita.hora.hour)] -= 1
+
+        def ocupar(id_medico, fecha, hora):
+            ocupados.add((id_medico, fecha, hora))
+            horas[(id_medico, fecha, hora.hour)] += 1
+
+        # 4. Aplicación en memoria, en el orden del lote
+        nuevas = []
+        modificadas = {}
+        reprogramadas = set()
+        notificaciones = []
+        for indice, datos in validas:
+            operacion = datos["operacion"]
+
+            if operacion == "crear":
+                id_medico, fecha, hora = datos["id_medico_id"], datos["fecha"], datos["hora"]
+                if datos["id_paciente_id"] not in pacientes:
+                    resultados[indice] = _resultado(indice, status.HTTP_404_NOT_FOUND, error="El paciente no existe.")
+                    continue
+                if id_medico not in medicos:
+                    resultados[indice] = _resultado(indice, status.HTTP_404_NOT_FOUND, error="El médico no existe.")
+                    continue
+                activa = datos["estado"] not in ESTADOS_LIBRES
+                if activa and (id_medico, fecha, hora) in ocupados:
+                    resultados[indice] = _resultado(
+                        indice, status.HTTP_409_CONFLICT, error="Ya existe una cita en este horario."
+                    )
+                    continue
+                if activa:
+                    ocupar(id_medico, fecha, hora)
+                nuevas.append((indice, Cita(
+                    id_paciente_id=datos["id_paciente_id"],
+                    id_medico_id=id_medico,
+                    fecha=fecha,
+                    hora=hora,
+                    especialidad=datos.get("especialidad") or medicos[id_medico],
+                    estado=datos["estado"],
+                )))
+                continue
+
+            cita = citas.get(datos["id_cita"])
+            if cita is None:
+                resultados[indice] = _resultado(indice, status.HTTP_404_NOT_FOUND, error="Cita no encontrada.")
+                continue
+            if cita.estado in ESTADOS_LIBRES:
+                resultados[indice] = _resultado(
+                    indice, status.HTTP_400_BAD_REQUEST, id_cita=cita.id_cita, error="La cita está cancelada."
+                )
+                continue
+
+            if operacion == "cancelar":
+                liberar(cita)
+                cita.estado = "cancelada"
+                notificaciones.append(nueva_notificacion(cita, "cancelacion"))
+            else:  # reprogramar
+                nuevo = (cita.id_medico_id, datos["fecha"], datos["hora"])
+                if nuevo == (cita.id_medico_id, cita.fecha, cita.hora):
+                    resultados[indice] = _resultado(
+                        indice, status.HTTP_400_BAD_REQUEST, id_cita=cita.id_cita,
+                        error="El nuevo horario es el mismo que el actual.",
+                    )
+                    continue
+                if nuevo in ocupados:
+                    resultados[indice] = _resultado(
+                        indice, status.HTTP_409_CONFLICT, id_cita=cita.id_cita, error="El nuevo horario ya está ocupado."
+                    )
+                    continue
+                liberar(cita)
+                cita.fecha, cita.hora = datos["fecha"], datos["hora"]
+                ocupar(*nuevo)
+                reprogramadas.add(cita.id_cita)
+                notificaciones.append(nueva_notificacion(cita, "reprogramacion"))
+            modificadas[cita.id_cita] = cita
+            resultados[indice] = _resultado(indice, status.HTTP_200_OK, id_cita=cita.id_cita)
+
+        # 5. Escritura en bloque. Primero las citas modificadas: sus horarios
+        # anteriores quedan libres para las citas nuevas del lote. Las
+        # reprogramadas se marcan antes como canceladas (fuera del índice
+        # único): un solo UPDATE no puede mover una cita al horario que deja
+        # otra del mismo UPDATE si la fila que lo ocupa aún no se ha actualizado
+        if reprogramadas:
+            Cita.objects.filter(pk__in=reprogramadas).update(estado="cancelada")
+        Cita.objects.bulk_update(list(modificadas.values()), ["fecha", "hora", "estado"], batch_size=500)
+        # bulk_create no llama a Cita.save(): las referencias se piden juntas
+        for (_, cita), refcita in zip(nuevas, generar_refcitas(len(nuevas))):
+            cita.refcita = refcita
+        Cita.objects.bulk_create([cita for _, cita in nuevas], batch_size=500)
+        for indice, cita in nuevas:
+            resultados[indice] = _resultado(indice, status.HTTP_201_CREATED, id_cita=cita.id_cita, refcita=cita.refcita)
+            if cita.estado not in ESTADOS_LIBRES:
+                notificaciones.append(nueva_notificacion(cita, "reserva", pacientes[cita.id_paciente_id]))
+        _actualizar_ocupacion(horas)
+        Notificaciones.objects.bulk_create(notificaciones, batch_size=500)
+
+    _contar(operaciones, resultados)
+    return resultados
+
+
+def _contar(operaciones, resultados):
+    # Métricas del lote (después del commit): una suma por tipo, no por operación
+    contadores = Counter(
+        (operaciones[r["indice"]]["operacion"], r["status"]) for r in resultados
+        if r["status"] in (status.HTTP_200_OK, status.HTTP_201_CREATED, status.HTTP_409_CONFLICT)
+    )
+    for (operacion, codigo), cantidad in contadores.items():
+        if codigo == status.HTTP_409_CONFLICT:
+            citas_conflictos.inc(cantidad, operacion="reserva" if operacion == "crear" else "reprogramacion")
+        elif operacion == "crear":
+            citas_reservadas.inc(cantidad, origen="lote")
+        elif operacion == "cancelar":
+            citas_canceladas.inc(cantidad, origen="lote")
+        else:
+            citas_reprogramadas.inc(cantidad, origen="lote")
+
+
+def _actualizar_ocupacion(horas):
+    # Recalcula la máscara de horas ocupadas de cada (médico, fecha) afectado
+    mascaras = Counter()
+    for (id_medico, fecha, hora), total in horas.items():
+        mascaras[(id_medico, fecha)] |= (1 << hora) if total > 0 else 0
+    if not mascaras:
+        return
+
+    existentes = {
+        (o.id_medico_id, o.fecha): o
+        for o in OcupacionMedico.objects.select_for_update().filter(
+            id_medico__in={m for m, _ in mascaras}, fecha__in={f for _, f in mascaras}
+        )
+    }
+    actualizadas, nuevas = [], []
+    for clave, mascara in mascaras.items():
+        if clave in existentes:
+            existentes[clave].ocupados = mascara
+            actualizadas.append(existentes[clave])
+        else:
+            nuevas.append(OcupacionMedico(id_medico_id=clave[0], fecha=clave[1], ocupados=mascara))
+    OcupacionMedico.objects.bulk_update(actualizadas, ["ocupados"], batch_size=500)
+    OcupacionMedico.objects.bulk_create(nuevas, batch_size=500)
@@ -1,6 +1,7 @@
-import uuid
-
 from django.db import models
+from django.utils import timezone
+
+from .referencias import generar_refcitas
 
 
 # Modelo para los pacientes
@@ -31,6 +32,11 @@ class Medico(models.Model):
         db_table = 'medico'
 
 
+# Genera la referencia (refcita) de una cita nueva (ver referencias.py)
+def generar_refcita():
+    return generar_refcitas(1)[0]
+
+
 # Modelo para las citas
 class Cita(models.Model):
     id_cita = models.AutoField(primary_key=True)  # Identificador único para cada cita
@@ -45,7 +51,7 @@ class Cita(models.Model):
     def save(self, *args, **kwargs):
         # Generar refcita si no existe
         if not self.refcita:
-            self.refcita = str(uuid.uuid4())[:12].replace('-', '').upper()
+            self.refcita = generar_refcita()
         super(Cita, self).save(*args, **kwargs)
 
     class Meta:
@@ -53,6 +59,58 @@ class Cita(models.Model):
         db_table = 'cita'
 
 
+# Plantilla de horario laboral de un médico por día de la semana
+class HorarioMedico(models.Model):
+    id_horario = models.AutoField(primary_key=True)  # Identificador único de la plantilla
+    id_medico = models.ForeignKey('Medico', models.DO_NOTHING, db_column='id_medico')  # Relación con un médico
+    dia_semana = models.SmallIntegerField()  # Día de la semana (0 = lunes ... 6 = domingo)
+    horas = models.IntegerField()  # Máscara de bits con las horas de trabajo (bit 9 = 09:00)
+
+    class Meta:
+        managed = False
+        db_table = 'horariomedico'
+        unique_together = (('id_medico', 'dia_semana'),)  # Clave única compuesta
+
+
+# Índice de horas ocupadas de un médico en una fecha
+class OcupacionMedico(models.Model):
+    id_ocupacion = models.AutoField(primary_key=True)  # Identificador único del registro
+    id_medico = models.ForeignKey('Medico', models.DO_NOTHING, db_column='id_medico')  # Relación con un médico
+    fecha = models.DateField()  # Fecha
+    ocupados = models.IntegerField(default=0)  # Máscara de bits con las horas ocupadas (bit 9 = 09:00)
+
+    class Meta:
+        managed = False
+        db_table = 'ocupacionmedico'
+        unique_together = (('id_medico', 'fecha'),)  # Clave única compuesta
+
+
+# Último TRUNCATE de cada tabla (lo anotan triggers; las demás escrituras van a Cambio)
+class VersionTabla(models.Model):
+    tabla = models.CharField(primary_key=True, max_length=50)  # Nombre de la tabla
+    modificado = models.DateTimeField()  # Fecha del último TRUNCATE
+    reiniciado = models.BigIntegerField(default=0)  # Transacción del último TRUNCATE (cambios anteriores perdidos)
+
+    class Meta:
+        managed = False
+        db_table = 'versiontabla'
+
+
+# Última transacción que insertó, modificó o borró cada fila (lo mantienen triggers)
+class Cambio(models.Model):
+    id_cambio = models.BigAutoField(primary_key=True)  # Clave primaria
+    tabla = models.CharField(max_length=50)  # Nombre de la tabla
+    id_registro = models.IntegerField()  # Clave primaria de la fila modificada
+    operacion = models.CharField(max_length=1)  # I (inserción), U (actualización) o D (borrado)
+    version = models.BigIntegerField()  # Transacción que hizo el cambio (pg_current_xact_id)
+    modificado = models.DateTimeField()  # Fecha del cambio
+
+    class Meta:
+        managed = False
+        db_table = 'cambio'
+        unique_together = (('tabla', 'id_registro'),)  # Un registro por fila
+
+
 # Modelo para los administradores del sistema
 class Administrador(models.Model):
     id_admin = models.AutoField(primary_key=True)  # Identificador único para cada administrador
@@ -203,10 +261,15 @@ class Historialmedico(models.Model):
 # Modelo para las notificaciones
 class Notificaciones(models.Model):
     id_notificacion = models.AutoField(primary_key=True)  # Identificador único de la notificación
-    id_cita = models.ForeignKey(Cita, models.DO_NOTHING, db_column='id_cita')  # Relación con una cita
+    id_cita = models.ForeignKey(Cita, models.DO_NOTHING, db_column='id_cita', blank=True, null=True)  # Relación con una cita (NULL si se ha borrado)
     tipo = models.CharField(max_length=50)  # Tipo de notificación (ejemplo: recordatorio)
     mensaje = models.TextField()  # Mensaje de la notificación
-    fecha_envio = models.DateTimeField(blank=True, null=True)  # Fecha de envío (opcional)
+    destinatario = models.CharField(max_length=100, blank=True, default='')  # Correo del paciente
+    fecha_envio = models.DateTimeField(blank=True, null=True)  # Fecha de envío (NULL = pendiente)
+    intentos = models.SmallIntegerField(default=0)  # Intentos de envío fallidos
+    proximo_intento = models.DateTimeField(default=timezone.now)  # Fecha a partir de la que se (re)intenta el envío
+    error = models.TextField(blank=True, null=True)  # Último error de envío
+    clave = models.CharField(unique=True, max_length=100, blank=True, null=True)  # Clave de idempotencia (evita duplicados)
 
     class Meta:
         managed = False
@@ -0,0 +1,128 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+# Paginación por cursor (keyset) para el listado de citas
+class CitaCursorPagination(CursorPagination):
+    """
+    Paginación por cursor para el listado de citas.
+    En lugar de OFFSET, cada página continúa a partir del último valor
+    devuelto, por lo que el coste de pedir una página no crece con el
+    tamaño de la tabla `cita`.
+
+    El cursor guarda los valores de todos los campos de la ordenación (p. ej.
+    estado e id_cita) y la página siguiente empieza en las filas posteriores
+    a esa posición: (estado > v) OR (estado = v AND id_cita > id). El cursor
+    de DRF solo usa el primer campo y avanza con un desplazamiento limitado a
+    1000 filas, con lo que un valor repetido más veces no termina nunca.
+    Los NULL van al final en orden ascendente y al principio en descendente.
+    """
+    page_size = 10  # Registros por página (igual que en AgendarView.vue)
+    page_size_query_param = 'page_size'  # Permite al cliente ajustar el tamaño de página
+    max_page_size = 100  # Límite para evitar respuestas demasiado grandes
+    ordering = ('id_cita',)  # Orden por defecto (clave primaria, única y estable)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.claves = [
+            (orden.lstrip('-'), not orden.startswith('-'), self._admite_nulos(queryset.model, orden.lstrip('-')))
+            for orden in self.ordering
+        ]
+        self.cursor = self.decode_cursor(request)
+        atras, posicion = self.cursor or (False, None)
+
+        # Las páginas anteriores se leen en el orden inverso desde la posición
+        claves = [(campo, ascendente != atras, nulos) for campo, ascendente, nulos in self.claves]
+        queryset = queryset.order_by(*(self._expresion_orden(*clave) for clave in claves))
+        if posicion is not None:
+            queryset = queryset.filter(self._posteriores(claves, posicion))
+
+        resultados = list(queryset[:self.page_size + 1])
+        self.page = resultados[:self.page_size]
+        hay_mas = len(resultados) > self.page_size
+        if atras:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, hay_mas
+        else:
+            self.has_next, self.has_previous = hay_mas, posicion is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._enlace(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._enlace(True, self.page[0])
+
+    def decode_cursor(self, request):
+        """Devuelve (hacia atrás, [valores de la posición]) o None sin cursor."""
+        codificado = request.query_params.get(self.cursor_query_param)
+        if codificado is None:
+            return None
+        try:
+            atras, posicion = json.loads(base64.urlsafe_b64decode(codificado.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(posicion, list) or len(posicion) != len(self.claves):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(atras), posicion
+
+    def _enlace(self, atras, instancia):
+        posicion = [self._valor(instancia, campo) for campo, _, _ in self.claves]
+        codificado = base64.urlsafe_b64encode(json.dumps([atras, posicion]).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, codificado)
+
+    @staticmethod
+    def _valor(instancia, campo):
+        valor = instancia[campo] if isinstance(instancia, dict) else getattr(instancia, campo)
+        return valor if valor is None or isinstance(valor, (int, str)) else str(valor)  # Fechas en ISO
+
+    @staticmethod
+    def _admite_nulos(modelo, campo):
+        try:
+            return modelo._meta.get_field(campo).null
+        except FieldDoesNotExist:
+            return False  # Alias de la vista (paciente, medico): nombres NOT NULL
+
+    @staticmethod
+    def _expresion_orden(campo, ascendente, nulos):
+        if not nulos:
+            return F(campo).asc() if ascendente else F(campo).desc()
+        return F(campo).asc(nulls_last=True) if ascendente else F(campo).desc(nulls_first=True)
+
+    @staticmethod
+    def _posteriores(claves, posicion):
+        """Filas posteriores a `posicion` en el orden de `claves` (comparación lexicográfica)."""
+        condicion = Q(pk__in=[])
+        iguales = Q()
+        for (campo, ascendente, nulos), valor in zip(claves, posicion):
+            if valor is None:
+                # Detrás de los NULL solo hay filas en orden descendente (NULL primero)
+                siguiente = Q(pk__in=[]) if ascendente else Q(**{f'{campo}__isnull': False})
+                mismo = Q(**{f'{campo}__isnull': True})
+            else:
+                siguiente = Q(**{f'{campo}__{"gt" if ascendente else "lt"}': valor})
+                if nulos and ascendente:
+                    siguiente |= Q(**{f'{campo}__isnull': True})
+                mismo = Q(**{campo: valor})
+            condicion |= iguales & siguiente
+            iguales &= mismo
+        return condicion
@@ -6,8 +6,11 @@ Más información:
 https://docs.djangoproject.com/en/5.1/topics/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Ruta base del proyecto
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,11 +38,15 @@ INSTALLED_APPS = [
 
 # Middleware del proyecto
 MIDDLEWARE = [
+    'consultorio.instrumentacion.InstrumentacionMiddleware',  # Server-Timing (solo con INSTRUMENTACION)
     'django.middleware.security.SecurityMiddleware',
+    'consultorio.replicas.ReplicasMiddleware',  # Lecturas a las réplicas (solo si hay DB_REPLICAS)
+    'consultorio.compresion.CompresionMiddleware',  # Compresión gzip/brotli de las respuestas grandes
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'consultorio.perfilado.PerfiladoMiddleware',  # Perfilado con X-Perfilar (solo con PERFILADO_DIRECTORIO)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -83,18 +90,81 @@ TEMPLATES = [
 # Configuración para WSGI
 WSGI_APPLICATION = 'consultorio.wsgi.application'
 
-# Configuración de la base de datos
+# Configuración para ASGI (p. ej. uvicorn consultorio.asgi:application)
+ASGI_APPLICATION = 'consultorio.asgi.application'
+
+# Modo asíncrono: las lecturas de disponibilidad y de citas usan vistas async
+# con el ORM asíncrono (asincrono.py). Solo tiene sentido con un servidor ASGI.
+CONSULTORIO_ASINCRONO = os.environ.get('CONSULTORIO_ASINCRONO', '0') == '1'
+
+# Configuración de la base de datos (variables de entorno; por defecto, la de desarrollo)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',  # Motor de base de datos PostgreSQL
-        'NAME': 'consultorio',  # Nombre de la base de datos
-        'USER': 'postgres',  # Usuario de la base de datos
-        'PASSWORD': '1234',  # Contraseña del usuario
-        'HOST': 'localhost',  # Dirección del servidor
-        'PORT': '5432',  # Puerto del servidor
+        'NAME': os.environ.get('DB_NAME', 'consultorio'),  # Nombre de la base de datos
+        'USER': os.environ.get('DB_USER', 'postgres'),  # Usuario de la base de datos
+        'PASSWORD': os.environ.get('DB_PASSWORD', '1234'),  # Contraseña del usuario
+        'HOST': os.environ.get('DB_HOST', 'localhost'),  # Dirección del servidor
+        'PORT': os.environ.get('DB_PORT', '5432'),  # Puerto del servidor
+        'CONN_HEALTH_CHECKS': True,  # Comprueba la conexión reutilizada antes de cada petición
+        # Pruebas (manage.py test): base de datos creada con consultorio.sql que se copia como plantilla
+        'TEST': {'TEMPLATE': os.environ.get('DB_TEST_TEMPLATE')},
+        'OPTIONS': {},
     }
 }
 
+# Reutilización de conexiones (DB_POOL):
+# - persistente: cada hilo conserva su conexión DB_CONN_MAX_AGE segundos (WSGI).
+# - psycopg: grupo de conexiones de psycopg 3 por proceso (ASGI; paquete psycopg[pool]).
+# - pgbouncer: conexiones persistentes a PgBouncer en modo transacción.
+# - ninguno: una conexión nueva por petición.
+DB_POOL = os.environ.get('DB_POOL', 'psycopg' if CONSULTORIO_ASINCRONO else 'persistente')
+# Límite por consulta en milisegundos (0 = sin límite, por defecto). Se aplica a
+# todas las conexiones del proceso: las migraciones y cargar_datos lo desactivan.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+
+if DB_POOL == 'psycopg':
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),  # Espera máxima por una conexión libre
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+    }
+elif DB_POOL in ('persistente', 'pgbouncer'):
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+elif DB_POOL != 'ninguno':
+    raise ImproperlyConfigured(f"DB_POOL debe ser persistente, psycopg, pgbouncer o ninguno (no '{DB_POOL}').")
+
+if DB_POOL == 'pgbouncer':
+    # En modo transacción cada transacción puede ir a otra conexión del servidor:
+    # sin cursores con nombre ni sentencias preparadas. PgBouncer no admite el
+    # parámetro 'options', así que statement_timeout se define en el rol
+    # (ALTER ROLE ... SET statement_timeout = ...).
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+elif DB_STATEMENT_TIMEOUT:
+    # Límite por consulta: una consulta bloqueada no retiene la conexión indefinidamente
+    DATABASES['default']['OPTIONS']['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+
+# Réplicas de lectura (DB_REPLICAS=servidor[:puerto],...) con las credenciales de la principal.
+# Las lecturas van a una réplica con menos de DB_REPLICAS_RETRASO_MAXIMO segundos de retraso
+# (replicas.py); las escrituras y las lecturas que las siguen, a la principal.
+REPLICAS = []
+for numero, servidor in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    host, _, port = servidor.strip().partition(':')
+    REPLICAS.append(f'replica{numero}')
+    DATABASES[f'replica{numero}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        # Una réplica caída se descarta enseguida en lugar de bloquear la petición
+        'OPTIONS': {**DATABASES['default']['OPTIONS'], 'connect_timeout': 2},
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICAS_RETRASO_MAXIMO = float(os.environ.get('DB_REPLICAS_RETRASO_MAXIMO', 5))  # Segundos
+REPLICAS_COMPROBACION = float(os.environ.get('DB_REPLICAS_COMPROBACION', 2))  # Segundos entre comprobaciones
+DATABASE_ROUTERS = ['consultorio.replicas.RouterReplicas'] if REPLICAS else []
+
 # Validadores de contraseñas
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -120,6 +190,92 @@ USE_TZ = True  # Activar soporte para zonas horarias
 # Configuración de archivos estáticos
 STATIC_URL = 'static/'  # URL base para los archivos estáticos
 
+# Horario laboral por defecto de los médicos sin plantilla propia (tabla horariomedico)
+HORARIO_LABORAL = ["09:00:00", "10:00:00", "11:00:00", "13:00:00", "14:00:00", "15:00:00"]
+
+# Días que se recorren como máximo al buscar el primer hueco libre (cita automática)
+HUECOS_MAX_DIAS = 180
+
+# Carpeta con los ficheros JSON de desarrollo (comando cargar_datos)
+DATOS_DESARROLLO_DIR = BASE_DIR / 'ficheros_desarrollo'
+
+# Caché (catálogo de médicos). LocMemCache expulsa las entradas menos usadas (LRU)
+# al llegar a MAX_ENTRIES; con varios procesos se comparte en Redis (REDIS_URL).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'TIMEOUT': 300,
+    }
+
+# Segundos que se guarda en caché el catálogo de médicos
+CATALOGO_TTL = 300
+
+# Tamaño mínimo (bytes) de una respuesta para comprimirla
+COMPRESION_TAMANO_MINIMO = 1024
+
+# Medición por petición: cabecera Server-Timing y registro de peticiones lentas
+INSTRUMENTACION = os.environ.get('CONSULTORIO_INSTRUMENTACION', '0') == '1'
+INSTRUMENTACION_UMBRAL_MS = int(os.environ.get('CONSULTORIO_UMBRAL_LENTAS_MS', 500))
+
+# Las peticiones lentas se escriben en la consola como una línea JSON
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'consultorio.lentas': {'handlers': ['consola'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Perfilado a demanda de peticiones con la cabecera X-Perfilar (perfilado.py):
+# ficheros .prof (cProfile) o .txt (pilas por muestreo) en este directorio
+PERFILADO_DIRECTORIO = os.environ.get('CONSULTORIO_PERFILADO_DIR') or None
+PERFILADO_VALIDEZ = 3600  # Segundos de validez de la firma (comando firmar_perfilado)
+
+# Métricas para Prometheus en /metrics (metricas.py), solo desde METRICAS_IPS.
+# Detrás de un proxy inverso todas las peticiones llegan desde la IP del proxy:
+# CONSULTORIO_METRICAS_TOKEN exige además "Authorization: Bearer <token>"
+# (authorization.credentials en la configuración de Prometheus).
+# Con varios procesos (gunicorn -w N), CONSULTORIO_METRICAS_DIR es el
+# directorio donde cada uno vuelca sus valores para que /metrics los sume
+# (se vacía al reiniciar el servicio).
+METRICAS = os.environ.get('CONSULTORIO_METRICAS', '1') == '1'
+METRICAS_IPS = [ip for ip in os.environ.get('CONSULTORIO_METRICAS_IPS', '127.0.0.1,::1').split(',') if ip]
+METRICAS_TOKEN = os.environ.get('CONSULTORIO_METRICAS_TOKEN') or None
+METRICAS_DIRECTORIO = os.environ.get('CONSULTORIO_METRICAS_DIR') or None
+METRICAS_INTERVALO = 1  # Segundos entre volcados al directorio
+
+# Notificaciones a pacientes (comando enviar_notificaciones)
+NOTIFICACIONES_TRANSPORTE = 'consultorio.notificaciones.TransporteCorreo'
+NOTIFICACIONES_LOTE = 100  # Notificaciones por lote
+NOTIFICACIONES_MAX_INTENTOS = 5
+NOTIFICACIONES_REINTENTO_BASE = 30  # Segundos de espera tras el primer fallo (se duplica en cada intento)
+NOTIFICACIONES_REINTENTO_MAX = 3600
+NOTIFICACIONES_RESERVA = 300  # Segundos que un lote queda apartado para el hilo que lo envía (más de lo que tarda un envío)
+
+# Correo: SMTP si se define EMAIL_HOST; si no, los mensajes se guardan en ficheros (desarrollo)
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'consultorio@localhost')
+if os.environ.get('EMAIL_HOST'):
+    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    EMAIL_HOST = os.environ['EMAIL_HOST']
+    EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+    EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+    EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+    EMAIL_USE_TLS = True
+else:
+    EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+    EMAIL_FILE_PATH = BASE_DIR / 'correo_enviado'
+
 # Tipo de campo de clave primaria predeterminado
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CitaViewSet, MedicoViewSet, PacienteViewSet, index_view
+from . import asincrono
+from .metricas import exponer_metricas
+from .views import CitaViewSet, MedicoViewSet, PacienteViewSet, index_view, obtener_cita
 
 router = DefaultRouter()
 router.register(r'paciente', PacienteViewSet, basename='paciente')
@@ -12,6 +15,10 @@ router.register(r'cita', CitaViewSet, basename='cita')
 # Aquí cargamos las URLs que vayamos a usar para las pruebas.
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', exponer_metricas, name='metricas'),  # Prometheus (METRICAS_IPS y METRICAS_TOKEN)
+    # Fuera del router: 'cita/obtener/' lo tomaría como el detalle de la cita 'obtener'
+    path('obtener_cita/', asincrono.obtener_cita if settings.CONSULTORIO_ASINCRONO else obtener_cita,
+         name='obtener_cita'),
     path('', include(router.urls)),
     path('', index_view, name='opciones'),  # Página principal con las opciones a elegir.
 ]
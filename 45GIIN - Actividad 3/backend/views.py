@@ -1,12 +1,39 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.shortcuts import render
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
 
+from .asignacion import reservar_primer_hueco
+from .busqueda import buscar_medicos, buscar_pacientes
+from .catalogo import ficha_medico, lista_medicos, respuesta_catalogo
+from .condicional import ListadoCondicionalMixin
+from .disponibilidad import (
+    ESTADOS_LIBRES,
+    HUECOS_MAX_DIAS,
+    es_conflicto_horario,
+    liberar_horario,
+    ocupar_horario,
+    proximos_huecos,
+)
+from .filters import CitaBusquedaFilter, CitaOrderingFilter
+from .lotes import CITAS_LOTE_MAX, procesar_lote
+from .metricas import citas_canceladas, citas_conflictos, citas_reprogramadas, citas_reservadas
 from .models import Cita, Medico, Paciente
-from .serializers import CitaSerializer, MedicoSerializer, PacienteSerializer
+from .notificaciones import encolar_notificacion, tipo_modificacion
+from .pagination import CitaCursorPagination
+from .serializers import (
+    CitaResumenSerializer,
+    CitaSerializer,
+    HuecosSerializer,
+    MedicoSerializer,
+    PacienteSerializer,
+    ReservaAutomaticaSerializer,
+)
+from .sincronizacion import PARAMETRO as PARAMETRO_SINCRONIZACION, SincronizacionMixin
 
 
 # Vista principal
@@ -39,9 +66,11 @@ def custom_exception_handler(exc, context):
 
 
 # CRUD Paciente
-class PacienteViewSet(viewsets.ModelViewSet):
+class PacienteViewSet(SincronizacionMixin, ListadoCondicionalMixin, viewsets.ModelViewSet):
     queryset = Paciente.objects.all().order_by("id_paciente")
     serializer_class = PacienteSerializer
+    # ETag del listado (304 si no hay cambios) y versión de ?since= (solo los cambios)
+    tablas_version = ("paciente",)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -63,11 +92,34 @@ class PacienteViewSet(viewsets.ModelViewSet):
             {"Mensaje": "Paciente eliminado exitosamente."}, status=status.HTTP_200_OK
         )
 
+    # GET /paciente/buscar/?q=...&limite=10: autocompletado (DNI, nombre,
+    # apellido, email o teléfono) sin descargar el listado completo
+    @action(detail=False, methods=["get"], url_path="buscar")
+    def buscar(self, request):
+        return Response(buscar_pacientes(request.query_params.get("q"), request.query_params.get("limite")))
+
 
 # CRUD Medico
-class MedicoViewSet(viewsets.ModelViewSet):
+class MedicoViewSet(SincronizacionMixin, viewsets.ModelViewSet):
     queryset = Medico.objects.all().order_by("id_medico")
     serializer_class = MedicoSerializer
+    tablas_version = ("medico",)  # Versión de ?since= (solo los cambios)
+
+    # Lecturas desde la caché del catálogo, con ETag/Last-Modified (304 si no hay cambios)
+    def list(self, request, *args, **kwargs):
+        if PARAMETRO_SINCRONIZACION in request.query_params:
+            return self.sincronizar(request)
+        return respuesta_catalogo(
+            request, "medicos", lambda: Response(lista_medicos())
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        medico = ficha_medico(kwargs["pk"])
+        if medico is None:
+            raise NotFound("Medico no encontrado.")
+        return respuesta_catalogo(
+            request, f"medico-{kwargs['pk']}", lambda: Response(medico)
+        )
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -89,23 +141,103 @@ class MedicoViewSet(viewsets.ModelViewSet):
             {"Mensaje": "Medico eliminado exitosamente."}, status=status.HTTP_200_OK
         )
 
+    # GET /medico/buscar/?q=...&limite=10: por nombre, número de colegiado o especialidad
+    @action(detail=False, methods=["get"], url_path="buscar")
+    def buscar(self, request):
+        return Response(buscar_medicos(request.query_params.get("q"), request.query_params.get("limite")))
+
 
 # CRUD Cita
-class CitaViewSet(viewsets.ModelViewSet):
+class CitaViewSet(SincronizacionMixin, ListadoCondicionalMixin, viewsets.ModelViewSet):
     queryset = Cita.objects.all().order_by("id_cita")
     serializer_class = CitaSerializer
+    # El listado incluye los datos del paciente y del médico de cada cita:
+    # con ?since= se reenvían también las citas cuyo paciente o médico cambió
+    tablas_version = ("cita", "paciente", "medico")
+    relaciones_sincronizacion = {"paciente": "id_paciente", "medico": "id_medico"}
+    # Búsqueda, ordenación y paginación en el servidor
+    pagination_class = CitaCursorPagination
+    filter_backends = [CitaBusquedaFilter, CitaOrderingFilter]
+    ordering_fields = ["id_cita", "refcita", "paciente", "medico", "especialidad", "fecha", "estado"]
+
+    def get_serializer_class(self):
+        # ?vista=resumen devuelve solo los IDs y nombres de paciente/médico
+        if self.action == "list" and self.request.query_params.get("vista") == "resumen":
+            return CitaResumenSerializer
+        return CitaSerializer
+
+    def get_queryset(self):
+        # Paciente y médico se cargan con JOIN (evita 2 consultas por cita).
+        # Alias para ordenar por nombre de paciente/médico (la paginación
+        # por cursor no admite lookups con "__" en la ordenación)
+        queryset = self.get_serializer_class().optimizar_queryset(super().get_queryset())
+        return queryset.annotate(
+            paciente=F("id_paciente__nombre"),
+            medico=F("id_medico__nombre"),
+        )
+
+    # Cada escritura mantiene al día el índice de disponibilidad y deja la
+    # notificación al paciente en la misma transacción
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            cita = serializer.save()
+            ocupar_horario(cita)
+            encolar_notificacion(cita, "reserva")
+        citas_reservadas.inc(origen="individual")
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        anterior = (instance.fecha, instance.hora, instance.estado)
+        with transaction.atomic():
+            liberar_horario(instance)  # Horario anterior
+            cita = serializer.save()
+            ocupar_horario(cita)
+            tipo = tipo_modificacion(anterior, cita)
+            if tipo:
+                encolar_notificacion(cita, tipo)
+        if tipo == "reprogramacion":
+            citas_reprogramadas.inc(origen="individual")
+        elif tipo == "cancelacion":
+            citas_canceladas.inc(origen="individual")
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            liberar_horario(instance)
+            instance.delete()
+            if instance.estado not in ESTADOS_LIBRES:
+                encolar_notificacion(instance, "cancelacion")  # Sin cita (ya borrada)
+        if instance.estado not in ESTADOS_LIBRES:
+            citas_canceladas.inc(origen="individual")
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        try:
+            self.perform_create(serializer)
+        except IntegrityError as e:
+            if es_conflicto_horario(e):
+                citas_conflictos.inc(operacion="reserva")
+                return Response(
+                    {"error": "Ya existe una cita en este horario."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            raise
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        try:
+            self.perform_update(serializer)
+        except IntegrityError as e:
+            if es_conflicto_horario(e):
+                citas_conflictos.inc(operacion="reprogramacion")
+                return Response(
+                    {"error": "El nuevo horario ya está ocupado."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            raise
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
@@ -115,13 +247,74 @@ class CitaViewSet(viewsets.ModelViewSet):
             {"Mensaje": "Cita eliminada exitosamente."}, status=status.HTTP_200_OK
         )
 
+    # POST /cita/lote/: crea, cancela o reprograma muchas citas en una petición.
+    # Acepta una lista de operaciones o {"operaciones": [...]} y devuelve un
+    # resultado por operación (207 Multi-Status).
+    @action(detail=False, methods=["post"], url_path="lote")
+    def lote(self, request):
+        operaciones = request.data
+        if isinstance(operaciones, dict):
+            operaciones = operaciones.get("operaciones")
+        if not isinstance(operaciones, list):
+            return Response(
+                {"error": "Debe enviar una lista de operaciones."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(operaciones) > CITAS_LOTE_MAX:
+            return Response(
+                {"error": f"El lote no puede superar {CITAS_LOTE_MAX} operaciones."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            resultados = procesar_lote(operaciones)
+        except IntegrityError as e:
+            # Otra petición ocupó uno de los horarios mientras se aplicaba el lote
+            if es_conflicto_horario(e):
+                citas_conflictos.inc(operacion="lote")
+                return Response(
+                    {"error": "Conflicto de horario con otra petición. Reintente el lote."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            raise
+        return Response({"resultados": resultados}, status=status.HTTP_207_MULTI_STATUS)
+
+    # Cita automática.
+    # GET /cita/huecos/?especialidad=...: los primeros huecos libres entre los
+    # médicos de la especialidad (opcionales: id_medico, desde, hora_desde,
+    # hora_hasta y cantidad).
+    # POST /cita/huecos/: reserva el primero para id_paciente con las mismas
+    # preferencias y devuelve la cita creada (409 si no queda ninguno).
+    @action(detail=False, methods=["get", "post"], url_path="huecos")
+    def huecos(self, request):
+        if request.method == "GET":
+            parametros = HuecosSerializer(data=request.query_params)
+            parametros.is_valid(raise_exception=True)
+            huecos = proximos_huecos(**parametros.validated_data)
+            return Response({
+                "huecos": [
+                    {"fecha": fecha.isoformat(), "hora": hora.strftime("%H:%M:%S"), "id_medico": id_medico}
+                    for fecha, hora, id_medico in huecos
+                ]
+            })
+
+        datos = ReservaAutomaticaSerializer(data=request.data)
+        datos.is_valid(raise_exception=True)
+        cita = reservar_primer_hueco(**datos.validated_data)
+        if cita is None:
+            return Response(
+                {"error": f"No hay huecos libres en los próximos {HUECOS_MAX_DIAS} días."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(CitaSerializer(cita).data, status=status.HTTP_201_CREATED)
+
 
 @api_view(["GET"])
 def obtener_cita(request):
     id_cita = request.query_params.get("id_cita", None)
     if id_cita:
         try:
-            cita = Cita.objects.get(id_cita=id_cita)
+            cita = CitaSerializer.optimizar_queryset(Cita.objects.all()).get(id_cita=id_cita)
             serializer = CitaSerializer(cita)
             return Response(serializer.data)
         except Cita.DoesNotExist:
@@ -0,0 +1,35 @@
+import axios from "axios";
+
+// Sincronización incremental de listados (?since=<versión>).
+// El servidor devuelve { version, completo, cambios, eliminados, siguiente }:
+// si `completo` es true, `cambios` es el listado entero y sustituye al local;
+// si no, solo contiene los registros creados o modificados desde la versión
+// enviada y `eliminados` los IDs de los borrados. `siguiente` es la URL de la
+// página siguiente (null en la última).
+export function aplicarCambios(lista, respuesta, clave) {
+  if (respuesta.completo) return respuesta.cambios;
+
+  const eliminados = new Set(respuesta.eliminados);
+  const cambios = new Map(respuesta.cambios.map((registro) => [registro[clave], registro]));
+  const resultado = [];
+  for (const registro of lista) {
+    if (eliminados.has(registro[clave])) continue;
+    resultado.push(cambios.get(registro[clave]) ?? registro); // Versión actualizada si ha cambiado
+    cambios.delete(registro[clave]);
+  }
+  return resultado.concat([...cambios.values()]); // Registros nuevos
+}
+
+// Pide los cambios desde `version` (0 = listado completo) y devuelve { lista, version }
+export async function sincronizar(url, lista, version, clave) {
+  let { data } = await axios.get(url, { params: { since: version } });
+  const respuesta = { ...data, cambios: [...data.cambios], eliminados: [...data.eliminados] };
+  // Se conserva la versión de la primera página: lo que cambie mientras se
+  // piden las demás llega en la próxima sincronización
+  while (data.siguiente) {
+    ({ data } = await axios.get(data.siguiente));
+    respuesta.cambios.push(...data.cambios);
+    respuesta.eliminados.push(...data.eliminados);
+  }
+  return { lista: aplicarCambios(lista, respuesta, clave), version: respuesta.version };
+}
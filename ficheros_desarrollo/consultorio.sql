@@ -33,6 +33,12 @@ CREATE TABLE Cita (
     FOREIGN KEY (id_medico) REFERENCES Medico(id_medico) ON DELETE CASCADE
 );
 
+-- Un medico no puede tener dos citas activas (no canceladas) en la misma fecha y hora
+CREATE UNIQUE INDEX cita_medico_horario_unico ON Cita (id_medico, fecha, hora) WHERE estado <> 'cancelada';
+
+-- Numeros de las referencias de cita (refcita, esquema de Actividad 3; migracion 0007)
+CREATE SEQUENCE cita_refcita_seq;
+
 -- Crear la tabla HistorialMedico
 CREATE TABLE HistorialMedico (
     id_historial_medico SERIAL PRIMARY KEY,
@@ -52,11 +58,16 @@ CREATE TABLE Administrador (
 -- Crear la tabla Notificaciones
 CREATE TABLE Notificaciones (
     id_notificacion SERIAL PRIMARY KEY,
-    id_cita INT NOT NULL,
+    id_cita INT, -- NULL si la cita se ha borrado (cancelacion)
     tipo VARCHAR(50) NOT NULL,
     mensaje TEXT NOT NULL,
-    fecha_envio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (id_cita) REFERENCES Cita(id_cita) ON DELETE CASCADE
+    destinatario VARCHAR(100) NOT NULL DEFAULT '',
+    fecha_envio TIMESTAMP, -- NULL = pendiente de enviar (comando enviar_notificaciones)
+    intentos SMALLINT NOT NULL DEFAULT 0,
+    proximo_intento TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    error TEXT, -- Ultimo error de envio
+    clave VARCHAR(100), -- Clave de idempotencia (indice unico en indices.sql)
+    FOREIGN KEY (id_cita) REFERENCES Cita(id_cita) ON DELETE SET NULL
 );
 
 -- Crear la tabla Roles
@@ -72,4 +83,107 @@ CREATE TABLE UsuarioRol (
     PRIMARY KEY (id_usuario, id_rol),
     FOREIGN KEY (id_usuario) REFERENCES Administrador(id_admin) ON DELETE CASCADE,
     FOREIGN KEY (id_rol) REFERENCES Roles(id_rol) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Crear la tabla HorarioMedico (horas de trabajo de cada medico por dia de la semana, bit 9 = 09:00)
+CREATE TABLE HorarioMedico (
+    id_horario SERIAL PRIMARY KEY,
+    id_medico INT NOT NULL,
+    dia_semana SMALLINT NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),
+    horas INT NOT NULL,
+    UNIQUE (id_medico, dia_semana),
+    FOREIGN KEY (id_medico) REFERENCES Medico(id_medico) ON DELETE CASCADE
+);
+
+-- Crear la tabla OcupacionMedico (horas ocupadas de cada medico por fecha, bit 9 = 09:00)
+CREATE TABLE OcupacionMedico (
+    id_ocupacion SERIAL PRIMARY KEY,
+    id_medico INT NOT NULL,
+    fecha DATE NOT NULL,
+    ocupados INT NOT NULL DEFAULT 0,
+    UNIQUE (id_medico, fecha),
+    FOREIGN KEY (id_medico) REFERENCES Medico(id_medico) ON DELETE CASCADE
+);
+
+-- Rellenar OcupacionMedico a partir de las citas existentes
+INSERT INTO OcupacionMedico (id_medico, fecha, ocupados)
+SELECT id_medico, fecha, BIT_OR(1 << EXTRACT(HOUR FROM hora)::INT)
+FROM Cita
+WHERE estado <> 'cancelada'
+GROUP BY id_medico, fecha;
+
+-- Crear la tabla VersionTabla (ultimo TRUNCATE de cada tabla; con Cambio, ETag de los listados)
+CREATE TABLE VersionTabla (
+    tabla VARCHAR(50) PRIMARY KEY,
+    modificado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reiniciado BIGINT NOT NULL DEFAULT 0 -- Transaccion del ultimo TRUNCATE
+);
+
+INSERT INTO VersionTabla (tabla) VALUES ('paciente'), ('medico'), ('cita');
+
+-- Crear la tabla Cambio (ultima transaccion que inserto, modifico o borro cada fila;
+-- permite devolver solo los cambios desde una version: ?since=)
+CREATE TABLE Cambio (
+    id_cambio BIGSERIAL PRIMARY KEY,
+    tabla VARCHAR(50) NOT NULL,
+    id_registro INTEGER NOT NULL,
+    operacion CHAR(1) NOT NULL, -- I (insercion), U (actualizacion), D (borrado)
+    version BIGINT NOT NULL, -- pg_current_xact_id() de la transaccion
+    modificado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (tabla, id_registro)
+);
+
+CREATE INDEX idx_cambio_tabla_version ON Cambio (tabla, version);
+
+-- Cada sentencia que modifica una tabla anota en Cambio las filas afectadas (tablas de
+-- transicion) con el ID de su transaccion, sin bloquear ninguna fila compartida. Los IDs
+-- no se confirman en orden: los lectores usan el horizonte pg_snapshot_xmin (condicional.py).
+-- TG_ARGV[0] es la columna de clave primaria de la tabla. Requiere PostgreSQL 13.
+CREATE OR REPLACE FUNCTION registrar_cambios() RETURNS TRIGGER AS $$
+DECLARE
+    transaccion BIGINT := pg_current_xact_id()::text::bigint;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        -- Los cambios anteriores se pierden: los clientes deben recargar el listado completo
+        UPDATE VersionTabla SET reiniciado = transaccion, modificado = CURRENT_TIMESTAMP
+        WHERE tabla = TG_TABLE_NAME;
+        DELETE FROM Cambio WHERE tabla = TG_TABLE_NAME;
+    ELSE
+        EXECUTE format(
+            'INSERT INTO Cambio (tabla, id_registro, operacion, version, modificado) '
+            'SELECT $1, %I, $2, $3, CURRENT_TIMESTAMP FROM %I '
+            'ON CONFLICT (tabla, id_registro) DO UPDATE '
+            'SET operacion = EXCLUDED.operacion, version = EXCLUDED.version, modificado = EXCLUDED.modificado',
+            TG_ARGV[0], CASE WHEN TG_OP = 'DELETE' THEN 'viejas' ELSE 'nuevas' END
+        ) USING TG_TABLE_NAME, left(TG_OP, 1), transaccion;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER paciente_insercion AFTER INSERT ON Paciente REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_paciente');
+CREATE TRIGGER paciente_actualizacion AFTER UPDATE ON Paciente REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_paciente');
+CREATE TRIGGER paciente_borrado AFTER DELETE ON Paciente REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_paciente');
+CREATE TRIGGER paciente_reinicio AFTER TRUNCATE ON Paciente
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios();
+
+CREATE TRIGGER medico_insercion AFTER INSERT ON Medico REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_medico');
+CREATE TRIGGER medico_actualizacion AFTER UPDATE ON Medico REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_medico');
+CREATE TRIGGER medico_borrado AFTER DELETE ON Medico REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_medico');
+CREATE TRIGGER medico_reinicio AFTER TRUNCATE ON Medico
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios();
+
+CREATE TRIGGER cita_insercion AFTER INSERT ON Cita REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_cita');
+CREATE TRIGGER cita_actualizacion AFTER UPDATE ON Cita REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_cita');
+CREATE TRIGGER cita_borrado AFTER DELETE ON Cita REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('id_cita');
+CREATE TRIGGER cita_reinicio AFTER TRUNCATE ON Cita
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios();
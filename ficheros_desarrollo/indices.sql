@@ -0,0 +1,78 @@
+-- Índices de las consultas frecuentes (mismo contenido que las migraciones
+-- 0001_indices_busqueda, 0002_indices_consultas, 0005_notificaciones_pendientes,
+-- 0006_recordatorios y 0008_indices_autocompletado de la aplicación consultorio:
+-- python manage.py migrate consultorio). El índice único cita_medico_horario_unico
+-- (0010_cita_horario_unico) se crea en consultorio.sql con la tabla cita.
+-- Comprobación: python manage.py comprobar_indices
+\c consultorio;
+
+-- Extensión para búsquedas por subcadena (icontains) sobre nombres
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Ordenación y búsqueda por fecha y estado (id_cita como desempate del cursor)
+CREATE INDEX IF NOT EXISTS idx_cita_fecha_id ON cita (fecha, id_cita);
+CREATE INDEX IF NOT EXISTS idx_cita_estado_id ON cita (estado, id_cita);
+CREATE INDEX IF NOT EXISTS idx_cita_especialidad_id ON cita (especialidad, id_cita);
+CREATE INDEX IF NOT EXISTS idx_cita_especialidad_trgm ON cita USING gin (UPPER(especialidad) gin_trgm_ops);
+
+-- refcita ya dispone del índice de su restricción UNIQUE (búsqueda por prefijo, solo
+-- Actividad 3: con el esquema de consultorio.sql la columna no existe y se omite)
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'cita' AND column_name = 'refcita'
+    ) THEN
+        CREATE INDEX IF NOT EXISTS idx_cita_refcita_prefijo ON cita (refcita varchar_pattern_ops);
+    END IF;
+END
+$$;
+
+-- Búsqueda por nombre de paciente y médico (Django genera UPPER(...) LIKE UPPER('%valor%'))
+CREATE INDEX IF NOT EXISTS idx_paciente_nombre_trgm ON paciente USING gin (UPPER(nombre) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_paciente_apellido_trgm ON paciente USING gin (UPPER(apellido) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_medico_nombre_trgm ON medico USING gin (UPPER(nombre) gin_trgm_ops);
+
+-- Citas de un paciente o de un médico (también cubren los JOIN por clave foránea)
+CREATE INDEX IF NOT EXISTS idx_cita_paciente_fecha_hora ON cita (id_paciente, fecha, hora);
+CREATE INDEX IF NOT EXISTS idx_cita_medico_fecha_hora ON cita (id_medico, fecha, hora);
+
+-- Citas de un día en un estado (recordatorios de las citas confirmadas)
+CREATE INDEX IF NOT EXISTS idx_cita_fecha_estado ON cita (fecha, estado);
+
+-- Citas activas de un día (solo las no canceladas)
+CREATE INDEX IF NOT EXISTS idx_cita_activa_fecha_hora ON cita (fecha, hora) WHERE estado <> 'cancelada';
+
+-- Médicos por especialidad sin distinguir mayúsculas (especialidad__iexact)
+CREATE INDEX IF NOT EXISTS idx_medico_especialidad ON medico (UPPER(especialidad), id_medico);
+
+-- Notificaciones pendientes de enviar, por fecha del próximo intento
+CREATE INDEX IF NOT EXISTS idx_notificaciones_pendientes ON notificaciones (proximo_intento) WHERE fecha_envio IS NULL;
+
+-- Clave de idempotencia de las notificaciones (recordatorios sin duplicados)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notificaciones_clave ON notificaciones (clave);
+
+-- Autocompletado de pacientes y médicos: identificadores por prefijo (LIKE 'valor%';
+-- dni y ncolegiado solo en Actividad 3: con el esquema de consultorio.sql se omiten)
+CREATE INDEX IF NOT EXISTS idx_paciente_telefono_prefijo ON paciente (telefono varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_paciente_email_prefijo ON paciente (UPPER(email) text_pattern_ops);
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'paciente' AND column_name = 'dni'
+    ) THEN
+        CREATE INDEX IF NOT EXISTS idx_paciente_dni_prefijo ON paciente (dni varchar_pattern_ops);
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'medico' AND column_name = 'ncolegiado'
+    ) THEN
+        CREATE INDEX IF NOT EXISTS idx_medico_ncolegiado_prefijo ON medico (ncolegiado varchar_pattern_ops);
+    END IF;
+END
+$$;
+
+-- Autocompletado por nombre aproximado (%> y <<->): GiST para que el orden por similitud use el índice
+CREATE INDEX IF NOT EXISTS idx_paciente_nombre_completo_trgm ON paciente USING gist ((UPPER(nombre || ' ' || apellido)) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_medico_busqueda_trgm ON medico USING gist ((UPPER(nombre || ' ' || especialidad)) gist_trgm_ops);
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ConsultorioConfig(AppConfig):
+    name = 'consultorio'
+
+    def ready(self):
+        # Señales de invalidación de la caché del catálogo de médicos
+        from . import catalogo  # noqa: F401
@@ -0,0 +1,45 @@
+from django.db import IntegrityError, transaction
+
+from .catalogo import ficha_medico
+from .disponibilidad import es_conflicto_horario, ocupar_horario, proximos_huecos
+from .metricas import citas_conflictos, citas_reservadas
+from .models import Cita
+from .notificaciones import encolar_notificacion
+
+# Cita automática: reserva el primer hueco libre de una especialidad.
+#
+# Los huecos se buscan con proximos_huecos (una lectura de plantillas y otra
+# de la ocupación) y se prueban en orden. Cada intento guarda la cita, marca
+# el horario y encola la notificación en su propia transacción; si otra
+# petición ocupó el hueco entre la búsqueda y el INSERT, el índice único
+# cita_medico_horario_unico lo rechaza y se prueba el siguiente.
+
+INTENTOS = 5  # Huecos que se prueban antes de dar la reserva por fallida
+
+
+def reservar_primer_hueco(id_paciente, especialidad, id_medico=None, desde=None,
+                          hora_desde=None, hora_hasta=None, estado='confirmada'):
+    """
+    Reserva para `id_paciente` (paciente o su id) el primer hueco libre según
+    proximos_huecos. Devuelve la cita creada o None si no hay huecos.
+    """
+    huecos = proximos_huecos(especialidad, desde, id_medico, INTENTOS, hora_desde, hora_hasta)
+    for fecha, hora, medico in huecos:
+        ficha = ficha_medico(medico)
+        cita = Cita(
+            id_paciente_id=getattr(id_paciente, 'pk', id_paciente), id_medico_id=medico, fecha=fecha, hora=hora,
+            especialidad=ficha['especialidad'] if ficha else especialidad, estado=estado,
+        )
+        try:
+            with transaction.atomic():
+                cita.save()
+                ocupar_horario(cita)
+                encolar_notificacion(cita, 'reserva')
+        except IntegrityError as e:
+            if not es_conflicto_horario(e):
+                raise
+            citas_conflictos.inc(operacion='automatica')
+            continue
+        citas_reservadas.inc(origen='automatica')
+        return cita
+    return None
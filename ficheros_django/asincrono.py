@@ -0,0 +1,150 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from .disponibilidad import (DISPONIBILIDAD_MAX_DIAS, ahorarios_disponibles,
+                             ahorarios_disponibles_rango, mascara_a_horas)
+from .models import Cita
+from .serializers import CitaResumenSerializer, CitaSerializer
+
+# Vistas asíncronas (ASGI) de los endpoints de lectura.
+#
+# Con CONSULTORIO_ASINCRONO=1 las URLs usan estas vistas en lugar de las de
+# DRF (que no admite vistas asíncronas): las consultas se hacen con el ORM
+# asíncrono, así que un proceso de uvicorn atiende muchas lecturas a la vez
+# sin un hilo por petición. Las respuestas son las mismas que las de las
+# vistas síncronas (mismos parámetros, mensajes y códigos de estado).
+
+
+def _respuesta(datos, estado=status.HTTP_200_OK):
+    # Mismo formato JSON que el JSONRenderer de DRF
+    return JsonResponse(
+        datos, status=estado, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def _error(mensaje, estado):
+    return _respuesta({"error": mensaje}, estado)
+
+
+def _parse_fecha(valor):
+    # Como parse_fecha de views.py (que no existe en la Actividad 3)
+    try:
+        return parse_date(valor) if valor else None
+    except ValueError:  # Formato correcto pero fecha inexistente
+        return None
+
+
+def lecturas_asincronas(lectura, vista):
+    """
+    Combina una vista asíncrona para GET con la vista síncrona `vista`
+    para el resto de métodos (PATCH, DELETE...), que se ejecuta en un hilo.
+    """
+    escritura = sync_to_async(vista)
+
+    @csrf_exempt  # Igual que las APIView de DRF
+    async def despachar(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await lectura(request, *args, **kwargs)
+        return await escritura(request, *args, **kwargs)
+    return despachar
+
+
+# Equivale a DisponibilidadHorariosView.get
+@require_GET
+async def disponibilidad_horarios(request):
+    especialidad = request.GET.get('especialidad')
+    fecha = request.GET.get('fecha')
+    id_medico = request.GET.get('id_medico')
+
+    if not especialidad:
+        return _error("El parámetro 'especialidad' es obligatorio.", status.HTTP_400_BAD_REQUEST)
+    if 'fecha_desde' in request.GET or 'fecha_hasta' in request.GET:
+        return await disponibilidad_rango(request, especialidad, id_medico)
+    if not fecha:
+        return _error("El parámetro 'fecha' es obligatorio.", status.HTTP_400_BAD_REQUEST)
+
+    fecha = _parse_fecha(fecha)
+    if not fecha:
+        return _error("El parámetro 'fecha' debe tener el formato YYYY-MM-DD.", status.HTTP_400_BAD_REQUEST)
+
+    try:
+        por_medico = await ahorarios_disponibles(especialidad, fecha, id_medico)
+        disponibles = sorted({h for horas in por_medico.values() for h in horas})
+        return _respuesta({"disponibles": disponibles, "medicos": por_medico})
+    except Exception as e:
+        return _error(f"Error al consultar disponibilidad: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def disponibilidad_rango(request, especialidad, id_medico):
+    fecha_desde = _parse_fecha(request.GET.get('fecha_desde'))
+    fecha_hasta = _parse_fecha(request.GET.get('fecha_hasta'))
+
+    if not fecha_desde or not fecha_hasta:
+        return _error("Los parámetros 'fecha_desde' y 'fecha_hasta' son obligatorios (YYYY-MM-DD).", status.HTTP_400_BAD_REQUEST)
+    if fecha_hasta < fecha_desde:
+        return _error("'fecha_hasta' no puede ser anterior a 'fecha_desde'.", status.HTTP_400_BAD_REQUEST)
+    if (fecha_hasta - fecha_desde).days + 1 > DISPONIBILIDAD_MAX_DIAS:
+        return _error(f"El rango no puede superar {DISPONIBILIDAD_MAX_DIAS} días.", status.HTTP_400_BAD_REQUEST)
+
+    try:
+        dias = await ahorarios_disponibles_rango(especialidad, fecha_desde, fecha_hasta, id_medico)
+        respuesta = {}
+        for fecha, por_medico in dias.items():
+            libres = 0
+            for mascara in por_medico.values():
+                libres |= mascara
+            respuesta[fecha.isoformat()] = {"disponibles": mascara_a_horas(libres), "medicos": por_medico}
+
+        return _respuesta({
+            "fecha_desde": fecha_desde.isoformat(),
+            "fecha_hasta": fecha_hasta.isoformat(),
+            "dias": respuesta,
+        })
+    except Exception as e:
+        return _error(f"Error al consultar disponibilidad: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Equivale a CancelarReprogramarCitaView.get
+async def consultar_citas(request):
+    id_cita = request.GET.get('id_cita')
+    id_paciente = request.GET.get('id_paciente')
+    id_medico = request.GET.get('id_medico')
+
+    if not (id_cita or id_paciente or id_medico):
+        return _error("Debe proporcionar al menos un parámetro (id_cita, id_paciente o id_medico).", status.HTTP_400_BAD_REQUEST)
+
+    serializer_class = CitaResumenSerializer if request.GET.get('vista') == 'resumen' else CitaSerializer
+
+    try:
+        citas = serializer_class.optimizar_queryset(Cita.objects.all())
+        if id_cita:
+            citas = citas.filter(id_cita=id_cita)
+        if id_paciente:
+            citas = citas.filter(id_paciente=id_paciente)
+        if id_medico:
+            citas = citas.filter(id_medico=id_medico)
+
+        # Paciente y médico llegan en el JOIN: serializar no lanza más consultas
+        citas = [cita async for cita in citas]
+        return _respuesta(serializer_class(citas, many=True).data)
+    except Exception as e:
+        return _error(f"Error al consultar citas: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Equivale a obtener_cita (Actividad 3)
+@require_GET
+async def obtener_cita(request):
+    id_cita = request.GET.get("id_cita", None)
+    if not id_cita:
+        return _error("ID de cita no proporcionado.", status.HTTP_400_BAD_REQUEST)
+    try:
+        cita = await CitaSerializer.optimizar_queryset(Cita.objects.all()).aget(id_cita=id_cita)
+    except Cita.DoesNotExist:
+        return _error("Cita no encontrada.", status.HTTP_404_NOT_FOUND)
+    return _respuesta(CitaSerializer(cita).data)
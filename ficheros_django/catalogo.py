@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .condicional import respuesta_condicional, version_tablas
+from .models import Medico
+from .replicas import primaria
+from .serializers import MedicoSerializer
+
+# Caché del catálogo de médicos (listado, fichas y médicos por especialidad).
+#
+# Las claves llevan la versión del catálogo: al guardar o borrar un médico
+# cambia la versión y las entradas anteriores dejan de usarse (caducan por TTL
+# o las expulsa el LRU de la caché). Así una lectura que coincide con una
+# escritura nunca deja datos antiguos bajo la versión vigente.
+# La versión también sirve de ETag/Last-Modified para las peticiones
+# condicionales de los clientes (304 Not Modified).
+#
+# La versión es la de la tabla medico (condicional.version_tablas, triggers de
+# consultorio.sql), compartida por todos los procesos aunque cada uno tenga su
+# propia caché (LocMemCache). Se le añade un contador guardado en la caché que
+# cubre las bases de datos sin triggers (SQLite en desarrollo, un solo proceso).
+
+CACHE = getattr(settings, 'CATALOGO_CACHE', 'default')  # Alias de settings.CACHES
+TTL = getattr(settings, 'CATALOGO_TTL', 300)  # Segundos
+
+TABLAS = ('medico',)  # Tablas de las que depende el catálogo
+CLAVE_VERSION = 'catalogo:version'
+
+
+def _cache():
+    return caches[CACHE]
+
+
+def _nueva_version():
+    ahora = timezone.now()
+    version = (int(ahora.timestamp() * 1_000_000), ahora)
+    _cache().set(CLAVE_VERSION, version, None)  # Sin caducidad
+    return version
+
+
+def version_catalogo():
+    """Devuelve (versión, fecha de la última modificación) del catálogo."""
+    # De la principal: con la versión de una réplica con retraso se seguirían
+    # sirviendo datos ya cambiados
+    with primaria():
+        version, modificado = version_tablas(TABLAS)
+    # Si la caché se ha vaciado se empieza una versión nueva
+    contador, fecha = _cache().get(CLAVE_VERSION) or _nueva_version()
+    return f'{version}.{contador}', max(filter(None, (modificado, fecha)))
+
+
+def invalidar_catalogo():
+    """Nueva versión del catálogo en esta caché (sin triggers, p. ej. en SQLite)."""
+    _nueva_version()
+
+
+@receiver(post_save, sender=Medico)
+@receiver(post_delete, sender=Medico)
+def _medico_modificado(sender, **kwargs):
+    # Tras el COMMIT: antes, otra petición podría cachear los datos sin el cambio
+    transaction.on_commit(invalidar_catalogo)
+
+
+def _leer(nombre, calcular):
+    version, _ = version_catalogo()
+    # Se calcula con la principal: una réplica con retraso guardaría datos
+    # anteriores a la versión vigente hasta que caducaran
+    with primaria():
+        return _cache().get_or_set(f'catalogo:{version}:{nombre}', calcular, TTL)
+
+
+def lista_medicos():
+    """Listado completo de médicos serializado (ordenado por id_medico)."""
+    return _leer('medicos', lambda: [
+        dict(medico) for medico in MedicoSerializer(Medico.objects.order_by('id_medico'), many=True).data
+    ])
+
+
+def ficha_medico(id_medico):
+    """Datos serializados de un médico o None si no existe (o el id no es un número)."""
+    try:
+        id_medico = int(id_medico)
+    except (TypeError, ValueError):
+        return None
+
+    def calcular():
+        medico = Medico.objects.filter(pk=id_medico).first()
+        return dict(MedicoSerializer(medico).data) if medico else None
+    return _leer(f'medico:{id_medico}', calcular)
+
+
+def medicos_por_especialidad():
+    """Índice {ESPECIALIDAD (en mayúsculas): [id_medico, ...]}."""
+    def calcular():
+        indice = {}
+        for id_medico, especialidad in Medico.objects.order_by('id_medico').values_list('id_medico', 'especialidad'):
+            indice.setdefault(especialidad.upper(), []).append(id_medico)
+        return indice
+    return _leer('especialidades', calcular)
+
+
+def respuesta_catalogo(request, etiqueta, generar):
+    """Respuesta condicional (304) con ETag y Last-Modified de la versión del catálogo."""
+    version, modificado = version_catalogo()
+    return respuesta_condicional(request, f'"{etiqueta}-{version}"', modificado, generar)
@@ -0,0 +1,44 @@
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se comprime con gzip
+    brotli = None
+
+# Tamaño mínimo (bytes) de una respuesta para comprimirla
+TAMANO_MINIMO = getattr(settings, 'COMPRESION_TAMANO_MINIMO', 1024)
+
+re_acepta_br = re.compile(r'\bbr\b')
+
+
+class CompresionMiddleware(GZipMiddleware):
+    """
+    Comprime las respuestas de más de TAMANO_MINIMO bytes con brotli (si está
+    instalado y el cliente lo acepta) o con gzip. Los listados JSON se
+    reducen a una fracción de su tamaño.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or len(response.content) < TAMANO_MINIMO:
+            return response
+        if brotli is None or not re_acepta_br.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        comprimido = brotli.compress(response.content, quality=5)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response.headers['Content-Length'] = str(len(comprimido))
+        # El contenido cambia: el ETag deja de ser fuerte (igual que en GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
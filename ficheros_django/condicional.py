@@ -0,0 +1,138 @@
+import hashlib
+
+from django.db import connections, router
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Cambio, VersionTabla
+
+# Peticiones condicionales (ETag / If-None-Match, Last-Modified / If-Modified-Since).
+#
+# El ETag de un listado se calcula a partir de la versión de las tablas de
+# las que depende y de la URL completa. Comprobarlo cuesta una sola consulta
+# (versiontabla y cambio, por índice), así que un cliente que ya tiene la
+# versión vigente recibe un 304 sin que se consulte ni se serialice el listado.
+#
+# Los triggers anotan en `cambio` el ID de la transacción (pg_current_xact_id)
+# que escribió cada fila, sin bloquear ninguna fila compartida. Los IDs no se
+# confirman en orden, por lo que la versión de una tabla se compone de:
+# - el último ID anterior al horizonte (pg_snapshot_xmin: las transacciones
+#   anteriores ya han terminado, ninguna puede aparecer después);
+# - los IDs posteriores al horizonte ya visibles (transacciones confirmadas
+#   mientras otra más antigua sigue en curso);
+# - el ID del último TRUNCATE (versiontabla.reiniciado).
+# Cualquier escritura confirmada cambia alguna de las tres partes.
+
+# Horizonte y, por tabla, último TRUNCATE, última transacción anterior al
+# horizonte y transacciones posteriores (con la fecha de cada una)
+SQL_VERSIONES = """
+    SELECT v.tabla, h.horizonte, v.reiniciado, v.modificado,
+           ultima.version, ultima.modificado, recientes.versiones, recientes.modificado
+    FROM versiontabla v
+    CROSS JOIN (SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS horizonte) h
+    LEFT JOIN LATERAL (
+        SELECT version, modificado FROM cambio
+        WHERE tabla = v.tabla AND version < h.horizonte
+        ORDER BY version DESC LIMIT 1
+    ) ultima ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT array_agg(DISTINCT version ORDER BY version) AS versiones, max(modificado) AS modificado
+        FROM cambio WHERE tabla = v.tabla AND version >= h.horizonte
+    ) recientes ON TRUE
+    WHERE v.tabla = ANY(%s)
+"""
+
+
+def estado_versiones(tablas):
+    """
+    Devuelve (horizonte, {tabla: (reiniciado, componente de versión, fecha de
+    la última modificación)}). Las transacciones anteriores al horizonte ya
+    han terminado: sus cambios son todos visibles.
+    """
+    alias = router.db_for_read(VersionTabla)
+    if connections[alias].vendor != 'postgresql':
+        return _estado_sin_transacciones(alias, tablas)
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute(SQL_VERSIONES, [list(tablas)])
+        filas = cursor.fetchall()
+    horizonte, estado = 0, {}
+    for tabla, horizonte, reiniciado, reinicio, ultima, modificado, recientes, reciente in filas:
+        componente = f'{reiniciado}-{ultima or 0}'
+        if recientes:
+            huella = ','.join(str(version) for version in recientes)
+            componente += '-' + hashlib.md5(huella.encode(), usedforsecurity=False).hexdigest()[:8]
+        fechas = [fecha for fecha in (reinicio, modificado, reciente) if fecha]
+        estado[tabla] = (reiniciado, componente, max(fechas) if fechas else None)
+    return horizonte, estado
+
+
+def _estado_sin_transacciones(alias, tablas):
+    # Bases de datos sin los triggers de PostgreSQL (SQLite en desarrollo): la
+    # última versión anotada, sin escrituras concurrentes que tener en cuenta
+    reinicios = dict(VersionTabla.objects.using(alias).filter(tabla__in=tablas).values_list('tabla', 'reiniciado'))
+    ultimas = {
+        fila['tabla']: fila
+        for fila in Cambio.objects.using(alias).filter(tabla__in=tablas).values('tabla').annotate(
+            version=Max('version'), modificado=Max('modificado'),
+        )
+    }
+    estado = {}
+    for tabla in tablas:
+        ultima = ultimas.get(tabla, {'version': 0, 'modificado': None})
+        reiniciado = reinicios.get(tabla, 0)
+        estado[tabla] = (reiniciado, f'{reiniciado}-{ultima["version"]}', ultima['modificado'])
+    horizonte = max([fila['version'] for fila in ultimas.values()] + list(reinicios.values()) + [0]) + 1
+    return horizonte, estado
+
+
+def version_tablas(tablas):
+    """Devuelve ("v1.v2...", fecha de la última modificación) de las tablas indicadas."""
+    _, estado = estado_versiones(tablas)
+    version = '.'.join(estado.get(tabla, (0, '0-0', None))[1] for tabla in tablas)
+    fechas = [modificado for _, _, modificado in estado.values() if modificado]
+    return version, max(fechas) if fechas else None
+
+
+def respuesta_condicional(request, etag, modificado, generar):
+    """
+    Responde 304 si el ETag o la fecha de modificación coinciden con los del
+    cliente; si no, llama a `generar()` y añade ETag y Last-Modified.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return generar()
+
+    ultima_modificacion = int(modificado.timestamp()) if modificado else None
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = generar()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if ultima_modificacion is not None:
+        response['Last-Modified'] = http_date(ultima_modificacion)
+    response['Cache-Control'] = 'no-cache'  # El navegador guarda la respuesta pero revalida siempre
+    return response
+
+
+def respuesta_tablas(request, tablas, generar):
+    """respuesta_condicional con el ETag derivado de la versión de `tablas` y de la URL."""
+    version, modificado = version_tablas(tablas)
+    formato = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    clave = hashlib.md5(f'{request.get_full_path()}|{formato}'.encode(), usedforsecurity=False).hexdigest()[:12]
+    return respuesta_condicional(request, f'"{version}-{clave}"', modificado, generar)
+
+
+class ListadoCondicionalMixin:
+    """
+    Mixin para ViewSets: el listado (`list`) responde 304 cuando no ha
+    cambiado ninguna de las tablas de `tablas_version` desde la última vez
+    que el cliente lo pidió.
+    """
+    tablas_version = ()
+
+    def list(self, request, *args, **kwargs):
+        return respuesta_tablas(request, self.tablas_version, lambda: super(ListadoCondicionalMixin, self).list(
+            request, *args, **kwargs
+        ))
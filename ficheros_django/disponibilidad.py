@@ -0,0 +1,311 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .catalogo import medicos_por_especialidad
+from .metricas import disponibilidad_segundos
+from .models import Cita, HorarioMedico, Medico, OcupacionMedico
+
+# Índice de disponibilidad por médico y día.
+#
+# Cada hora del día es un bit de un entero (bit 9 = 09:00, bit 10 = 10:00...).
+# - HorarioMedico.horas: horas de trabajo del médico para un día de la semana.
+# - OcupacionMedico.ocupados: horas con alguna cita activa en una fecha.
+# Las horas libres de un médico son `horas & ~ocupados`, por lo que consultar
+# la disponibilidad es una lectura por médico en lugar de recorrer `cita`.
+
+# Horario laboral por defecto para médicos sin plantilla propia
+HORARIO_LABORAL = getattr(
+    settings, 'HORARIO_LABORAL', ["09:00:00", "10:00:00", "11:00:00", "13:00:00", "14:00:00", "15:00:00"]
+)
+
+# Número máximo de días que se pueden consultar en una sola petición de rango
+DISPONIBILIDAD_MAX_DIAS = getattr(settings, 'DISPONIBILIDAD_MAX_DIAS', 92)
+
+# Días que se recorren como máximo al buscar los próximos huecos libres
+HUECOS_MAX_DIAS = getattr(settings, 'HUECOS_MAX_DIAS', 180)
+
+# Número máximo de huecos por búsqueda
+HUECOS_MAX = 50
+
+# Estados de cita que no ocupan el horario del médico
+ESTADOS_LIBRES = ('cancelada',)
+
+# Índice único parcial de la tabla cita: (id_medico, fecha, hora) para citas no canceladas
+CONSTRAINT_HORARIO = 'cita_medico_horario_unico'
+
+
+def es_conflicto_horario(error):
+    """
+    Indica si un IntegrityError se debe al índice único parcial
+    cita_medico_horario_unico (médico con otra cita activa a esa hora).
+    """
+    diagnostico = getattr(error.__cause__, 'diag', None)
+    if diagnostico is not None:
+        # PostgreSQL (psycopg): nombre de la restricción violada
+        return diagnostico.constraint_name == CONSTRAINT_HORARIO
+    # SQLite (desarrollo y pruebas) no da el nombre: el mensaje lista las columnas del índice
+    return 'cita.id_medico, cita.fecha, cita.hora' in str(error)
+
+
+def _fecha(valor):
+    # Acepta date o cadena 'YYYY-MM-DD' (p. ej. request.data en el PATCH)
+    return parse_date(valor) if isinstance(valor, str) else valor
+
+
+def _hora(valor):
+    # Acepta time o cadena 'HH:MM[:SS]'
+    return parse_time(valor) if isinstance(valor, str) else valor
+
+
+def horas_a_mascara(horas):
+    """Convierte una lista de horas ("09:00:00" o time) en su máscara de bits."""
+    mascara = 0
+    for hora in horas:
+        mascara |= 1 << _hora(hora).hour
+    return mascara
+
+
+def mascara_a_horas(mascara):
+    """Convierte una máscara de bits en la lista de horas "HH:00:00"."""
+    return [datetime.time(h).strftime("%H:%M:%S") for h in range(24) if mascara & (1 << h)]
+
+
+MASCARA_LABORAL = horas_a_mascara(HORARIO_LABORAL)
+
+
+def _ocupa(cita):
+    return cita.estado not in ESTADOS_LIBRES
+
+
+def ocupar_horario(cita):
+    """
+    Marca como ocupada la hora de la cita en el índice del médico.
+    Debe llamarse dentro de la misma transacción que guarda la cita.
+    """
+    if not _ocupa(cita):
+        return
+    fecha = _fecha(cita.fecha)
+    bit = 1 << _hora(cita.hora).hour
+    filas = OcupacionMedico.objects.filter(id_medico=cita.id_medico_id, fecha=fecha)
+    if filas.update(ocupados=F('ocupados').bitor(bit)):
+        return
+    try:
+        with transaction.atomic():
+            OcupacionMedico.objects.create(id_medico_id=cita.id_medico_id, fecha=fecha, ocupados=bit)
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        filas.update(ocupados=F('ocupados').bitor(bit))
+
+
+def liberar_horario(cita):
+    """
+    Libera la hora de la cita en el índice del médico (cancelación,
+    borrado o antes de reprogramarla). Usa los valores actuales de `cita`.
+    """
+    if not _ocupa(cita):
+        return
+    fecha = _fecha(cita.fecha)
+    hora = _hora(cita.hora)
+    # El bit solo se limpia si no queda otra cita activa en esa hora
+    otras = Cita.objects.filter(
+        id_medico=cita.id_medico_id, fecha=fecha, hora__hour=hora.hour
+    ).exclude(id_cita=cita.id_cita).exclude(estado__in=ESTADOS_LIBRES)
+    if otras.exists():
+        return
+    OcupacionMedico.objects.filter(id_medico=cita.id_medico_id, fecha=fecha).update(
+        ocupados=F('ocupados').bitand(~(1 << hora.hour))
+    )
+
+
+def _medicos(especialidad, id_medico=None):
+    # Médicos de la especialidad (sin distinguir mayúsculas) según el catálogo en caché
+    ids = medicos_por_especialidad().get(especialidad.upper(), [])
+    if id_medico:
+        ids = [i for i in ids if str(i) == str(id_medico)]
+    return Medico.objects.filter(pk__in=ids)
+
+
+# Las funciones siguientes separan la construcción de las consultas del
+# cálculo del resultado, para compartirlas entre las versiones síncronas y
+# las asíncronas (ORM asíncrono, vistas de asincrono.py).
+
+def _consulta_dia(medicos, fecha):
+    # (id_medico, horas de la plantilla, horas ocupadas) de cada médico en la fecha
+    plantilla = HorarioMedico.objects.filter(id_medico=OuterRef('pk'), dia_semana=fecha.weekday())
+    ocupacion = OcupacionMedico.objects.filter(id_medico=OuterRef('pk'), fecha=fecha)
+    return medicos.annotate(
+        horas=Subquery(plantilla.values('horas')[:1]),
+        ocupados=Subquery(ocupacion.values('ocupados')[:1]),
+    ).values_list('id_medico', 'horas', 'ocupados')
+
+
+def _libres_dia(filas):
+    return {
+        medico: mascara_a_horas((MASCARA_LABORAL if horas is None else horas) & ~(ocupados or 0))
+        for medico, horas, ocupados in filas
+    }
+
+
+def _consulta_plantillas(medicos):
+    # Plantillas por médico y día de la semana (LEFT JOIN: médicos sin plantilla incluidos)
+    return medicos.values_list('id_medico', 'horariomedico__dia_semana', 'horariomedico__horas')
+
+
+def _plantillas(filas):
+    plantillas = {}
+    for medico, dia, horas in filas:
+        semana = plantillas.setdefault(medico, [MASCARA_LABORAL] * 7)
+        if dia is not None:
+            semana[dia] = horas
+    return plantillas
+
+
+def _consulta_ocupacion(plantillas, desde, hasta):
+    # Ocupación de todos los médicos del rango en una sola consulta
+    return OcupacionMedico.objects.filter(
+        id_medico__in=list(plantillas), fecha__gte=desde, fecha__lte=hasta
+    ).values_list('id_medico', 'fecha', 'ocupados')
+
+
+def _dias(plantillas, ocupacion, desde, hasta):
+    ocupados = {(medico, fecha): mascara for medico, fecha, mascara in ocupacion}
+    dias = {}
+    fecha = desde
+    while fecha <= hasta:
+        dia = fecha.weekday()
+        dias[fecha] = {
+            medico: semana[dia] & ~ocupados.get((medico, fecha), 0)
+            for medico, semana in plantillas.items()
+        }
+        fecha += datetime.timedelta(days=1)
+    return dias
+
+
+def horarios_disponibles(especialidad, fecha, id_medico=None):
+    """
+    Devuelve {id_medico: [horas libres]} para los médicos de la especialidad
+    en la fecha indicada, con una única consulta sobre los índices.
+    """
+    fecha = _fecha(fecha)
+    with disponibilidad_segundos.medir(consulta='dia'):
+        return _libres_dia(_consulta_dia(_medicos(especialidad, id_medico), fecha))
+
+
+def horarios_disponibles_rango(especialidad, desde, hasta, id_medico=None):
+    """
+    Disponibilidad de todos los días entre `desde` y `hasta` (incluidos).
+    Devuelve {fecha: {id_medico: máscara de horas libres}} con dos consultas
+    en total (plantillas y ocupación del rango), sea cual sea el número de días.
+    """
+    desde, hasta = _fecha(desde), _fecha(hasta)
+    with disponibilidad_segundos.medir(consulta='rango'):
+        plantillas = _plantillas(_consulta_plantillas(_medicos(especialidad, id_medico)))
+        return _dias(plantillas, _consulta_ocupacion(plantillas, desde, hasta), desde, hasta)
+
+
+def _mascara_franja(hora_desde, hora_hasta):
+    # Horas en punto entre hora_desde (incluida) y hora_hasta (excluida)
+    hora_desde, hora_hasta = _hora(hora_desde), _hora(hora_hasta)
+    return horas_a_mascara(
+        datetime.time(h) for h in range(24)
+        if (hora_desde is None or datetime.time(h) >= hora_desde)
+        and (hora_hasta is None or datetime.time(h) < hora_hasta)
+    )
+
+
+def proximos_huecos(especialidad, desde=None, id_medico=None, cantidad=1, hora_desde=None, hora_hasta=None):
+    """
+    Los `cantidad` primeros huecos libres entre todos los médicos de la
+    especialidad a partir de `desde` (hoy por defecto, sin las horas ya
+    empezadas) y dentro de la franja [hora_desde, hora_hasta). Devuelve una
+    lista de (fecha, hora, id_medico) en orden de fecha y hora.
+
+    Lee las plantillas y recorre la ocupación de los próximos HUECOS_MAX_DIAS
+    días en orden de fecha con una sola consulta (índice único de
+    ocupacionmedico), que se deja de leer en cuanto se completan los huecos.
+    """
+    ahora = timezone.localtime()
+    desde = max(_fecha(desde) or ahora.date(), ahora.date())
+    hasta = desde + datetime.timedelta(days=HUECOS_MAX_DIAS - 1)
+    cantidad = min(cantidad, HUECOS_MAX)
+    franja = _mascara_franja(hora_desde, hora_hasta)
+
+    with disponibilidad_segundos.medir(consulta='huecos'):
+        plantillas = _plantillas(_consulta_plantillas(_medicos(especialidad, id_medico)))
+        if not plantillas or not franja:
+            return []
+        medicos = sorted(plantillas)
+        huecos = []
+        ocupacion = _consulta_ocupacion(plantillas, desde, hasta).order_by('fecha').iterator()
+        try:
+            fila = next(ocupacion, None)
+            fecha = desde
+            while fecha <= hasta and len(huecos) < cantidad:
+                ocupados = {}
+                while fila is not None and fila[1] == fecha:
+                    ocupados[fila[0]] = fila[2]
+                    fila = next(ocupacion, None)
+                mascara = franja
+                if fecha == ahora.date():
+                    mascara &= ~((2 << ahora.hour) - 1)  # Horas ya empezadas
+                dia = fecha.weekday()
+                libres = {m: plantillas[m][dia] & ~ocupados.get(m, 0) & mascara for m in medicos}
+                for hora in range(24):
+                    for medico in medicos:
+                        if libres[medico] & (1 << hora) and len(huecos) < cantidad:
+                            huecos.append((fecha, datetime.time(hora), medico))
+                fecha += datetime.timedelta(days=1)
+        finally:
+            ocupacion.close()  # Libera el cursor si se deja de leer antes de tiempo
+        return huecos
+
+
+async def ahorarios_disponibles(especialidad, fecha, id_medico=None):
+    """Versión asíncrona de horarios_disponibles (ORM asíncrono)."""
+    fecha = _fecha(fecha)
+    with disponibilidad_segundos.medir(consulta='dia'):
+        # El catálogo se lee de la caché (o de la base de datos la primera vez) en un hilo
+        medicos = await sync_to_async(_medicos)(especialidad, id_medico)
+        return _libres_dia([fila async for fila in _consulta_dia(medicos, fecha)])
+
+
+async def ahorarios_disponibles_rango(especialidad, desde, hasta, id_medico=None):
+    """Versión asíncrona de horarios_disponibles_rango (ORM asíncrono)."""
+    desde, hasta = _fecha(desde), _fecha(hasta)
+    with disponibilidad_segundos.medir(consulta='rango'):
+        medicos = await sync_to_async(_medicos)(especialidad, id_medico)
+        plantillas = _plantillas([fila async for fila in _consulta_plantillas(medicos)])
+        ocupacion = [fila async for fila in _consulta_ocupacion(plantillas, desde, hasta)]
+        return _dias(plantillas, ocupacion, desde, hasta)
+
+
+def reconstruir_ocupacion(desde=None):
+    """
+    Regenera el índice de ocupación a partir de la tabla `cita`.
+    Útil tras cargas masivas o para la puesta en marcha inicial.
+    """
+    citas = Cita.objects.exclude(estado__in=ESTADOS_LIBRES)
+    if desde:
+        citas = citas.filter(fecha__gte=desde)
+
+    mascaras = {}
+    for id_medico, fecha, hora in citas.values_list('id_medico', 'fecha', 'hora').iterator():
+        clave = (id_medico, fecha)
+        mascaras[clave] = mascaras.get(clave, 0) | (1 << hora.hour)
+
+    with transaction.atomic():
+        existentes = OcupacionMedico.objects.all()
+        if desde:
+            existentes = existentes.filter(fecha__gte=desde)
+        existentes.delete()
+        OcupacionMedico.objects.bulk_create(
+            [OcupacionMedico(id_medico_id=m, fecha=f, ocupados=o) for (m, f), o in mascaras.items()],
+            batch_size=1000,
+        )
+    return len(mascaras)
@@ -0,0 +1,147 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Paciente
+from .serializers import PacienteImportacionSerializer, PacienteSerializer
+
+# Importación masiva de pacientes.
+#
+# Las filas se procesan por lotes: cada lote se valida, comprueba la unicidad
+# de email/DNI con una sola consulta y se inserta con bulk_create en su propia
+# transacción. Las filas llegan como iterador, por lo que un fichero NDJSON o
+# CSV se puede leer en streaming sin cargarlo entero en memoria.
+
+# Número de filas por lote (se puede cambiar por petición con ?lote=)
+TAMANO_LOTE = getattr(settings, 'IMPORTACION_TAMANO_LOTE', 1000)
+TAMANO_LOTE_MAX = 10000
+
+# Campos con restricción UNIQUE del modelo (email y, si existe, dni)
+CAMPOS_UNICOS = [f.name for f in Paciente._meta.fields if f.unique and not f.primary_key]
+
+
+class CodificacionNoValida(ValueError):
+    """Línea del fichero que no está en UTF-8. `creados`: pacientes de los lotes ya importados."""
+
+    def __init__(self, linea):
+        super().__init__(f"El fichero debe estar codificado en UTF-8 (línea {linea}).")
+        self.linea = linea
+        self.creados = 0
+
+
+def decodificar_lineas(lineas):
+    """Decodifica en UTF-8 las líneas (bytes) de un fichero leído en streaming."""
+    for numero, linea in enumerate(lineas, start=1):
+        try:
+            yield linea.decode('utf-8')
+        except UnicodeDecodeError:
+            raise CodificacionNoValida(numero) from None
+
+
+def leer_json(filas):
+    """Genera (número de fila, datos, error) a partir de una lista JSON ya parseada."""
+    for numero, datos in enumerate(filas, start=1):
+        yield numero, datos, None
+
+
+def leer_ndjson(lineas):
+    """Genera (número de fila, datos, error) a partir de líneas NDJSON."""
+    for numero, linea in enumerate(lineas, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield numero, json.loads(linea), None
+        except ValueError as e:
+            yield numero, None, {"non_field_errors": [f"JSON no válido: {e}"]}
+
+
+def leer_csv(lineas):
+    """Genera (número de fila, datos, error) a partir de líneas CSV con cabecera."""
+    lector = csv.DictReader(lineas)
+    for datos in lector:
+        yield lector.line_num, datos, None
+
+
+def importar_pacientes(filas, tamano_lote=TAMANO_LOTE, devolver_datos=False):
+    """
+    Importa las filas (iterador de tuplas de leer_*) por lotes.
+    Devuelve el número de pacientes creados, los errores por fila y, si se
+    pide, los datos de los pacientes creados.
+    """
+    resultado = {"creados": 0, "errores": []}
+    if devolver_datos:
+        resultado["resultados"] = []
+
+    filas = iter(filas)
+    while True:
+        try:
+            lote = list(islice(filas, tamano_lote))
+        except CodificacionNoValida as error:
+            error.creados = resultado["creados"]  # Los lotes anteriores ya están guardados
+            raise
+        if not lote:
+            break
+        creados = _importar_lote(lote, resultado["errores"])
+        resultado["creados"] += len(creados)
+        if devolver_datos:
+            resultado["resultados"].extend(PacienteSerializer(creados, many=True).data)
+    resultado["errores"].sort(key=lambda error: error["fila"])
+    return resultado
+
+
+def _importar_lote(lote, errores):
+    # 1. Validación de cada fila (sin consultas a la base de datos)
+    validos = []
+    for numero, datos, error in lote:
+        if error:
+            errores.append({"fila": numero, "error": error})
+            continue
+        serializer = PacienteImportacionSerializer(data=datos)
+        if serializer.is_valid():
+            validos.append((numero, serializer.validated_data))
+        else:
+            errores.append({"fila": numero, "error": serializer.errors})
+
+    # 2. Valores únicos ya existentes: una sola consulta para todo el lote
+    existentes = {campo: set() for campo in CAMPOS_UNICOS}
+    if validos and CAMPOS_UNICOS:
+        filtro = Q()
+        for campo in CAMPOS_UNICOS:
+            filtro |= Q(**{f"{campo}__in": [d[campo] for _, d in validos if d.get(campo) is not None]})
+        for fila in Paciente.objects.filter(filtro).values_list(*CAMPOS_UNICOS):
+            for campo, valor in zip(CAMPOS_UNICOS, fila):
+                existentes[campo].add(valor)
+
+    nuevos = []
+    for numero, datos in validos:
+        repetidos = [campo for campo in CAMPOS_UNICOS if datos.get(campo) in existentes[campo]]
+        if repetidos:
+            errores.append({"fila": numero, "error": {
+                campo: ["Ya existe un paciente con este valor."] for campo in repetidos
+            }})
+            continue
+        for campo in CAMPOS_UNICOS:  # Evita duplicados dentro del propio lote
+            if datos.get(campo) is not None:
+                existentes[campo].add(datos[campo])
+        nuevos.append((numero, Paciente(**datos)))
+
+    # 3. Inserción del lote en una transacción corta
+    try:
+        with transaction.atomic():
+            return Paciente.objects.bulk_create([paciente for _, paciente in nuevos])
+    except IntegrityError:
+        # Otra petición insertó un valor único tras la comprobación: fila a fila
+        creados = []
+        for numero, paciente in nuevos:
+            try:
+                with transaction.atomic():
+                    paciente.save(force_insert=True)
+                creados.append(paciente)
+            except IntegrityError as e:
+                errores.append({"fila": numero, "error": {"non_field_errors": [str(e)]}})
+        return creados
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# Operaciones de migración para los índices de las tablas del consultorio.
+#
+# Los modelos son `managed = False`, así que Django no crea índices para
+# ellos: las migraciones de esta aplicación los añaden con SQL. Solo se
+# aplican en PostgreSQL (en SQLite, usado en desarrollo, no hacen nada).
+# Se ejecutan sin statement_timeout: DB_STATEMENT_TIMEOUT es un límite para
+# las peticiones y un CREATE INDEX CONCURRENTLY o un relleno de datos lo superan.
+
+
+def _existe_columna(connection, tabla, columna):
+    with connection.cursor() as cursor:
+        columnas = connection.introspection.get_table_description(cursor, tabla)
+    return any(c.name == columna for c in columnas)
+
+
+class SQLPostgres(migrations.RunSQL):
+    """RunSQL que solo se ejecuta cuando la base de datos es PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute('SET statement_timeout = 0')  # Para el resto de la sesión de migrate
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute('SET statement_timeout = 0')
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class IndicePostgres(SQLPostgres):
+    """
+    Crea un índice con CREATE INDEX CONCURRENTLY (sin bloquear las escrituras
+    en la tabla) y lo elimina al revertir la migración.
+    Las migraciones que la usan deben declarar `atomic = False`.
+    """
+
+    def __init__(self, nombre, definicion, requiere_columna=None, unico=False):
+        self.nombre = nombre
+        # (tabla, columna): el índice se omite si la columna no existe
+        # (p. ej. cita.refcita solo existe en el esquema de Actividad 3)
+        self.requiere_columna = requiere_columna
+        super().__init__(
+            sql=f'CREATE {"UNIQUE " if unico else ""}INDEX CONCURRENTLY IF NOT EXISTS {nombre} {definicion}',
+            reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS {nombre}',
+        )
+
+    def describe(self):
+        return f'Crear índice {self.nombre}'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        if self.requiere_columna and not _existe_columna(schema_editor.connection, *self.requiere_columna):
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class IndiceEliminado(IndicePostgres):
+    """Elimina un índice; al revertir la migración se vuelve a crear."""
+
+    def __init__(self, nombre, definicion):
+        super().__init__(nombre, definicion)
+        self.sql, self.reverse_sql = self.reverse_sql, self.sql
+
+    def describe(self):
+        return f'Eliminar índice {self.nombre}'
@@ -0,0 +1,193 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.serializers import ListSerializer
+
+from .metricas import serializacion_segundos
+
+
+# Contador de consultas SQL ejecutadas en un bloque de código
+class ContadorConsultas:
+    """
+    Envoltorio para `connection.execute_wrapper` que cuenta las sentencias
+    SQL enviadas a la base de datos.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def contar_consultas(metodo):
+    """
+    Decorador para métodos de vistas: con DEBUG activo añade a la respuesta
+    la cabecera `X-Consultas` con el número de sentencias SQL ejecutadas.
+    """
+    @wraps(metodo)
+    def envoltorio(self, request, *args, **kwargs):
+        if not settings.DEBUG:
+            return metodo(self, request, *args, **kwargs)
+        contador = ContadorConsultas()
+        with connection.execute_wrapper(contador):
+            response = metodo(self, request, *args, **kwargs)
+        response['X-Consultas'] = str(contador.total)
+        return response
+    return envoltorio
+
+
+# --- Medición por petición (InstrumentacionMiddleware) ---
+#
+# Con CONSULTORIO_INSTRUMENTACION=1 cada petición mide su tiempo total, el
+# tiempo y el número de consultas SQL (todas las bases de datos) y el tiempo
+# de serialización (`.data` de los serializers), y los devuelve en la
+# cabecera Server-Timing, que las herramientas de desarrollo del navegador
+# muestran en la pestaña de red. Las peticiones que superan
+# INSTRUMENTACION_UMBRAL_MS se registran en el logger `consultorio.lentas`
+# como una línea JSON con sus consultas más lentas y las más repetidas.
+# El coste es un perf_counter() por consulta y por serialización.
+
+UMBRAL_MS = getattr(settings, 'INSTRUMENTACION_UMBRAL_MS', 500)
+SQL_REGISTRADAS = 5  # Consultas más lentas (y más repetidas) del registro
+SQL_LONGITUD = 2000  # Caracteres de cada consulta en el registro
+
+registro_lentas = logging.getLogger('consultorio.lentas')
+
+_medicion = ContextVar('consultorio_medicion', default=None)
+
+
+class MedicionPeticion:
+    """Tiempos acumulados de una petición (en segundos)."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.db = 0.0
+        self.serializacion = 0.0
+        self.sql = {}  # sql: [veces, segundos]
+
+    def anotar_consulta(self, sql, segundos):
+        self.consultas += 1
+        self.db += segundos
+        anotada = self.sql.get(sql)
+        if anotada is None:
+            self.sql[sql] = [1, segundos]
+        else:
+            anotada[0] += 1
+            anotada[1] += segundos
+
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+
+@contextmanager
+def tramo_serializacion():
+    """
+    Suma la duración del bloque al tiempo de serialización de la petición en
+    curso y la anota en el histograma de /metrics (metricas.py).
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.serializacion += segundos
+        serializacion_segundos.observar(segundos)
+
+
+def _medir_sql(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.anotar_consulta(sql, time.perf_counter() - inicio)
+
+
+def _instrumentar_conexion(sender, connection, **kwargs):
+    # Al principio de la lista: execute_wrapper() quita siempre el último envoltorio
+    if _medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _medir_sql)
+
+
+class SerializacionMedidaMixin:
+    """Mezcla para serializers: mide el tiempo de `.data` (de un objeto)."""
+
+    @property
+    def data(self):
+        with tramo_serializacion():
+            return super().data
+
+
+class ListaMedida(SerializacionMedidaMixin, ListSerializer):
+    """ListSerializer que mide el tiempo de `.data` (Meta.list_serializer_class)."""
+
+
+class InstrumentacionMiddleware(MiddlewareMixin):
+    """
+    Añade la cabecera Server-Timing (total, db y serialización) y registra
+    las peticiones lentas. Se activa con settings.INSTRUMENTACION; debe ser el
+    primero de MIDDLEWARE para que el total incluya el resto de middleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION', False):
+            raise MiddlewareNotUsed
+        connection_created.connect(_instrumentar_conexion)
+        for conexion in connections.all(initialized_only=True):
+            _instrumentar_conexion(None, conexion)
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        _medicion.set(MedicionPeticion())
+
+    def process_response(self, request, response):
+        medicion = _medicion.get()
+        if medicion is None:
+            return response
+        _medicion.set(None)
+        total = medicion.total() * 1000
+        response['Server-Timing'] = (
+            f'total;dur={total:.1f}, db;dur={medicion.db * 1000:.1f};desc="consultas: {medicion.consultas}", '
+            f'serializacion;dur={medicion.serializacion * 1000:.1f}'
+        )
+        if total >= UMBRAL_MS:
+            registro_lentas.warning(json.dumps(self.registro(request, response, medicion, total), ensure_ascii=False))
+        return response
+
+    def registro(self, request, response, medicion, total):
+        def consultas(orden):
+            return [
+                {'sql': sql[:SQL_LONGITUD], 'veces': veces, 'ms': round(segundos * 1000, 1)}
+                for sql, (veces, segundos) in sorted(medicion.sql.items(), key=orden, reverse=True)[:SQL_REGISTRADAS]
+            ]
+        return {
+            'metodo': request.method,
+            # Sin los valores de la query string (DNI, correo, teléfono...): solo sus nombres
+            'ruta': request.path,
+            'vista': getattr(request.resolver_match, 'view_name', None),
+            'parametros': sorted(request.GET),
+            'estado': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(medicion.db * 1000, 1),
+            'serializacion_ms': round(medicion.serializacion * 1000, 1),
+            'consultas': medicion.consultas,
+            'mas_lentas': consultas(lambda item: item[1][1]),
+            # Varias ejecuciones de la misma consulta suelen indicar un N+1
+            'mas_repetidas': [c for c in consultas(lambda item: item[1][0]) if c['veces'] > 1],
+        }
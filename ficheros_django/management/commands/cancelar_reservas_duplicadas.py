@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ...disponibilidad import ESTADOS_LIBRES
+from ...models import Cita
+from ...notificaciones import encolar_notificacion
+
+# Citas activas que comparten médico, fecha y hora (reservas duplicadas de
+# antes del índice único cita_medico_horario_unico). La migración 0010 no
+# crea el índice mientras existan; este comando las muestra y, con
+# --cancelar, conserva la primera reserva de cada horario y cancela las
+# demás avisando al paciente:
+#   python manage.py cancelar_reservas_duplicadas
+#   python manage.py cancelar_reservas_duplicadas --cancelar
+#   python manage.py migrate consultorio
+
+
+class Command(BaseCommand):
+    help = 'Muestra (y con --cancelar, cancela) las reservas duplicadas de un mismo médico, fecha y hora.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cancelar', action='store_true',
+                            help='Cancela todas las reservas de cada horario salvo la primera y encola el aviso.')
+
+    def handle(self, *args, **opciones):
+        activas = Cita.objects.exclude(estado__in=ESTADOS_LIBRES)
+        horarios = (
+            activas.values('id_medico', 'fecha', 'hora').annotate(reservas=Count('id_cita'))
+            .filter(reservas__gt=1).order_by('fecha', 'hora', 'id_medico')
+        )
+
+        canceladas = 0
+        for horario in horarios:
+            with transaction.atomic():
+                citas = list(
+                    activas.filter(id_medico=horario['id_medico'], fecha=horario['fecha'], hora=horario['hora'])
+                    .select_related('id_paciente').select_for_update(of=('self',)).order_by('id_cita')
+                )
+                conservada, duplicadas = citas[0], citas[1:]
+                self.stdout.write(
+                    f'Médico {horario["id_medico"]}, {horario["fecha"]} {horario["hora"]}: se conserva la cita '
+                    f'{conservada.pk}; duplicadas: {", ".join(str(cita.pk) for cita in duplicadas)}'
+                )
+                if not opciones['cancelar']:
+                    continue
+                for cita in duplicadas:
+                    cita.estado = 'cancelada'
+                    cita.save(update_fields=['estado'])
+                    encolar_notificacion(cita, 'cancelacion')
+                canceladas += len(duplicadas)
+
+        if not opciones['cancelar']:
+            self.stdout.write(f'{len(horarios)} horarios con reservas duplicadas (use --cancelar para cancelarlas).')
+            return
+        # La cita conservada sigue ocupando el horario: el índice de ocupación no cambia
+        self.stdout.write(self.style.SUCCESS(
+            f'{canceladas} citas canceladas en {len(horarios)} horarios; avisos pendientes en notificaciones.'
+        ))
@@ -0,0 +1,284 @@
+import datetime
+import io
+import json
+import random
+import time
+import unicodedata
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from ...catalogo import invalidar_catalogo
+from ...disponibilidad import HORARIO_LABORAL, reconstruir_ocupacion
+from ...models import Cita, HorarioMedico, Medico, OcupacionMedico, Paciente
+from ...referencias import generar_refcitas
+
+# Carga de datos de desarrollo y de datos sintéticos para pruebas de carga.
+#
+# Las tablas se cargan en orden de claves foráneas (medico, paciente, cita)
+# y después se regenera el índice de ocupación. En PostgreSQL las filas se
+# envían con COPY; en otros motores (SQLite en desarrollo) con bulk_create.
+# Los datos sintéticos se generan en streaming por lotes, así que el número
+# de citas no está limitado por la memoria.
+
+# Ficheros JSON de ficheros_desarrollo por tabla
+FICHEROS = {Medico: 'medico.json', Paciente: 'pacientes.json', Cita: 'cita.json'}
+
+# Nombres de respaldo si no se encuentran los ficheros JSON
+NOMBRES = ['Juan', 'María', 'Carlos', 'Ana', 'Luis', 'Sofía', 'Miguel', 'Laura', 'Pedro', 'Elena']
+APELLIDOS = ['Pérez', 'Gómez', 'Hernández', 'López', 'Martínez', 'Rodríguez', 'García', 'Moreno', 'Ruiz', 'Castro']
+ESPECIALIDADES = ['Cardiología', 'Dermatología', 'Neurología', 'Oftalmología', 'Pediatría']
+
+# Reparto de estados de las citas sintéticas
+ESTADOS = {'confirmada': 80, 'pendiente': 12, 'cancelada': 8}
+
+LETRAS_DNI = 'TRWAGMYFPDXBNJZSQVHLCKE'
+
+
+def _ascii(texto):
+    # "Hernández" -> "hernandez" (para correos sintéticos)
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode().lower().replace(' ', '')
+
+
+def _campos(modelo):
+    return list(modelo._meta.concrete_fields)
+
+
+def _texto_copy(valor):
+    # Formato de texto de COPY: \N es NULL y se escapan \, tabuladores y saltos de línea
+    if valor is None:
+        return '\\N'
+    return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _completar(modelo, fila):
+    """
+    Rellena los campos únicos obligatorios que no vienen en los ficheros de
+    Actividad 2 (dni, ncolegiado) y adapta `correo` a `email` cuando el
+    modelo lo usa. Los valores se derivan del identificador; refcita se
+    asigna por lotes en _asignar_refcitas.
+    """
+    nombres = {f.name for f in _campos(modelo)}
+    pk = fila[modelo._meta.pk.attname]
+    if 'correo' in fila and 'correo' not in nombres:
+        fila.setdefault('email', fila.pop('correo'))
+    if 'dni' in nombres and not fila.get('dni'):
+        fila['dni'] = f'{pk:08d}{LETRAS_DNI[pk % 23]}'
+    if 'ncolegiado' in nombres and not fila.get('ncolegiado'):
+        fila['ncolegiado'] = f'{28000000 + pk:08d}'
+    return fila
+
+
+def _asignar_refcitas(lote):
+    # Referencias válidas de la secuencia cita_refcita_seq (una consulta por
+    # lote): no chocan con las que la aplicación asigne después
+    if not any(f.name == 'refcita' for f in _campos(Cita)):
+        return
+    sin_referencia = [fila for fila in lote if not fila.get('refcita')]
+    for fila, refcita in zip(sin_referencia, generar_refcitas(len(sin_referencia))):
+        fila['refcita'] = refcita
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga los datos de ficheros_desarrollo (medico.json, pacientes.json, cita.json) '
+        'y/o genera datos sintéticos a escala para pruebas de carga.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directorio', default=getattr(settings, 'DATOS_DESARROLLO_DIR', None),
+            help='Carpeta con los ficheros JSON (por defecto settings.DATOS_DESARROLLO_DIR).',
+        )
+        parser.add_argument('--sin-fixtures', action='store_true', help='No carga los ficheros JSON.')
+        parser.add_argument('--medicos', type=int, default=0, help='Médicos sintéticos a generar.')
+        parser.add_argument('--pacientes', type=int, default=0, help='Pacientes sintéticos a generar.')
+        parser.add_argument('--citas', type=int, default=0, help='Citas sintéticas a generar.')
+        parser.add_argument('--desde', type=datetime.date.fromisoformat, default=None,
+                            help='Primera fecha de las citas sintéticas (AAAA-MM-DD, por defecto hoy o tras la última cita).')
+        parser.add_argument('--lote', type=int, default=10000, help='Filas por lote de COPY/INSERT.')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla para datos reproducibles.')
+        parser.add_argument('--vaciar', action='store_true', help='Vacía las tablas antes de cargar.')
+        parser.add_argument('--sin-copy', action='store_true', help='Usa bulk_create aunque el motor sea PostgreSQL.')
+
+    def handle(self, *args, **opciones):
+        self.lote = opciones['lote']
+        self.usar_copy = connection.vendor == 'postgresql' and not opciones['sin_copy']
+        self.aleatorio = random.Random(opciones['semilla'])
+        inicio = time.perf_counter()
+
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # La carga y reconstruir_ocupacion superan el límite pensado para las peticiones
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = 0')
+            if opciones['vaciar']:
+                self.vaciar()
+
+            fixtures = {}
+            if not opciones['sin_fixtures']:
+                fixtures = self.leer_fixtures(opciones['directorio'])
+                for modelo, filas in fixtures.items():
+                    self.cargar(modelo, filas)
+
+            self.preparar_pools(fixtures)
+            if opciones['medicos']:
+                self.cargar(Medico, self.generar_medicos(opciones['medicos']))
+            if opciones['pacientes']:
+                self.cargar(Paciente, self.generar_pacientes(opciones['pacientes']))
+            if opciones['citas']:
+                self.cargar(Cita, self.generar_citas(opciones['citas'], opciones['desde'] or self.primera_fecha()))
+
+            # Las filas llevan identificador explícito: se ajustan las secuencias
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Medico, Paciente, Cita]):
+                    cursor.execute(sql)
+
+            dias = reconstruir_ocupacion()
+            # COPY y bulk_create no lanzan las señales que invalidan el catálogo
+            transaction.on_commit(invalidar_catalogo)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Carga completada en {time.perf_counter() - inicio:.1f} s ({dias} días de ocupación indexados).'
+        ))
+
+    # --- Ficheros de ficheros_desarrollo ---
+
+    def leer_fixtures(self, directorio):
+        if not directorio:
+            raise CommandError('Indica --directorio o define DATOS_DESARROLLO_DIR en settings.')
+        directorio = Path(directorio)
+        fixtures = {}
+        for modelo, nombre in FICHEROS.items():  # Orden de claves foráneas
+            ruta = directorio / nombre
+            if not ruta.exists():
+                raise CommandError(f'No se encuentra {ruta}.')
+            with open(ruta, encoding='utf-8') as fichero:
+                filas = json.load(fichero)
+            fixtures[modelo] = [_completar(modelo, self.renombrar(modelo, fila)) for fila in filas]
+        return fixtures
+
+    @staticmethod
+    def renombrar(modelo, fila):
+        # Las claves foráneas vienen con el nombre de columna (id_paciente -> id_paciente_id)
+        columnas = {f.column: f.attname for f in _campos(modelo)}
+        return {columnas.get(clave, clave): valor for clave, valor in fila.items()}
+
+    # --- Datos sintéticos ---
+
+    def preparar_pools(self, fixtures):
+        pacientes = fixtures.get(Paciente, [])
+        medicos = fixtures.get(Medico, [])
+        self.nombres = sorted({p['nombre'] for p in pacientes}) or NOMBRES
+        self.apellidos = sorted({p['apellido'] for p in pacientes}) or APELLIDOS
+        self.especialidades = sorted({m['especialidad'] for m in medicos}) or ESPECIALIDADES
+
+    @staticmethod
+    def siguiente_id(modelo):
+        pk = modelo._meta.pk.attname
+        return (modelo.objects.aggregate(maximo=Max(pk))['maximo'] or 0) + 1
+
+    @staticmethod
+    def primera_fecha():
+        # Hoy, o el día siguiente a la última cita si ya hay citas posteriores
+        ultima = Cita.objects.aggregate(ultima=Max('fecha'))['ultima']
+        hoy = datetime.date.today()
+        return max(hoy, ultima + datetime.timedelta(days=1)) if ultima else hoy
+
+    def generar_medicos(self, total):
+        primero = self.siguiente_id(Medico)
+        for pk in range(primero, primero + total):
+            nombre = f'{self.aleatorio.choice(self.nombres)} {self.aleatorio.choice(self.apellidos)}'
+            yield _completar(Medico, {
+                'id_medico': pk,
+                'nombre': f'Dr. {nombre}',
+                'especialidad': self.especialidades[pk % len(self.especialidades)],
+                'correo': f'{_ascii(nombre)}.{pk}@hospital.com',
+            })
+
+    def generar_pacientes(self, total):
+        primero = self.siguiente_id(Paciente)
+        for pk in range(primero, primero + total):
+            nombre, apellido = self.aleatorio.choice(self.nombres), self.aleatorio.choice(self.apellidos)
+            yield _completar(Paciente, {
+                'id_paciente': pk,
+                'nombre': nombre,
+                'apellido': apellido,
+                'email': f'{_ascii(nombre)}.{_ascii(apellido)}.{pk}@example.com',
+                'telefono': f'6{self.aleatorio.randrange(10 ** 8):08d}',
+                'contrasena': f'clave{pk}',
+            })
+
+    def generar_citas(self, total, desde):
+        medicos = list(Medico.objects.order_by('pk').values_list('pk', 'especialidad'))
+        pacientes = list(Paciente.objects.values_list('pk', flat=True))
+        if not medicos or not pacientes:
+            raise CommandError('Hacen falta médicos y pacientes para generar citas.')
+        horas = [datetime.time.fromisoformat(h) for h in HORARIO_LABORAL]
+
+        # Los huecos se recorren en orden (día, hora, médico): nunca se repite
+        # (id_medico, fecha, hora), así que se respeta el índice único parcial
+        # aunque la tabla ya tenga citas en fechas anteriores a `desde`.
+        estados, pesos = list(ESTADOS), list(ESTADOS.values())
+        primero = self.siguiente_id(Cita)
+        por_dia = len(horas) * len(medicos)
+        for n in range(total):
+            dia, resto = divmod(n, por_dia)
+            hora, (id_medico, especialidad) = horas[resto // len(medicos)], medicos[resto % len(medicos)]
+            yield _completar(Cita, {
+                'id_cita': primero + n,
+                'id_paciente_id': self.aleatorio.choice(pacientes),
+                'id_medico_id': id_medico,
+                'fecha': desde + datetime.timedelta(days=dia),
+                'hora': hora,
+                'especialidad': especialidad,
+                'estado': self.aleatorio.choices(estados, pesos)[0],
+            })
+
+    # --- Escritura ---
+
+    def vaciar(self):
+        if connection.vendor == 'postgresql':
+            tablas = ', '.join(m._meta.db_table for m in (OcupacionMedico, HorarioMedico, Cita, Paciente, Medico))
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {tablas} RESTART IDENTITY CASCADE')
+        else:
+            for modelo in (OcupacionMedico, HorarioMedico, Cita, Paciente, Medico):
+                modelo.objects.all().delete()
+
+    def cargar(self, modelo, filas):
+        inicio, total = time.perf_counter(), 0
+        filas = iter(filas)
+        while True:
+            lote = list(islice(filas, self.lote))
+            if not lote:
+                break
+            if modelo is Cita:
+                _asignar_refcitas(lote)
+            if self.usar_copy:
+                self.copiar(modelo, lote)
+            else:
+                modelo.objects.bulk_create([modelo(**fila) for fila in lote], batch_size=1000)
+            total += len(lote)
+        self.stdout.write(f'{modelo._meta.db_table}: {total} filas en {time.perf_counter() - inicio:.1f} s')
+
+    def copiar(self, modelo, lote):
+        campos = [f for f in _campos(modelo) if f.attname in lote[0]]
+        buffer = io.StringIO()
+        for fila in lote:
+            buffer.write('\t'.join(_texto_copy(fila.get(f.attname)) for f in campos) + '\n')
+        sql = f'COPY {modelo._meta.db_table} ({", ".join(f.column for f in campos)}) FROM STDIN'
+
+        with connection.cursor() as cursor:
+            cursor = cursor.cursor  # Cursor del driver
+            if hasattr(cursor, 'copy'):  # psycopg 3
+                with cursor.copy(sql) as copia:
+                    copia.write(buffer.getvalue())
+            else:  # psycopg2
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
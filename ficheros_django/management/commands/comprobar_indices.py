@@ -0,0 +1,78 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...disponibilidad import ESTADOS_LIBRES
+from ...models import Cita, Medico, OcupacionMedico, Paciente
+from ...serializers import CitaSerializer
+
+# Comprobación con EXPLAIN de que las consultas frecuentes de las vistas
+# usan un índice. El planificador prefiere recorrer tablas pequeñas de forma
+# secuencial, así que se desactiva el Seq Scan (SET LOCAL enable_seqscan):
+# si aun así el plan contiene un Seq Scan, no hay ningún índice utilizable.
+
+
+def consultas_frecuentes():
+    """Devuelve (nombre, origen, queryset) para las consultas que deben usar índices."""
+    medico = Medico.objects.values_list('pk', 'especialidad').first() or (1, 'Cardiología')
+    id_paciente = Paciente.objects.values_list('pk', flat=True).first() or 1
+    hoy = datetime.date.today()
+    activas = Cita.objects.exclude(estado__in=ESTADOS_LIBRES)
+
+    consultas = [
+        ('citas_paciente', 'CancelarReprogramarCitaView GET ?id_paciente',
+         CitaSerializer.optimizar_queryset(Cita.objects.filter(id_paciente=id_paciente))),
+        ('citas_medico', 'CancelarReprogramarCitaView GET ?id_medico',
+         CitaSerializer.optimizar_queryset(Cita.objects.filter(id_medico=medico[0]))),
+        ('medicos_especialidad', 'médicos por especialidad (especialidad__iexact)',
+         Medico.objects.filter(especialidad__iexact=medico[1])),
+        ('ocupacion_rango', 'DisponibilidadHorariosView ?fecha_desde&fecha_hasta',
+         OcupacionMedico.objects.filter(
+             id_medico__in=[medico[0]], fecha__gte=hoy, fecha__lte=hoy + datetime.timedelta(days=30)
+         )),
+        ('otras_citas_activas', 'liberar_horario (cancelar y reprogramar)',
+         activas.filter(id_medico=medico[0], fecha=hoy, hora__hour=9)),
+        ('citas_activas_dia', 'agenda del día (fecha + hora)',
+         activas.filter(fecha=hoy).order_by('hora')),
+        ('recordatorios_dia', 'generar_recordatorios (citas confirmadas de un día)',
+         Cita.objects.filter(fecha=hoy, estado='confirmada')),
+        ('citas_especialidad_fecha', 'citas por especialidad del médico y fecha',
+         Cita.objects.filter(id_medico__especialidad__iexact=medico[1], fecha=hoy)),
+        ('listado_citas_fecha', 'CitaViewSet ?ordering=fecha (cursor)',
+         Cita.objects.order_by('fecha', 'id_cita')[:11]),
+        ('busqueda_paciente', 'CitaViewSet ?campo=paciente',
+         Cita.objects.filter(id_paciente__nombre__icontains='ana')),
+    ]
+    if any(f.name == 'refcita' for f in Cita._meta.fields):
+        consultas.append(('busqueda_refcita', 'CitaViewSet ?campo=refcita',
+                          Cita.objects.filter(refcita__startswith='A1')))
+    return consultas
+
+
+class Command(BaseCommand):
+    help = 'Comprueba con EXPLAIN que las consultas frecuentes de las vistas usan índices (PostgreSQL).'
+
+    def handle(self, *args, **opciones):
+        if connection.vendor != 'postgresql':
+            raise CommandError('La comprobación de planes requiere PostgreSQL.')
+
+        fallos = []
+        for nombre, origen, queryset in consultas_frecuentes():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+                transaction.set_rollback(True)
+
+            if 'Seq Scan' in plan:
+                fallos.append(nombre)
+                self.stdout.write(self.style.ERROR(f'{nombre} ({origen}): sin índice'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{nombre} ({origen}): OK'))
+                if opciones['verbosity'] > 1:
+                    self.stdout.write(plan)
+
+        if fallos:
+            raise CommandError(f'Consultas sin índice: {", ".join(fallos)}.')
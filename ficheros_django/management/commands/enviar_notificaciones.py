@@ -0,0 +1,83 @@
+import json
+import signal
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from ...notificaciones import LOTE, MetricasEnvio, cargar_transporte, enviar_pendientes
+
+# Envío de las notificaciones pendientes (bandeja de salida de notificaciones.py).
+#
+# Cada hilo del grupo repite: tomar un lote de pendientes (SELECT ... FOR
+# UPDATE SKIP LOCKED), enviarlo con el transporte configurado y anotar el
+# resultado. Cuando no hay pendientes espera --intervalo segundos. Se pueden
+# lanzar varios procesos a la vez: SKIP LOCKED reparte los lotes entre todos.
+
+
+class Command(BaseCommand):
+    help = 'Envía las notificaciones pendientes con un grupo de hilos (reintentos con espera exponencial).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos de envío (por defecto 4).')
+        parser.add_argument('--lote', type=int, default=LOTE, help=f'Notificaciones por lote (por defecto {LOTE}).')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos de espera cuando no hay pendientes (por defecto 2).')
+        parser.add_argument('--informe', type=float, default=60.0,
+                            help='Segundos entre informes de rendimiento (por defecto 60).')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Envía lo pendiente y termina, sin esperar nuevas notificaciones.')
+        parser.add_argument('--transporte', help='Ruta de la clase de transporte (por defecto NOTIFICACIONES_TRANSPORTE).')
+
+    def handle(self, *args, **opciones):
+        if opciones['hilos'] < 1 or opciones['lote'] < 1:
+            raise CommandError('--hilos y --lote deben ser mayores que 0.')
+        try:
+            transporte = cargar_transporte(opciones['transporte'])
+        except ImportError as e:
+            raise CommandError(f'Transporte no válido: {e}')
+
+        hilos = opciones['hilos']
+        if hilos > 1 and not connection.features.has_select_for_update_skip_locked:
+            # Sin SKIP LOCKED (SQLite) dos hilos tomarían el mismo lote
+            self.stderr.write(self.style.WARNING('La base de datos no admite SKIP LOCKED: se usa un solo hilo.'))
+            hilos = 1
+
+        metricas = MetricasEnvio()
+        parar = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for senal in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(senal, lambda *_: parar.set())
+
+        self.stdout.write(f'Enviando notificaciones con {hilos} hilo(s) y lotes de {opciones["lote"]}.')
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='notificaciones') as grupo:
+            trabajos = [
+                grupo.submit(self.trabajador, transporte, metricas, parar, opciones) for _ in range(hilos)
+            ]
+            pendientes = trabajos
+            while pendientes:
+                _, pendientes = wait(pendientes, timeout=opciones['informe'], return_when=FIRST_EXCEPTION)
+                if any(trabajo.done() and trabajo.exception() for trabajo in trabajos):
+                    parar.set()  # Un hilo ha fallado (p. ej. base de datos caída): se detienen todos
+                elif pendientes:
+                    self.informar(metricas)
+
+        for trabajo in trabajos:
+            if trabajo.exception():
+                raise CommandError(f'Error en el envío de notificaciones: {trabajo.exception()}')
+        self.informar(metricas)
+
+    def trabajador(self, transporte, metricas, parar, opciones):
+        try:
+            while not parar.is_set():
+                if enviar_pendientes(transporte, metricas, opciones['lote']):
+                    continue
+                if opciones['una_vez']:
+                    break
+                parar.wait(opciones['intervalo'])
+        finally:
+            connections.close_all()  # Conexiones de este hilo
+
+    def informar(self, metricas):
+        self.stdout.write(json.dumps(metricas.resumen()))
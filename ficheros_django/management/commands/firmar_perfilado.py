@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...perfilado import VALIDEZ, firma_perfilado
+
+# Firma para perfilar una petición (perfilado.py), p. ej.:
+#   curl -H "X-Perfilar: $(python manage.py firmar_perfilado)" \
+#        -H "X-Perfilar-Modo: muestreo" https://.../cita/
+# La firma usa SECRET_KEY: solo puede generarla quien tiene acceso al servidor.
+
+
+class Command(BaseCommand):
+    help = 'Muestra el valor de la cabecera X-Perfilar para perfilar peticiones.'
+
+    def handle(self, *args, **opciones):
+        if not getattr(settings, 'PERFILADO_DIRECTORIO', None):
+            self.stderr.write('Aviso: PERFILADO_DIRECTORIO no está definido; las peticiones no se perfilarán.')
+        self.stderr.write(f'Válida durante {VALIDEZ} segundos.')
+        self.stdout.write(firma_perfilado())
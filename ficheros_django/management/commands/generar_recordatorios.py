@@ -0,0 +1,54 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ...notificaciones import RECORDATORIOS_LOTE, generar_recordatorios
+
+# Genera los recordatorios de las citas del día siguiente (o de las fechas
+# indicadas). Pensado para ejecutarse a diario desde cron o un planificador:
+#   python manage.py generar_recordatorios
+# Los recordatorios quedan pendientes en notificaciones y los envía el
+# comando enviar_notificaciones. Se puede repetir sin crear duplicados.
+
+
+class Command(BaseCommand):
+    help = 'Crea los recordatorios de las citas confirmadas de mañana (o de --fecha y los --dias siguientes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Primera fecha (YYYY-MM-DD). Por defecto, mañana.')
+        parser.add_argument('--dias', type=int, default=1, help='Número de días a partir de --fecha (por defecto 1).')
+        parser.add_argument('--lote', type=int, default=RECORDATORIOS_LOTE,
+                            help=f'Citas por lote (por defecto {RECORDATORIOS_LOTE}).')
+
+    def handle(self, *args, **opciones):
+        if opciones['fecha']:
+            fecha = parse_date(opciones['fecha'])
+            if not fecha:
+                raise CommandError('--fecha debe tener el formato YYYY-MM-DD.')
+        else:
+            fecha = timezone.localdate() + datetime.timedelta(days=1)
+        if opciones['dias'] < 1 or opciones['lote'] < 1:
+            raise CommandError('--dias y --lote deben ser mayores que 0.')
+
+        total_citas = total_creados = 0
+        inicio_total = time.perf_counter()
+        for dia in range(opciones['dias']):
+            actual = fecha + datetime.timedelta(days=dia)
+            inicio = time.perf_counter()
+            citas, creados = generar_recordatorios(actual, opciones['lote'])
+            segundos = time.perf_counter() - inicio
+            total_citas += citas
+            total_creados += creados
+            self.stdout.write(
+                f'{actual.isoformat()}: {citas} citas, {creados} recordatorios nuevos '
+                f'en {segundos:.2f} s ({citas / segundos if segundos else 0:.0f} filas/s)'
+            )
+
+        segundos = time.perf_counter() - inicio_total
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {total_citas} citas, {total_creados} recordatorios nuevos en {segundos:.2f} s '
+            f'({total_citas / segundos if segundos else 0:.0f} filas/s).'
+        ))
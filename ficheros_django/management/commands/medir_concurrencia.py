@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+import json
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+
+from .medir_rendimiento import Datos, _commit, percentil
+
+# Rendimiento con peticiones concurrentes contra un servidor en marcha.
+#
+# A diferencia de medir_rendimiento (cliente de pruebas, una petición tras
+# otra), aquí se abren --concurrencia conexiones HTTP keep-alive y se lanzan
+# las peticiones en paralelo, para comparar el modo síncrono (WSGI) con el
+# asíncrono (ASGI, CONSULTORIO_ASINCRONO=1) con el mismo número de procesos:
+#
+#   gunicorn consultorio.wsgi -w 4
+#   python manage.py medir_concurrencia --modo wsgi --salida wsgi.json
+#
+#   CONSULTORIO_ASINCRONO=1 gunicorn consultorio.asgi -w 4 -k uvicorn.workers.UvicornWorker
+#   python manage.py medir_concurrencia --modo asgi --comparar wsgi.json
+#
+# Solo se miden lecturas: la base de datos no cambia entre ejecuciones.
+
+ESCENARIOS = {
+    # nombre: (nombre de la URL, generador de parámetros)
+    'disponibilidad': ('disponibilidad_horarios', lambda datos, i: {
+        'especialidad': datos.medico(i)[1],
+        'fecha': (datos.primera_fecha - datetime.timedelta(days=i % 60)).isoformat(),
+    }),
+    'disponibilidad_rango': ('disponibilidad_horarios', lambda datos, i: {
+        'especialidad': datos.medico(i)[1],
+        'fecha_desde': (datetime.date.today() + datetime.timedelta(days=i % 30)).isoformat(),
+        'fecha_hasta': (datetime.date.today() + datetime.timedelta(days=i % 30 + 30)).isoformat(),
+    }),
+    'consultar_citas_paciente': ('cancelar_reprogramar_cita', lambda datos, i: {'id_paciente': datos.cita(i)[1]}),
+    'consultar_citas_medico_resumen': ('cancelar_reprogramar_cita', lambda datos, i: {
+        'id_medico': datos.cita(i)[2], 'vista': 'resumen',
+    }),
+    'obtener_cita': ('obtener_cita', lambda datos, i: {'id_cita': datos.cita(i)[0]}),
+}
+
+
+async def _leer_respuesta(lector):
+    # Devuelve el código de estado y consume el cuerpo (Content-Length o chunked)
+    estado = int((await lector.readline()).split()[1])
+    cabeceras = {}
+    while (linea := await lector.readline()) not in (b'\r\n', b''):
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip()
+    if cabeceras.get('transfer-encoding') == 'chunked':
+        while tamano := int((await lector.readline()).strip(), 16):
+            await lector.readexactly(tamano + 2)
+        await lector.readline()
+    else:
+        await lector.readexactly(int(cabeceras.get('content-length', 0)))
+    return estado, cabeceras.get('connection') == 'close'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento (peticiones/s) y la latencia de los endpoints de lectura '
+        'con peticiones concurrentes contra un servidor WSGI o ASGI en marcha.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor (por defecto http://127.0.0.1:8000).')
+        parser.add_argument('--concurrencia', type=int, default=50, help='Conexiones simultáneas (por defecto 50).')
+        parser.add_argument('--peticiones', type=int, default=2000, help='Peticiones medidas por escenario.')
+        parser.add_argument('--calentamiento', type=int, default=100, help='Peticiones previas no medidas.')
+        parser.add_argument('--escenarios', nargs='*', help='Escenarios a ejecutar (por defecto todos).')
+        parser.add_argument('--modo', default='', help='Etiqueta de la ejecución (p. ej. wsgi o asgi).')
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto concurrencia-<modo>-<commit>.json).')
+        parser.add_argument('--comparar', help='JSON de otra ejecución (p. ej. el otro modo) con el que comparar.')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **opciones):
+        nombres = opciones['escenarios'] or list(ESCENARIOS)
+        desconocidos = set(nombres) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}.')
+        if opciones['concurrencia'] < 1 or opciones['peticiones'] < 1:
+            raise CommandError('--concurrencia y --peticiones deben ser mayores que 0.')
+        servidor = urlsplit(opciones['url'])
+        if servidor.scheme != 'http' or not servidor.hostname:
+            raise CommandError('--url debe ser una URL http:// (p. ej. http://127.0.0.1:8000).')
+
+        datos = Datos(opciones['semilla'])
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit(),
+            'modo': opciones['modo'],
+            'url': opciones['url'],
+            'concurrencia': opciones['concurrencia'],
+            'peticiones': opciones['peticiones'],
+            'escenarios': {},
+        }
+        for nombre in nombres:
+            url, generar = ESCENARIOS[nombre]
+            try:
+                ruta = reverse(url)
+            except NoReverseMatch:
+                self.stdout.write(f'{nombre}: omitido (la URL no existe en este proyecto)')
+                continue
+            rutas = [
+                f'{ruta}?{urlencode(generar(datos, i))}'
+                for i in range(opciones['calentamiento'] + opciones['peticiones'])
+            ]
+            medicion = asyncio.run(self.medir(servidor, rutas, opciones['calentamiento'], opciones['concurrencia']))
+            resultado['escenarios'][nombre] = medicion
+            self.stdout.write(
+                f'{nombre}: {medicion["peticiones_s"]} pet/s, p50 {medicion["p50_ms"]} ms, '
+                f'p95 {medicion["p95_ms"]} ms, p99 {medicion["p99_ms"]} ms, estados {medicion["estados"]}'
+            )
+
+        salida = Path(opciones['salida'] or f'concurrencia-{opciones["modo"] or "local"}-{resultado["commit"] or "local"}.json')
+        salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+        if opciones['comparar']:
+            self.comparar(resultado, opciones['comparar'])
+
+    async def medir(self, servidor, rutas, calentamiento, concurrencia):
+        cabecera = f'Host: {servidor.netloc}\r\nAccept: application/json\r\nConnection: keep-alive\r\n\r\n'
+        siguiente = iter(enumerate(rutas))  # Compartido por todas las conexiones
+        tiempos, estados = [], {}
+
+        async def conexion():
+            lector = escritor = None
+            for i, ruta in siguiente:
+                if escritor is None:
+                    lector, escritor = await asyncio.open_connection(servidor.hostname, servidor.port or 80)
+                t = time.perf_counter()
+                try:
+                    escritor.write(f'GET {ruta} HTTP/1.1\r\n{cabecera}'.encode())
+                    estado, cerrar = await _leer_respuesta(lector)
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                    estado, cerrar = 'error', True
+                if i >= calentamiento:
+                    tiempos.append((time.perf_counter() - t) * 1000)
+                    estados[estado] = estados.get(estado, 0) + 1
+                if cerrar:  # El servidor cierra la conexión: se abre otra
+                    escritor.close()
+                    lector = escritor = None
+            if escritor is not None:
+                escritor.close()
+
+        try:
+            conexiones = [conexion() for _ in range(concurrencia)]
+            inicio = time.perf_counter()
+            await asyncio.gather(*conexiones)
+        except OSError as e:
+            raise CommandError(f'No se puede conectar con el servidor: {e}')
+        # El tiempo incluye el calentamiento: el rendimiento se calcula sobre todas las peticiones
+        total = time.perf_counter() - inicio
+
+        tiempos.sort()
+        return {
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'media_ms': round(sum(tiempos) / len(tiempos), 2),
+            'peticiones_s': round(len(rutas) / total, 1),
+            'estados': {str(codigo): n for codigo, n in sorted(estados.items(), key=lambda e: str(e[0]))},
+        }
+
+    def comparar(self, resultado, fichero):
+        with open(fichero, encoding='utf-8') as f:
+            anterior = json.load(f)
+        self.stdout.write(
+            f'Comparación con {fichero} (modo {anterior.get("modo") or "?"}, '
+            f'concurrencia {anterior.get("concurrencia")}):'
+        )
+        for nombre, actual in resultado['escenarios'].items():
+            base = anterior.get('escenarios', {}).get(nombre)
+            if not base:
+                continue
+            ratio = actual['peticiones_s'] / base['peticiones_s'] if base['peticiones_s'] else 0
+            self.stdout.write(
+                f'  {nombre}: {base["peticiones_s"]} -> {actual["peticiones_s"]} pet/s (x{ratio:.2f}), '
+                f'p95 {base["p95_ms"]} -> {actual["p95_ms"]} ms'
+            )
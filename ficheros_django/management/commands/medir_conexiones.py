@@ -0,0 +1,125 @@
+import datetime
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from .medir_rendimiento import _commit, percentil
+
+# Coste de la conexión a la base de datos por petición.
+#
+# Compara dos ciclos de petición con la misma consulta (SELECT 1):
+# - sin reutilizar: conexión nueva en cada petición (handshake TCP,
+#   autenticación e inicialización de la sesión), como sin CONN_MAX_AGE;
+# - configurada: la configuración actual (DB_POOL, DB_CONN_MAX_AGE,
+#   DB_POOL_MAX...).
+# Las dos siguen el ciclo de una petición de Django (request_started y
+# request_finished, que cierran o devuelven al grupo las conexiones).
+# La diferencia de latencia es el coste de conexión que se ahorra. Para
+# comparar configuraciones, se ejecuta con distintas variables de entorno:
+#   DB_POOL=ninguno python manage.py medir_conexiones
+#   DB_POOL=persistente python manage.py medir_conexiones
+#   DB_POOL=psycopg python manage.py medir_conexiones
+
+
+@contextmanager
+def sin_reutilizar_conexiones():
+    # Sin CONN_MAX_AGE ni grupo mientras dura el bloque: conexión nueva por petición
+    ajustes = connection.settings_dict
+    conn_max_age, opciones = ajustes.get('CONN_MAX_AGE', 0), ajustes['OPTIONS']
+    connection.close()
+    ajustes['CONN_MAX_AGE'] = 0
+    ajustes['OPTIONS'] = {clave: valor for clave, valor in opciones.items() if clave != 'pool'}
+    try:
+        yield
+    finally:
+        connection.close()
+        ajustes['CONN_MAX_AGE'], ajustes['OPTIONS'] = conn_max_age, opciones
+
+
+class Command(BaseCommand):
+    help = 'Mide el coste de conexión a la base de datos por petición con la configuración actual (DB_POOL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=500, help='Peticiones por medición (por defecto 500).')
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto conexiones-<DB_POOL>-<commit>.json).')
+
+    def handle(self, *args, **opciones):
+        if opciones['peticiones'] < 1:
+            raise CommandError('--peticiones debe ser mayor que 0.')
+        pool = getattr(settings, 'DB_POOL', None)
+        peticiones = opciones['peticiones']
+
+        with sin_reutilizar_conexiones():
+            sin_reutilizar = self.medir(peticiones)
+        configurada = self.medir(peticiones)
+
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit(),
+            'motor': connection.vendor,
+            'db_pool': pool,
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+            'peticiones': peticiones,
+            'sin_reutilizar': sin_reutilizar,
+            'configurada': configurada,
+            'ahorro_ms': round(sin_reutilizar['media_ms'] - configurada['media_ms'], 3),
+        }
+        for nombre in ('sin_reutilizar', 'configurada'):
+            medicion = resultado[nombre]
+            self.stdout.write(
+                f'{nombre}: p50 {medicion["p50_ms"]} ms, p95 {medicion["p95_ms"]} ms, '
+                f'media {medicion["media_ms"]} ms, {medicion["peticiones_s"]} pet/s'
+            )
+        self.stdout.write(
+            f'Conexiones abiertas con DB_POOL={pool}: {configurada["conexiones_abiertas"]} en {peticiones} peticiones; '
+            f'ahorro {resultado["ahorro_ms"]} ms por petición.'
+        )
+
+        salida = Path(opciones['salida'] or f'conexiones-{pool}-{resultado["commit"] or "local"}.json')
+        salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+    def peticion(self):
+        # Mismo ciclo que una petición real: Django cierra (o devuelve al grupo)
+        # las conexiones caducadas al empezar y al terminar la petición
+        request_started.send(sender=self.__class__)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+        finally:
+            request_finished.send(sender=self.__class__)
+
+    def medir(self, peticiones):
+        tiempos, abiertas = [], []
+
+        def contar(sender, connection, **kwargs):
+            abiertas.append(connection.alias)
+
+        connection_created.connect(contar)
+        try:
+            inicio = time.perf_counter()
+            for _ in range(peticiones):
+                t = time.perf_counter()
+                self.peticion()
+                tiempos.append((time.perf_counter() - t) * 1000)
+            total = time.perf_counter() - inicio
+        finally:
+            connection_created.disconnect(contar)
+            connection.close()
+
+        tiempos.sort()
+        return {
+            'p50_ms': round(percentil(tiempos, 50), 3),
+            'p95_ms': round(percentil(tiempos, 95), 3),
+            'media_ms': round(sum(tiempos) / len(tiempos), 3),
+            'peticiones_s': round(peticiones / total, 1),
+            'conexiones_abiertas': len(abiertas),
+        }
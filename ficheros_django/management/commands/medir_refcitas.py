@@ -0,0 +1,117 @@
+import datetime
+import json
+import time
+import uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...models import Cita, Medico, Paciente
+from ...referencias import generar_refcitas
+from .medir_rendimiento import _commit
+
+# Rendimiento de inserción de citas según cómo se genera refcita
+# (solo esquema de Actividad 3).
+#
+# - uuid: el esquema anterior, 11 caracteres hexadecimales aleatorios.
+# - secuencia: referencias.py (secuencia en base32 con carácter de control).
+# Para cada esquema se insertan --citas citas con bulk_create en lotes de
+# --lote y --individuales con Cita.save() (una referencia cada vez). En
+# PostgreSQL también se mide cuánto crece el índice único de refcita: con
+# valores aleatorios las páginas se dividen por todo el índice. Todo se
+# deshace al terminar; para que el crecimiento del índice no dependa del
+# esquema medido antes, conviene medir cada esquema por separado (--esquemas).
+
+ESQUEMAS = {
+    'uuid': lambda cantidad: [str(uuid.uuid4())[:12].replace('-', '').upper() for _ in range(cantidad)],
+    'secuencia': generar_refcitas,
+}
+
+SQL_TAMANO_INDICE = """
+    SELECT pg_relation_size(i.indexrelid)
+    FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = 'cita'::regclass AND i.indisunique AND i.indnatts = 1 AND a.attname = 'refcita'
+"""
+
+
+def _tamano_indice():
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_TAMANO_INDICE)
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+class Command(BaseCommand):
+    help = 'Compara el rendimiento de inserción de citas con el esquema de refcita anterior (uuid) y el actual.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, default=20000, help='Citas insertadas con bulk_create por esquema.')
+        parser.add_argument('--lote', type=int, default=500, help='Citas por bulk_create (por defecto 500).')
+        parser.add_argument('--individuales', type=int, default=1000, help='Citas insertadas una a una con save().')
+        parser.add_argument('--esquemas', nargs='*', help='Esquemas a medir (por defecto todos).')
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto refcitas-<commit>.json).')
+
+    def handle(self, *args, **opciones):
+        if not any(f.name == 'refcita' for f in Cita._meta.fields):
+            raise CommandError('El modelo Cita no tiene refcita (esquema de Actividad 2).')
+        nombres = opciones['esquemas'] or list(ESQUEMAS)
+        desconocidos = set(nombres) - set(ESQUEMAS)
+        if desconocidos:
+            raise CommandError(f'Esquemas desconocidos: {", ".join(sorted(desconocidos))}.')
+        if opciones['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0.')
+        paciente = Paciente.objects.values_list('pk', flat=True).first()
+        medico = Medico.objects.values_list('pk', flat=True).first()
+        if not (paciente and medico):
+            raise CommandError('La base de datos está vacía: use el comando cargar_datos.')
+
+        # Canceladas: no ocupan horario, así que todas pueden tener el mismo
+        def cita(refcita=''):
+            return Cita(
+                id_paciente_id=paciente, id_medico_id=medico, fecha=datetime.date(2099, 1, 1),
+                hora=datetime.time(9), especialidad='Prueba', estado='cancelada', refcita=refcita,
+            )
+
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit(),
+            'motor': connection.vendor,
+            'citas': opciones['citas'],
+            'lote': opciones['lote'],
+            'individuales': opciones['individuales'],
+            'esquemas': {},
+        }
+        for nombre in nombres:
+            generar = ESQUEMAS[nombre]
+            with transaction.atomic():
+                indice_antes = _tamano_indice()
+                inicio = time.perf_counter()
+                for desde in range(0, opciones['citas'], opciones['lote']):
+                    cantidad = min(opciones['lote'], opciones['citas'] - desde)
+                    Cita.objects.bulk_create([cita(refcita) for refcita in generar(cantidad)])
+                lotes = time.perf_counter() - inicio
+                indice_despues = _tamano_indice()
+
+                inicio = time.perf_counter()
+                for _ in range(opciones['individuales']):
+                    cita(generar(1)[0]).save()
+                individuales = time.perf_counter() - inicio
+                transaction.set_rollback(True)
+
+            medicion = {
+                'bulk_filas_s': round(opciones['citas'] / lotes) if lotes else None,
+                'save_filas_s': round(opciones['individuales'] / individuales) if individuales else None,
+                'indice_bytes': indice_despues - indice_antes if indice_antes is not None else None,
+            }
+            resultado['esquemas'][nombre] = medicion
+            self.stdout.write(
+                f'{nombre}: bulk_create {medicion["bulk_filas_s"]} filas/s, save() {medicion["save_filas_s"]} filas/s'
+                + (f', índice +{medicion["indice_bytes"] // 1024} KiB' if medicion['indice_bytes'] is not None else '')
+            )
+
+        salida = Path(opciones['salida'] or f'refcitas-{resultado["commit"] or "local"}.json')
+        salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
@@ -0,0 +1,392 @@
+import datetime
+import json
+import logging
+import math
+import platform
+import random
+import subprocess
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+
+from ...disponibilidad import HORARIO_LABORAL
+from ...instrumentacion import ContadorConsultas
+from ...models import Cita, Medico, Paciente
+
+# Banco de pruebas de rendimiento de los endpoints REST.
+#
+# Cada escenario lanza N peticiones con el cliente de pruebas de Django
+# (sin red ni servidor) contra la base de datos configurada y mide la
+# latencia (p50/p95/p99), el rendimiento secuencial (peticiones/s) y las
+# consultas SQL por petición. Los escenarios cuya URL no existe en el
+# proyecto (Actividad 2 o Actividad 3) se omiten. Las escrituras se
+# deshacen al terminar, así que la base de datos queda como estaba y las
+# mediciones de distintos commits son comparables.
+
+ESCENARIOS = {}
+
+
+def escenario(nombre, url, metodo='get'):
+    """Registra un escenario: `nombre` de la medición, nombre de la URL y método HTTP."""
+    def registrar(funcion):
+        ESCENARIOS[nombre] = (url, metodo, funcion)
+        return funcion
+    return registrar
+
+
+class Datos:
+    """
+    Muestra de identificadores de la base de datos y generador de horarios
+    libres para los escenarios de escritura.
+    """
+
+    def __init__(self, semilla):
+        aleatorio = random.Random(semilla)
+        self.medicos = list(Medico.objects.values_list('pk', 'especialidad')[:1000])
+        self.pacientes = list(Paciente.objects.values_list('pk', 'nombre')[:1000])
+        citas = list(Cita.objects.values_list('pk', 'id_paciente', 'id_medico')[:10000])
+        if not (self.medicos and self.pacientes and citas):
+            raise CommandError('La base de datos está vacía: use --sembrar o el comando cargar_datos.')
+        aleatorio.shuffle(citas)
+        self.citas = citas
+        self.horas = HORARIO_LABORAL
+
+        # Los horarios nuevos empiezan tras la última cita: nunca hay conflicto
+        ultima = Cita.objects.aggregate(ultima=Max('fecha'))['ultima']
+        self.primera_fecha = max(datetime.date.today(), ultima) + datetime.timedelta(days=1)
+        self.huecos = 0
+
+    def hueco(self):
+        # Cada llamada devuelve una (fecha, hora) distinta
+        dia, hora = divmod(self.huecos, len(self.horas))
+        self.huecos += 1
+        return (self.primera_fecha + datetime.timedelta(days=dia)).isoformat(), self.horas[hora]
+
+    def cita(self, i):
+        return self.citas[i % len(self.citas)]
+
+    def medico(self, i):
+        return self.medicos[i % len(self.medicos)]
+
+    def paciente(self, i):
+        return self.pacientes[i % len(self.pacientes)]
+
+
+# --- Actividad 2 (ficheros_django) ---
+
+@escenario('agendar_cita', 'agendar_cita', 'post')
+def agendar_cita(datos, i):
+    id_medico, especialidad = datos.medico(i)
+    fecha, hora = datos.hueco()
+    return {}, {
+        'id_paciente_id': datos.paciente(i)[0], 'id_medico_id': id_medico,
+        'fecha': fecha, 'hora': hora, 'especialidad': especialidad, 'estado': 'confirmada',
+    }
+
+
+@escenario('disponibilidad', 'disponibilidad_horarios')
+def disponibilidad(datos, i):
+    fecha, _ = datos.hueco()
+    return {'especialidad': datos.medico(i)[1], 'fecha': fecha}, None
+
+
+@escenario('disponibilidad_rango', 'disponibilidad_horarios')
+def disponibilidad_rango(datos, i):
+    desde = datetime.date.today() + datetime.timedelta(days=i % 30)
+    return {
+        'especialidad': datos.medico(i)[1],
+        'fecha_desde': desde.isoformat(),
+        'fecha_hasta': (desde + datetime.timedelta(days=30)).isoformat(),
+    }, None
+
+
+# Cita automática (citas/huecos/ en Actividad 2, cita/huecos/ en Actividad 3)
+@escenario('huecos', 'cita_automatica')
+@escenario('cita_huecos', 'cita-huecos')
+def huecos(datos, i):
+    return {'especialidad': datos.medico(i)[1], 'cantidad': 5}, None
+
+
+@escenario('cita_automatica', 'cita_automatica', 'post')
+@escenario('cita_huecos_reservar', 'cita-huecos', 'post')
+def cita_automatica(datos, i):
+    return {}, {'id_paciente': datos.paciente(i)[0], 'especialidad': datos.medico(i)[1]}
+
+
+@escenario('consultar_citas_paciente', 'cancelar_reprogramar_cita')
+def consultar_citas_paciente(datos, i):
+    return {'id_paciente': datos.cita(i)[1]}, None
+
+
+@escenario('consultar_citas_medico_resumen', 'cancelar_reprogramar_cita')
+def consultar_citas_medico_resumen(datos, i):
+    return {'id_medico': datos.cita(i)[2], 'vista': 'resumen'}, None
+
+
+@escenario('reprogramar_cita', 'cancelar_reprogramar_cita', 'patch')
+def reprogramar_cita(datos, i):
+    fecha, hora = datos.hueco()
+    return {}, {'id_cita': datos.cita(i)[0], 'fecha': fecha, 'hora': hora}
+
+
+@escenario('cancelar_cita', 'cancelar_reprogramar_cita', 'delete')
+def cancelar_cita(datos, i):
+    # Recorre las citas desde el final para no repetir las ya reprogramadas
+    return {'id_cita': datos.cita(-1 - i)[0]}, None
+
+
+@escenario('crear_paciente', 'gestionar_paciente', 'post')
+def crear_paciente(datos, i):
+    marca = f'{time.time_ns()}{i}'
+    return {}, {
+        'nombre': 'Prueba', 'apellido': 'Rendimiento', 'email': f'rendimiento.{marca}@example.com',
+        'telefono': '600000000', 'contrasena': 'clave', 'dni': marca[-8:] + 'R',
+    }
+
+
+@escenario('importar_pacientes_100', 'gestionar_paciente', 'post')
+def importar_pacientes_100(datos, i):
+    return {}, [crear_paciente(datos, i * 100 + n)[1] for n in range(100)]
+
+
+# --- Actividad 3 (ViewSets) ---
+
+@escenario('cita_listado', 'cita-list')
+def cita_listado(datos, i):
+    return {}, None
+
+
+@escenario('cita_listado_resumen', 'cita-list')
+def cita_listado_resumen(datos, i):
+    return {'vista': 'resumen', 'ordering': '-fecha'}, None
+
+
+@escenario('cita_busqueda_paciente', 'cita-list')
+def cita_busqueda_paciente(datos, i):
+    return {'campo': 'paciente', 'busqueda': datos.paciente(i)[1]}, None
+
+
+@escenario('cita_detalle', 'cita-detail')
+def cita_detalle(datos, i):
+    return {'pk': datos.cita(i)[0]}, None
+
+
+@escenario('cita_crear', 'cita-list', 'post')
+def cita_crear(datos, i):
+    return agendar_cita(datos, i)
+
+
+@escenario('cita_lote_100', 'cita-lote', 'post')
+def cita_lote_100(datos, i):
+    operaciones = []
+    for n in range(100):
+        _, cita = agendar_cita(datos, i * 100 + n)
+        operaciones.append({'operacion': 'crear', **cita})
+    return {}, operaciones
+
+
+@escenario('medico_listado', 'medico-list')
+def medico_listado(datos, i):
+    return {}, None
+
+
+@escenario('paciente_detalle', 'paciente-detail')
+def paciente_detalle(datos, i):
+    return {'pk': datos.paciente(i)[0]}, None
+
+
+# Autocompletado frente a descargar el listado completo de pacientes
+@escenario('paciente_listado', 'paciente-list')
+def paciente_listado(datos, i):
+    return {}, None
+
+
+@escenario('paciente_buscar', 'paciente-buscar')
+def paciente_buscar(datos, i):
+    return {'q': datos.paciente(i)[1][:4]}, None  # Lo que se lleva escrito
+
+
+@escenario('paciente_buscar_errata', 'paciente-buscar')
+def paciente_buscar_errata(datos, i):
+    nombre = datos.paciente(i)[1]
+    return {'q': nombre[1] + nombre[0] + nombre[2:]}, None  # Dos letras intercambiadas
+
+
+@escenario('medico_buscar', 'medico-buscar')
+def medico_buscar(datos, i):
+    return {'q': datos.medico(i)[1][:5]}, None
+
+
+class ContadorSinSavepoints(ContadorConsultas):
+    """
+    Cuenta las consultas sin los SAVEPOINT: las mediciones se ejecutan dentro
+    de una transacción que se deshace al final, y cada transaction.atomic()
+    de las vistas se convierte en un savepoint que en producción no existe.
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'SAVEPOINT' in sql[:30].upper():
+            return execute(sql, params, many, context)
+        return super().__call__(execute, sql, params, many, context)
+
+
+def percentil(valores, p):
+    # Percentil por rango más cercano sobre una lista ordenada
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia (p50/p95/p99), el rendimiento y las consultas por petición '
+        'de los endpoints REST y guarda el resultado en JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=200, help='Peticiones medidas por escenario.')
+        parser.add_argument('--calentamiento', type=int, default=20, help='Peticiones previas no medidas.')
+        parser.add_argument('--escenarios', nargs='*', help='Escenarios a ejecutar (por defecto todos).')
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto rendimiento-<commit>.json).')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior con el que comparar.')
+        parser.add_argument('--umbral', type=float, default=0.10,
+                            help='Empeoramiento relativo de p95 que se considera regresión (0.10 = 10%%).')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--sembrar', action='store_true',
+                            help='Vacía la base de datos y la rellena con cargar_datos antes de medir.')
+        parser.add_argument('--medicos', type=int, default=50, help='Médicos a sembrar.')
+        parser.add_argument('--pacientes', type=int, default=10000, help='Pacientes a sembrar.')
+        parser.add_argument('--citas', type=int, default=100000, help='Citas a sembrar.')
+
+    def handle(self, *args, **opciones):
+        nombres = opciones['escenarios'] or list(ESCENARIOS)
+        desconocidos = set(nombres) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}.')
+
+        if opciones['sembrar']:
+            call_command(
+                'cargar_datos', vaciar=True, medicos=opciones['medicos'],
+                pacientes=opciones['pacientes'], citas=opciones['citas'], sin_fixtures=True, stdout=self.stdout,
+            )
+
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit(),
+            'entorno': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'motor': connection.vendor,
+                'plataforma': platform.platform(),
+            },
+            'tamanos': {m._meta.db_table: m.objects.count() for m in (Medico, Paciente, Cita)},
+            'iteraciones': opciones['iteraciones'],
+            'escenarios': {},
+        }
+
+        cliente = Client(HTTP_HOST='localhost')
+        # Las respuestas 4xx esperadas (p. ej. conflictos) no se escriben en el log
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        # Las escrituras de las mediciones se deshacen al terminar
+        with transaction.atomic():
+            datos = Datos(opciones['semilla'])
+            for nombre in nombres:
+                medicion = self.medir(cliente, datos, nombre, opciones['calentamiento'], opciones['iteraciones'])
+                if medicion is None:
+                    self.stdout.write(f'{nombre}: omitido (la URL no existe en este proyecto)')
+                    continue
+                resultado['escenarios'][nombre] = medicion
+                self.stdout.write(
+                    f'{nombre}: p50 {medicion["p50_ms"]} ms, p95 {medicion["p95_ms"]} ms, '
+                    f'p99 {medicion["p99_ms"]} ms, {medicion["peticiones_s"]} pet/s, '
+                    f'{medicion["consultas"]} consultas, estados {medicion["estados"]}'
+                )
+            transaction.set_rollback(True)
+
+        salida = Path(opciones['salida'] or f'rendimiento-{resultado["commit"] or "local"}.json')
+        salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+        if opciones['comparar']:
+            self.comparar(resultado, opciones['comparar'], opciones['umbral'])
+
+    def medir(self, cliente, datos, nombre, calentamiento, iteraciones):
+        url, metodo, generar = ESCENARIOS[nombre]
+
+        def peticion(i):
+            parametros, cuerpo = generar(datos, i)
+            kwargs = {'pk': parametros.pop('pk')} if 'pk' in parametros else {}
+            ruta = reverse(url, kwargs=kwargs)
+            if metodo in ('get', 'delete'):
+                return getattr(cliente, metodo)(f'{ruta}?{urlencode(parametros)}')
+            return getattr(cliente, metodo)(ruta, json.dumps(cuerpo), content_type='application/json')
+
+        try:
+            reverse(url, kwargs={'pk': 1} if url.endswith('-detail') else {})
+        except NoReverseMatch:
+            return None
+
+        for i in range(calentamiento):
+            peticion(i)
+
+        tiempos, consultas, estados = [], [], {}
+        inicio = time.perf_counter()
+        for i in range(calentamiento, calentamiento + iteraciones):
+            contador = ContadorSinSavepoints()
+            with connection.execute_wrapper(contador):
+                t = time.perf_counter()
+                respuesta = peticion(i)
+                tiempos.append((time.perf_counter() - t) * 1000)
+            consultas.append(contador.total)
+            estados[respuesta.status_code] = estados.get(respuesta.status_code, 0) + 1
+        total = time.perf_counter() - inicio
+
+        tiempos.sort()
+        return {
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'media_ms': round(sum(tiempos) / len(tiempos), 2),
+            'peticiones_s': round(iteraciones / total, 1),
+            'consultas': round(sum(consultas) / len(consultas), 1),
+            'consultas_max': max(consultas),
+            'estados': {str(codigo): n for codigo, n in sorted(estados.items())},
+        }
+
+    def comparar(self, resultado, fichero, umbral):
+        with open(fichero, encoding='utf-8') as f:
+            anterior = json.load(f)
+        self.stdout.write(f'Comparación con {fichero} (commit {anterior.get("commit")}):')
+
+        regresiones = []
+        for nombre, actual in resultado['escenarios'].items():
+            base = anterior.get('escenarios', {}).get(nombre)
+            if not base:
+                continue
+            cambio = (actual['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0
+            linea = (
+                f'  {nombre}: p95 {base["p95_ms"]} -> {actual["p95_ms"]} ms ({cambio:+.0%}), '
+                f'consultas {base["consultas"]} -> {actual["consultas"]}'
+            )
+            if cambio > umbral or actual['consultas'] > base['consultas']:
+                regresiones.append(nombre)
+                linea = self.style.ERROR(linea)
+            self.stdout.write(linea)
+
+        if regresiones:
+            raise CommandError(f'Regresiones de rendimiento: {", ".join(regresiones)}.')
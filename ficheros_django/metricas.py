@@ -0,0 +1,348 @@
+import atexit
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+# Métricas del consultorio en el formato de texto de Prometheus (/metrics).
+#
+# Contadores de reservas, conflictos de horario, reprogramaciones y
+# cancelaciones (las citas por segundo son rate(...) sobre el contador),
+# histogramas de la duración de las consultas de disponibilidad y de la
+# serialización, y uso de conexiones a la base de datos.
+#
+# Cada hilo suma en su propio diccionario, sin bloqueos; /metrics suma los de
+# todos los hilos al leer. Con varios procesos (gunicorn -w N) cada uno no ve
+# los valores de los demás: con METRICAS_DIRECTORIO cada proceso vuelca sus
+# valores en <directorio>/<pid>.json cada METRICAS_INTERVALO segundos (si han
+# cambiado) y al terminar, y /metrics suma todos los ficheros. El directorio
+# debe vaciarse al reiniciar el servicio, como el de prometheus_client.
+
+ACTIVAS = getattr(settings, 'METRICAS', True)
+IPS = getattr(settings, 'METRICAS_IPS', ['127.0.0.1', '::1'])  # Clientes que pueden leer /metrics
+TOKEN = getattr(settings, 'METRICAS_TOKEN', None)  # Si se define, /metrics exige "Authorization: Bearer <token>"
+DIRECTORIO = getattr(settings, 'METRICAS_DIRECTORIO', None)
+INTERVALO = getattr(settings, 'METRICAS_INTERVALO', 1)  # Segundos entre volcados a fichero
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _sumar(destino, origen):
+    # Contadores: número; histogramas: lista de cubos con la suma al final
+    for clave, valor in origen.items():
+        if isinstance(valor, list):
+            actual = destino.get(clave)
+            if actual is None:
+                destino[clave] = list(valor)
+            else:
+                for i, v in enumerate(valor):
+                    actual[i] += v
+        else:
+            destino[clave] = destino.get(clave, 0) + valor
+
+
+class Registro:
+    """Métricas declaradas y valores acumulados por cada hilo del proceso."""
+
+    def __init__(self):
+        self.metricas = []
+        self._bloqueo = threading.Lock()  # Solo al registrar un hilo nuevo y al leer
+        self._local = threading.local()
+        self._hilos = []  # (hilo, valores)
+        self._terminados = {}  # Valores de los hilos que ya han terminado
+        self._pendiente = False
+        self._volcador = None  # pid del proceso que tiene en marcha el hilo de volcado
+
+    def valores(self):
+        """Diccionario de valores del hilo actual (solo lo modifica ese hilo)."""
+        try:
+            return self._local.valores
+        except AttributeError:
+            valores = self._local.valores = {}
+            with self._bloqueo:
+                self._recoger_terminados()
+                self._hilos.append((threading.current_thread(), valores))
+            return valores
+
+    def _recoger_terminados(self):
+        # Con un hilo por petición (runserver) la lista no crece sin límite
+        vivos = []
+        for hilo, valores in self._hilos:
+            if hilo.is_alive():
+                vivos.append((hilo, valores))
+            else:
+                _sumar(self._terminados, valores)
+        self._hilos = vivos
+
+    def proceso(self):
+        """Valores de contadores e histogramas de todos los hilos del proceso."""
+        total = {}
+        with self._bloqueo:
+            self._recoger_terminados()
+            _sumar(total, self._terminados)
+            for _, valores in self._hilos:
+                _sumar(total, valores.copy())  # copy() es atómico; el hilo puede seguir sumando
+        return total
+
+    def indicadores(self):
+        total = {}
+        for metrica in self.metricas:
+            if isinstance(metrica, Indicador):
+                total.update(metrica.leer())
+        return total
+
+    def cambio(self):
+        if DIRECTORIO is None:
+            return
+        self._pendiente = True
+        pid = os.getpid()
+        if self._volcador != pid:  # Primer cambio del proceso (también tras un fork)
+            with self._bloqueo:
+                if self._volcador != pid:
+                    self._volcador = pid
+                    threading.Thread(target=self._volcar_periodicamente, name='metricas', daemon=True).start()
+
+    def _volcar_periodicamente(self):
+        while True:
+            time.sleep(INTERVALO)
+            if self._pendiente:
+                self.volcar()
+
+    def volcar(self):
+        """Escribe los valores del proceso en METRICAS_DIRECTORIO/<pid>.json."""
+        self._pendiente = False
+        directorio = Path(DIRECTORIO)
+        directorio.mkdir(parents=True, exist_ok=True)
+        datos = {
+            'contadores': [[nombre, etiquetas, valor] for (nombre, etiquetas), valor in self.proceso().items()],
+            'indicadores': [[nombre, etiquetas, valor] for (nombre, etiquetas), valor in self.indicadores().items()],
+        }
+        fichero = directorio / f'{os.getpid()}.json'
+        temporal = fichero.with_suffix('.tmp')
+        temporal.write_text(json.dumps(datos), encoding='utf-8')
+        temporal.replace(fichero)  # Quien lea ve el fichero anterior o el nuevo, nunca uno a medias
+
+    def recoger(self):
+        """Valores de contadores, histogramas e indicadores (de todos los procesos con DIRECTORIO)."""
+        contadores, indicadores = self.proceso(), self.indicadores()
+        if DIRECTORIO is not None:
+            for fichero in Path(DIRECTORIO).glob('*.json'):
+                if not fichero.stem.isdigit() or int(fichero.stem) == os.getpid():
+                    continue
+                pid = int(fichero.stem)
+                try:
+                    datos = json.loads(fichero.read_text(encoding='utf-8'))
+                except (OSError, ValueError):
+                    continue
+                _sumar(contadores, {(n, tuple(e)): v for n, e, v in datos['contadores']})
+                if _proceso_vivo(pid):  # Los indicadores de un proceso terminado ya no valen
+                    _sumar(indicadores, {(n, tuple(e)): v for n, e, v in datos['indicadores']})
+        return {**contadores, **indicadores}
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRO = Registro()
+
+
+@atexit.register
+def _volcar_al_terminar():
+    if DIRECTORIO is not None and REGISTRO._volcador == os.getpid():
+        REGISTRO.volcar()
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        REGISTRO.metricas.append(self)
+
+    def _clave(self, etiquetas):
+        return self.nombre, tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def lineas(self, valores):
+        for (nombre, etiquetas), valor in sorted(valores.items()):
+            if nombre == self.nombre:
+                yield f'{self.nombre}{_etiquetas(zip(self.etiquetas, etiquetas))} {_numero(valor)}'
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def inc(self, cantidad=1, **etiquetas):
+        if not ACTIVAS:
+            return
+        valores = REGISTRO.valores()
+        clave = self._clave(etiquetas)
+        valores[clave] = valores.get(clave, 0) + cantidad
+        REGISTRO.cambio()
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, **etiquetas):
+        if not ACTIVAS:
+            return
+        valores = REGISTRO.valores()
+        clave = self._clave(etiquetas)
+        cubos = valores.get(clave)
+        if cubos is None:
+            cubos = valores[clave] = [0] * (len(self.limites) + 2)  # Un cubo por límite, +Inf y la suma
+        cubos[bisect.bisect_left(self.limites, valor)] += 1
+        cubos[-1] += valor
+        REGISTRO.cambio()
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque en segundos."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def lineas(self, valores):
+        for (nombre, etiquetas), cubos in sorted(valores.items()):
+            if nombre != self.nombre:
+                continue
+            pares = list(zip(self.etiquetas, etiquetas))
+            acumulado = 0
+            for limite, cantidad in zip((*self.limites, '+Inf'), cubos):
+                acumulado += cantidad
+                yield f'{self.nombre}_bucket{_etiquetas(pares + [("le", _numero(limite))])} {_numero(acumulado)}'
+            yield f'{self.nombre}_sum{_etiquetas(pares)} {_numero(cubos[-1])}'
+            yield f'{self.nombre}_count{_etiquetas(pares)} {_numero(acumulado)}'
+
+
+class Indicador(Metrica):
+    """Valor que se lee al exponer las métricas: `funcion` devuelve {(etiquetas): valor}."""
+    tipo = 'gauge'
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def leer(self):
+        if not ACTIVAS:
+            return {}
+        return {(self.nombre, tuple(map(str, etiquetas))): valor for etiquetas, valor in self.funcion().items()}
+
+
+def _numero(valor):
+    if isinstance(valor, str):
+        return valor
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares]
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def exposicion():
+    """Texto de /metrics con todas las métricas registradas."""
+    valores = REGISTRO.recoger()
+    lineas = []
+    for metrica in REGISTRO.metricas:
+        lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+        lineas.extend(metrica.lineas(valores))
+    return '\n'.join(lineas) + '\n'
+
+
+def exponer_metricas(request):
+    """
+    GET /metrics: métricas para Prometheus, solo para los clientes de
+    METRICAS_IPS y, si se ha definido METRICAS_TOKEN, con ese token.
+
+    Detrás de un proxy inverso REMOTE_ADDR es la dirección del proxy (p. ej.
+    127.0.0.1) para cualquier cliente: hay que definir METRICAS_TOKEN o no
+    publicar /metrics a través del proxy.
+    """
+    if not ACTIVAS:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in IPS:
+        return HttpResponseForbidden()
+    autorizacion = request.META.get('HTTP_AUTHORIZATION', '').encode()
+    if TOKEN and not hmac.compare_digest(autorizacion, f'Bearer {TOKEN}'.encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(exposicion(), content_type=TIPO_CONTENIDO)
+
+
+# --- Conexiones a la base de datos ---
+
+def _grupos_conexiones():
+    # Grupos de psycopg (DB_POOL=psycopg): son del proceso, no de cada hilo
+    estados = {}
+    for alias in connections:
+        conexion = connections[alias]
+        if conexion.vendor != 'postgresql' or not conexion.settings_dict['OPTIONS'].get('pool'):
+            continue
+        grupo = conexion.pool
+        if grupo is None:
+            continue
+        datos = grupo.get_stats()
+        estados[(alias, 'en_uso')] = datos.get('pool_size', 0) - datos.get('pool_available', 0)
+        estados[(alias, 'libres')] = datos.get('pool_available', 0)
+        estados[(alias, 'esperando')] = datos.get('requests_waiting', 0)
+    return estados
+
+
+def _conexion_creada(sender, connection, **kwargs):
+    db_conexiones_nuevas.inc(alias=connection.alias)
+
+
+# --- Métricas del consultorio ---
+
+citas_reservadas = Contador(
+    'consultorio_citas_reservadas_total', 'Citas reservadas.', ['origen'])
+citas_conflictos = Contador(
+    'consultorio_citas_conflictos_total',
+    'Reservas y reprogramaciones rechazadas porque el horario ya estaba ocupado.', ['operacion'])
+citas_reprogramadas = Contador(
+    'consultorio_citas_reprogramadas_total', 'Citas reprogramadas.', ['origen'])
+citas_canceladas = Contador(
+    'consultorio_citas_canceladas_total', 'Citas canceladas.', ['origen'])
+disponibilidad_segundos = Histograma(
+    'consultorio_disponibilidad_segundos', 'Duración de las consultas de disponibilidad (dia, rango o huecos).', ['consulta'])
+serializacion_segundos = Histograma(
+    'consultorio_serializacion_segundos', 'Duración de la serialización de las respuestas (.data).')
+db_conexiones_nuevas = Contador(
+    'consultorio_db_conexiones_nuevas_total',
+    'Conexiones nuevas con la base de datos (CONN_MAX_AGE y el grupo las reutilizan).', ['alias'])
+db_grupo_conexiones = Indicador(
+    'consultorio_db_grupo_conexiones',
+    'Conexiones del grupo de psycopg (DB_POOL=psycopg) en uso, libres y peticiones esperando.',
+    _grupos_conexiones, ['alias', 'estado'])
+
+connection_created.connect(_conexion_creada, dispatch_uid='consultorio_metricas')
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+from consultorio.indices import IndicePostgres, SQLPostgres
+
+
+# Índices para la búsqueda, ordenación y paginación por cursor del listado de citas
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = []
+
+    operations = [
+        # Búsquedas por subcadena (icontains) sobre nombres. Al deshacer se
+        # conserva la extensión: la pueden usar otros índices o la base de datos
+        SQLPostgres(
+            sql='CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Ordenación y búsqueda por fecha, estado y especialidad (id_cita como desempate del cursor)
+        IndicePostgres('idx_cita_fecha_id', 'ON cita (fecha, id_cita)'),
+        IndicePostgres('idx_cita_estado_id', 'ON cita (estado, id_cita)'),
+        IndicePostgres('idx_cita_especialidad_id', 'ON cita (especialidad, id_cita)'),
+        IndicePostgres('idx_cita_especialidad_trgm', 'ON cita USING gin (UPPER(especialidad) gin_trgm_ops)'),
+        # Búsqueda de refcita por prefijo (solo en el esquema de Actividad 3)
+        IndicePostgres(
+            'idx_cita_refcita_prefijo', 'ON cita (refcita varchar_pattern_ops)', requiere_columna=('cita', 'refcita')
+        ),
+        # Búsqueda por nombre de paciente y médico (UPPER(...) LIKE UPPER('%valor%'))
+        IndicePostgres('idx_paciente_nombre_trgm', 'ON paciente USING gin (UPPER(nombre) gin_trgm_ops)'),
+        IndicePostgres('idx_paciente_apellido_trgm', 'ON paciente USING gin (UPPER(apellido) gin_trgm_ops)'),
+        IndicePostgres('idx_medico_nombre_trgm', 'ON medico USING gin (UPPER(nombre) gin_trgm_ops)'),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from consultorio.indices import IndiceEliminado, IndicePostgres
+
+
+# Índices compuestos para los filtros de las vistas de citas y disponibilidad
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = [
+        ('consultorio', '0001_indices_busqueda'),
+    ]
+
+    operations = [
+        # CancelarReprogramarCitaView (GET ?id_paciente / ?id_medico), ordenadas por fecha y hora
+        IndicePostgres('idx_cita_paciente_fecha_hora', 'ON cita (id_paciente, fecha, hora)'),
+        IndicePostgres('idx_cita_medico_fecha_hora', 'ON cita (id_medico, fecha, hora)'),
+        # Citas activas de un día (agenda, recordatorios): solo las no canceladas
+        IndicePostgres('idx_cita_activa_fecha_hora', "ON cita (fecha, hora) WHERE estado <> 'cancelada'"),
+        # DisponibilidadHorariosView: médicos por especialidad sin distinguir mayúsculas (iexact)
+        IndicePostgres('idx_medico_especialidad', 'ON medico (UPPER(especialidad), id_medico)'),
+        # Los índices de una sola columna de indices.sql quedan cubiertos por los compuestos
+        IndiceEliminado('idx_cita_id_paciente', 'ON cita (id_paciente)'),
+        IndiceEliminado('idx_cita_id_medico', 'ON cita (id_medico)'),
+    ]
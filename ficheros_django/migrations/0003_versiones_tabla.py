@@ -0,0 +1,51 @@
+from django.db import migrations
+
+from consultorio.indices import SQLPostgres
+
+TABLAS = ('paciente', 'medico', 'cita')
+
+
+# Contador de versión por tabla (ETag de los listados), mantenido por triggers
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorio', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql=[
+                """
+                CREATE TABLE IF NOT EXISTS versiontabla (
+                    tabla VARCHAR(50) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    modificado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """,
+                "INSERT INTO versiontabla (tabla) VALUES ('paciente'), ('medico'), ('cita') ON CONFLICT DO NOTHING",
+                """
+                CREATE OR REPLACE FUNCTION incrementar_version_tabla() RETURNS TRIGGER AS $$
+                BEGIN
+                    UPDATE versiontabla SET version = version + 1, modificado = CURRENT_TIMESTAMP
+                    WHERE tabla = TG_TABLE_NAME;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+                """,
+            ] + [
+                sql
+                for tabla in TABLAS
+                for sql in (
+                    f'DROP TRIGGER IF EXISTS {tabla}_version ON {tabla}',
+                    f"""
+                    CREATE TRIGGER {tabla}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {tabla}
+                    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_version_tabla()
+                    """,
+                )
+            ],
+            reverse_sql=[f'DROP TRIGGER IF EXISTS {tabla}_version ON {tabla}' for tabla in TABLAS] + [
+                'DROP FUNCTION IF EXISTS incrementar_version_tabla()',
+                'DROP TABLE IF EXISTS versiontabla',
+            ],
+        ),
+    ]
@@ -0,0 +1,99 @@
+from django.db import migrations
+
+from consultorio.indices import SQLPostgres
+
+# Tabla y columna de clave primaria de cada tabla con registro de cambios
+TABLAS = {'paciente': 'id_paciente', 'medico': 'id_medico', 'cita': 'id_cita'}
+
+# Un trigger por operación: las tablas de transición (REFERENCING) no admiten varios eventos
+OPERACIONES = (
+    ('insercion', 'INSERT', 'REFERENCING NEW TABLE AS nuevas'),
+    ('actualizacion', 'UPDATE', 'REFERENCING NEW TABLE AS nuevas'),
+    ('borrado', 'DELETE', 'REFERENCING OLD TABLE AS viejas'),
+)
+
+
+def _crear_triggers(tabla, pk):
+    sentencias = [
+        f'DROP TRIGGER IF EXISTS {tabla}_version ON {tabla}',
+        f"""
+        CREATE TRIGGER {tabla}_reinicio AFTER TRUNCATE ON {tabla}
+        FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios()
+        """,
+    ]
+    for nombre, evento, referencias in OPERACIONES:
+        sentencias.append(f"""
+        CREATE TRIGGER {tabla}_{nombre} AFTER {evento} ON {tabla} {referencias}
+        FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios('{pk}')
+        """)
+    return sentencias
+
+
+def _eliminar_triggers(tabla):
+    return [f'DROP TRIGGER IF EXISTS {tabla}_reinicio ON {tabla}'] + [
+        f'DROP TRIGGER IF EXISTS {tabla}_{nombre} ON {tabla}' for nombre, _, _ in OPERACIONES
+    ] + [
+        f"""
+        CREATE TRIGGER {tabla}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {tabla}
+        FOR EACH STATEMENT EXECUTE FUNCTION incrementar_version_tabla()
+        """,
+    ]
+
+
+# Registro de las filas modificadas en cada versión (sincronización incremental, ?since=)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorio', '0003_versiones_tabla'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql=[
+                'ALTER TABLE versiontabla ADD COLUMN IF NOT EXISTS reiniciado BIGINT NOT NULL DEFAULT 0',
+                # Las filas existentes no están en el registro: las versiones anteriores exigen recarga completa
+                'UPDATE versiontabla SET reiniciado = version',
+                """
+                CREATE TABLE IF NOT EXISTS cambio (
+                    id_cambio BIGSERIAL PRIMARY KEY,
+                    tabla VARCHAR(50) NOT NULL,
+                    id_registro INTEGER NOT NULL,
+                    operacion CHAR(1) NOT NULL,
+                    version BIGINT NOT NULL,
+                    UNIQUE (tabla, id_registro)
+                )
+                """,
+                'CREATE INDEX IF NOT EXISTS idx_cambio_tabla_version ON cambio (tabla, version)',
+                """
+                CREATE OR REPLACE FUNCTION registrar_cambios() RETURNS TRIGGER AS $$
+                DECLARE
+                    nueva_version BIGINT;
+                BEGIN
+                    UPDATE versiontabla SET version = version + 1, modificado = CURRENT_TIMESTAMP
+                    WHERE tabla = TG_TABLE_NAME
+                    RETURNING version INTO nueva_version;
+
+                    IF TG_OP = 'TRUNCATE' THEN
+                        UPDATE versiontabla SET reiniciado = nueva_version WHERE tabla = TG_TABLE_NAME;
+                        DELETE FROM cambio WHERE tabla = TG_TABLE_NAME;
+                    ELSE
+                        EXECUTE format(
+                            'INSERT INTO cambio (tabla, id_registro, operacion, version) '
+                            'SELECT $1, %I, $2, $3 FROM %I '
+                            'ON CONFLICT (tabla, id_registro) DO UPDATE '
+                            'SET operacion = EXCLUDED.operacion, version = EXCLUDED.version',
+                            TG_ARGV[0], CASE WHEN TG_OP = 'DELETE' THEN 'viejas' ELSE 'nuevas' END
+                        ) USING TG_TABLE_NAME, left(TG_OP, 1), nueva_version;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+                """,
+            ] + [sql for tabla, pk in TABLAS.items() for sql in _crear_triggers(tabla, pk)],
+            reverse_sql=[sql for tabla in TABLAS for sql in _eliminar_triggers(tabla)] + [
+                'DROP FUNCTION IF EXISTS registrar_cambios()',
+                'DROP TABLE IF EXISTS cambio',
+                'ALTER TABLE versiontabla DROP COLUMN IF EXISTS reiniciado',
+            ],
+        ),
+    ]
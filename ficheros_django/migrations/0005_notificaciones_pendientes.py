@@ -0,0 +1,47 @@
+from django.db import migrations
+
+from consultorio.indices import IndicePostgres, SQLPostgres
+
+
+# Notificaciones como bandeja de salida: fecha_envio NULL = pendiente de enviar
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = [
+        ('consultorio', '0004_registro_cambios'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql=[
+                'ALTER TABLE notificaciones ALTER COLUMN fecha_envio DROP DEFAULT',
+                'ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS destinatario VARCHAR(100) NOT NULL DEFAULT \'\'',
+                'ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS intentos SMALLINT NOT NULL DEFAULT 0',
+                'ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS proximo_intento '
+                'TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP',
+                'ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS error TEXT',
+                # La notificación de una cita cancelada se envía aunque la cita se haya borrado
+                'ALTER TABLE notificaciones ALTER COLUMN id_cita DROP NOT NULL',
+                'ALTER TABLE notificaciones DROP CONSTRAINT IF EXISTS notificaciones_id_cita_fkey',
+                'ALTER TABLE notificaciones ADD CONSTRAINT notificaciones_id_cita_fkey '
+                'FOREIGN KEY (id_cita) REFERENCES cita (id_cita) ON DELETE SET NULL',
+            ],
+            reverse_sql=[
+                'ALTER TABLE notificaciones DROP CONSTRAINT IF EXISTS notificaciones_id_cita_fkey',
+                'DELETE FROM notificaciones WHERE id_cita IS NULL',
+                'ALTER TABLE notificaciones ADD CONSTRAINT notificaciones_id_cita_fkey '
+                'FOREIGN KEY (id_cita) REFERENCES cita (id_cita) ON DELETE CASCADE',
+                'ALTER TABLE notificaciones ALTER COLUMN id_cita SET NOT NULL',
+                'ALTER TABLE notificaciones DROP COLUMN IF EXISTS error',
+                'ALTER TABLE notificaciones DROP COLUMN IF EXISTS proximo_intento',
+                'ALTER TABLE notificaciones DROP COLUMN IF EXISTS intentos',
+                'ALTER TABLE notificaciones DROP COLUMN IF EXISTS destinatario',
+                'ALTER TABLE notificaciones ALTER COLUMN fecha_envio SET DEFAULT CURRENT_TIMESTAMP',
+            ],
+        ),
+        # Cola de envío (enviar_notificaciones): pendientes por fecha del próximo intento
+        IndicePostgres(
+            'idx_notificaciones_pendientes', 'ON notificaciones (proximo_intento) WHERE fecha_envio IS NULL'
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from consultorio.indices import IndicePostgres, SQLPostgres
+
+
+# Recordatorios de citas (comando generar_recordatorios)
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = [
+        ('consultorio', '0005_notificaciones_pendientes'),
+    ]
+
+    operations = [
+        # Clave de idempotencia: una notificación repetida (p. ej. al volver a
+        # generar los recordatorios de un día) no se inserta dos veces
+        SQLPostgres(
+            sql='ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS clave VARCHAR(100)',
+            reverse_sql='ALTER TABLE notificaciones DROP COLUMN IF EXISTS clave',
+        ),
+        IndicePostgres('idx_notificaciones_clave', 'ON notificaciones (clave)', unico=True),
+        # Citas de un día en un estado (confirmadas de mañana)
+        IndicePostgres('idx_cita_fecha_estado', 'ON cita (fecha, estado)'),
+    ]
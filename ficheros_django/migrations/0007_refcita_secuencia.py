@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from consultorio.indices import SQLPostgres
+
+
+# Números de las referencias de cita (referencias.py, esquema de Actividad 3)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorio', '0006_recordatorios'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql='CREATE SEQUENCE IF NOT EXISTS cita_refcita_seq',
+            reverse_sql='DROP SEQUENCE IF EXISTS cita_refcita_seq',
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from consultorio.indices import IndicePostgres
+
+
+# Índices de la búsqueda de pacientes y médicos (busqueda.py, esquema de Actividad 3)
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = [
+        ('consultorio', '0007_refcita_secuencia'),
+    ]
+
+    operations = [
+        # Identificadores por prefijo (LIKE 'valor%')
+        IndicePostgres(
+            'idx_paciente_dni_prefijo', 'ON paciente (dni varchar_pattern_ops)', requiere_columna=('paciente', 'dni')
+        ),
+        IndicePostgres('idx_paciente_telefono_prefijo', 'ON paciente (telefono varchar_pattern_ops)'),
+        IndicePostgres('idx_paciente_email_prefijo', 'ON paciente (UPPER(email) text_pattern_ops)'),
+        IndicePostgres(
+            'idx_medico_ncolegiado_prefijo', 'ON medico (ncolegiado varchar_pattern_ops)',
+            requiere_columna=('medico', 'ncolegiado'),
+        ),
+        # Nombres aproximados (%> y <<->): GiST para que el orden por similitud use el índice
+        IndicePostgres(
+            'idx_paciente_nombre_completo_trgm',
+            "ON paciente USING gist ((UPPER(nombre || ' ' || apellido)) gist_trgm_ops)",
+        ),
+        IndicePostgres(
+            'idx_medico_busqueda_trgm',
+            "ON medico USING gist ((UPPER(nombre || ' ' || especialidad)) gist_trgm_ops)",
+        ),
+    ]
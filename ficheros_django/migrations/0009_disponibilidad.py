@@ -0,0 +1,57 @@
+from django.db import migrations
+
+from consultorio.indices import SQLPostgres
+
+
+# Índice de ocupación a partir de las citas existentes (lo mismo que
+# disponibilidad.reconstruir_ocupacion() y que consultorio.sql, en SQL para no
+# depender del código actual de la aplicación)
+RELLENAR_OCUPACION = """
+INSERT INTO ocupacionmedico (id_medico, fecha, ocupados)
+SELECT id_medico, fecha, BIT_OR(1 << EXTRACT(HOUR FROM hora)::INT)
+FROM cita
+WHERE estado <> 'cancelada'
+GROUP BY id_medico, fecha
+ON CONFLICT (id_medico, fecha) DO UPDATE SET ocupados = EXCLUDED.ocupados
+"""
+
+
+# Tablas del índice de disponibilidad (disponibilidad.py) en las bases de
+# datos creadas antes de que consultorio.sql las incluyera
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorio', '0008_indices_autocompletado'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql=[
+                # Horas de trabajo de cada médico por día de la semana (bit 9 = 09:00)
+                """
+                CREATE TABLE IF NOT EXISTS horariomedico (
+                    id_horario SERIAL PRIMARY KEY,
+                    id_medico INT NOT NULL REFERENCES medico (id_medico) ON DELETE CASCADE,
+                    dia_semana SMALLINT NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),
+                    horas INT NOT NULL,
+                    UNIQUE (id_medico, dia_semana)
+                )
+                """,
+                # Horas ocupadas de cada médico por fecha (bit 9 = 09:00)
+                """
+                CREATE TABLE IF NOT EXISTS ocupacionmedico (
+                    id_ocupacion SERIAL PRIMARY KEY,
+                    id_medico INT NOT NULL REFERENCES medico (id_medico) ON DELETE CASCADE,
+                    fecha DATE NOT NULL,
+                    ocupados INT NOT NULL DEFAULT 0,
+                    UNIQUE (id_medico, fecha)
+                )
+                """,
+                RELLENAR_OCUPACION,
+            ],
+            reverse_sql=[
+                'DROP TABLE IF EXISTS ocupacionmedico',
+                'DROP TABLE IF EXISTS horariomedico',
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+from consultorio.indices import IndicePostgres, SQLPostgres
+
+
+# Una cita activa por médico, fecha y hora (disponibilidad.CONSTRAINT_HORARIO)
+# en las bases de datos creadas antes de que consultorio.sql incluyera el índice
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY no admite transacciones
+
+    dependencies = [
+        ('consultorio', '0009_disponibilidad'),
+    ]
+
+    operations = [
+        # Reservas duplicadas anteriores al índice: la migración se detiene con
+        # la lista de citas afectadas (se resuelven con el comando
+        # cancelar_reservas_duplicadas, que avisa a los pacientes)
+        SQLPostgres(
+            sql="""
+            DO $$
+            DECLARE
+                duplicadas TEXT;
+            BEGIN
+                SELECT string_agg(format('médico %s, %s %s: citas %s', id_medico, fecha, hora, citas), '; ')
+                INTO duplicadas
+                FROM (
+                    SELECT id_medico, fecha, hora, string_agg(id_cita::TEXT, ', ' ORDER BY id_cita) AS citas
+                    FROM cita WHERE estado <> 'cancelada'
+                    GROUP BY id_medico, fecha, hora
+                    HAVING COUNT(*) > 1
+                ) AS horarios;
+                IF duplicadas IS NOT NULL THEN
+                    RAISE EXCEPTION 'Reservas duplicadas en el mismo horario: %', duplicadas
+                        USING HINT = 'Ejecute manage.py cancelar_reservas_duplicadas y repita la migración.';
+                END IF;
+            END
+            $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Si un intento anterior falló (una reserva duplicada entre la
+        # comprobación y el índice), CREATE INDEX CONCURRENTLY deja el índice
+        # inválido y IF NOT EXISTS no lo volvería a crear
+        SQLPostgres(
+            sql="""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = 'cita_medico_horario_unico' AND NOT i.indisvalid
+                ) THEN
+                    DROP INDEX cita_medico_horario_unico;
+                END IF;
+            END
+            $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        IndicePostgres(
+            'cita_medico_horario_unico', "ON cita (id_medico, fecha, hora) WHERE estado <> 'cancelada'", unico=True
+        ),
+    ]
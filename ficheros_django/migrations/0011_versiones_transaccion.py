@@ -0,0 +1,90 @@
+from django.db import migrations
+
+from consultorio.indices import SQLPostgres
+
+# registrar_cambios de 0004: incrementa la versión en la fila de versiontabla
+# (bloqueada hasta el COMMIT)
+REGISTRAR_CAMBIOS_CONTADOR = """
+CREATE OR REPLACE FUNCTION registrar_cambios() RETURNS TRIGGER AS $$
+DECLARE
+    nueva_version BIGINT;
+BEGIN
+    UPDATE versiontabla SET version = version + 1, modificado = CURRENT_TIMESTAMP
+    WHERE tabla = TG_TABLE_NAME
+    RETURNING version INTO nueva_version;
+
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE versiontabla SET reiniciado = nueva_version WHERE tabla = TG_TABLE_NAME;
+        DELETE FROM cambio WHERE tabla = TG_TABLE_NAME;
+    ELSE
+        EXECUTE format(
+            'INSERT INTO cambio (tabla, id_registro, operacion, version) '
+            'SELECT $1, %I, $2, $3 FROM %I '
+            'ON CONFLICT (tabla, id_registro) DO UPDATE '
+            'SET operacion = EXCLUDED.operacion, version = EXCLUDED.version',
+            TG_ARGV[0], CASE WHEN TG_OP = 'DELETE' THEN 'viejas' ELSE 'nuevas' END
+        ) USING TG_TABLE_NAME, left(TG_OP, 1), nueva_version;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Anota en cambio la transacción que escribe cada fila: las escrituras de
+# transacciones distintas no comparten ninguna fila (solo el TRUNCATE, que ya
+# bloquea la tabla entera, actualiza versiontabla)
+REGISTRAR_CAMBIOS_TRANSACCION = """
+CREATE OR REPLACE FUNCTION registrar_cambios() RETURNS TRIGGER AS $$
+DECLARE
+    transaccion BIGINT := pg_current_xact_id()::text::bigint;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE versiontabla SET reiniciado = transaccion, modificado = CURRENT_TIMESTAMP
+        WHERE tabla = TG_TABLE_NAME;
+        DELETE FROM cambio WHERE tabla = TG_TABLE_NAME;
+    ELSE
+        EXECUTE format(
+            'INSERT INTO cambio (tabla, id_registro, operacion, version, modificado) '
+            'SELECT $1, %I, $2, $3, CURRENT_TIMESTAMP FROM %I '
+            'ON CONFLICT (tabla, id_registro) DO UPDATE '
+            'SET operacion = EXCLUDED.operacion, version = EXCLUDED.version, modificado = EXCLUDED.modificado',
+            TG_ARGV[0], CASE WHEN TG_OP = 'DELETE' THEN 'viejas' ELSE 'nuevas' END
+        ) USING TG_TABLE_NAME, left(TG_OP, 1), transaccion;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+# Versiones por transacción en lugar de un contador por tabla: el UPDATE de la
+# fila de versiontabla en cada sentencia serializaba a todos los escritores de
+# una tabla y provocaba interbloqueos entre transacciones que escriben en
+# varias tablas en distinto orden (requiere PostgreSQL 13)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorio', '0010_cita_horario_unico'),
+    ]
+
+    operations = [
+        SQLPostgres(
+            sql=[
+                'ALTER TABLE cambio ADD COLUMN IF NOT EXISTS modificado TIMESTAMP WITH TIME ZONE '
+                'NOT NULL DEFAULT CURRENT_TIMESTAMP',
+                REGISTRAR_CAMBIOS_TRANSACCION,
+                # Las versiones entregadas hasta ahora (contadores) son anteriores a
+                # esta transacción: los clientes recargan el listado completo
+                'UPDATE versiontabla SET reiniciado = pg_current_xact_id()::text::bigint',
+                'ALTER TABLE versiontabla DROP COLUMN IF EXISTS version',
+            ],
+            reverse_sql=[
+                'ALTER TABLE versiontabla ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0',
+                # Los contadores empiezan por encima de cualquier versión entregada
+                'UPDATE versiontabla SET version = pg_current_xact_id()::text::bigint, '
+                'reiniciado = pg_current_xact_id()::text::bigint',
+                REGISTRAR_CAMBIOS_CONTADOR,
+                'ALTER TABLE cambio DROP COLUMN IF EXISTS modificado',
+            ],
+        ),
+    ]
@@ -0,0 +1,335 @@
+import abc
+import datetime
+import random
+import string
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.module_loading import import_string
+
+from .disponibilidad import ESTADOS_LIBRES
+from .models import Cita, Notificaciones
+
+# Notificaciones a los pacientes (bandeja de salida o "outbox").
+#
+# Las vistas que reservan, reprograman o cancelan citas no envían nada:
+# insertan la notificación en la tabla notificaciones dentro de la misma
+# transacción que el cambio de la cita (si la transacción se deshace, no
+# queda notificación). El comando enviar_notificaciones la envía después con
+# un grupo de hilos, por lotes, y anota fecha_envio; si el envío falla se
+# reintenta más tarde con espera exponencial.
+#
+# Cada lote se reserva en una transacción corta (proximo_intento pasa a
+# dentro de RESERVA segundos, así que ningún otro hilo lo toma), se envía sin
+# ninguna transacción abierta y el resultado se anota en otra transacción.
+# El envío es "al menos una vez": si el proceso se detiene después de enviar
+# un lote y antes de anotarlo, ese lote se vuelve a enviar al caducar la reserva.
+
+LOTE = getattr(settings, 'NOTIFICACIONES_LOTE', 100)  # Notificaciones por lote
+MAX_INTENTOS = getattr(settings, 'NOTIFICACIONES_MAX_INTENTOS', 5)
+REINTENTO_BASE = getattr(settings, 'NOTIFICACIONES_REINTENTO_BASE', 30)  # Segundos tras el primer fallo
+REINTENTO_MAX = getattr(settings, 'NOTIFICACIONES_REINTENTO_MAX', 3600)  # Espera máxima entre intentos
+RESERVA = getattr(settings, 'NOTIFICACIONES_RESERVA', 300)  # Segundos para enviar un lote reservado
+
+# Recordatorios (comando generar_recordatorios)
+RECORDATORIOS_ESTADOS = getattr(settings, 'RECORDATORIOS_ESTADOS', ('confirmada',))  # Estados de cita a recordar
+RECORDATORIOS_LOTE = getattr(settings, 'RECORDATORIOS_LOTE', 5000)  # Citas por lote
+
+ESPECIALIDAD_GENERICA = 'consulta'  # En el texto de las citas sin especialidad ("Su cita de consulta ...")
+
+# Asunto y texto de cada tipo de notificación
+PLANTILLAS = {
+    'reserva': ('Cita reservada', 'Su cita de {especialidad} del {fecha} a las {hora} ha sido reservada.'),
+    'reprogramacion': ('Cita reprogramada', 'Su cita de {especialidad} se ha cambiado al {fecha} a las {hora}.'),
+    'cancelacion': ('Cita cancelada', 'Su cita de {especialidad} del {fecha} a las {hora} ha sido cancelada.'),
+    'recordatorio': ('Recordatorio de cita', 'Le recordamos su cita de {especialidad} el {fecha} a las {hora}.'),
+}
+
+
+# --- Creación (en la transacción de la vista) ---
+
+def redactar(tipo, especialidad, fecha, hora, refcita=None):
+    """Texto de una notificación de tipo `tipo` sobre una cita."""
+    mensaje = PLANTILLAS[tipo][1].format(
+        especialidad=especialidad or ESPECIALIDAD_GENERICA, fecha=fecha.strftime('%d/%m/%Y'),
+        hora=hora.strftime('%H:%M'),
+    )
+    return f'{mensaje} Referencia: {refcita}.' if refcita else mensaje
+
+
+def nueva_notificacion(cita, tipo, destinatario=None):
+    """
+    Notificación pendiente (sin guardar) sobre `cita`. El destinatario es el
+    correo del paciente; si la cita se ha borrado, la notificación queda sin cita.
+    """
+    fecha = parse_date(cita.fecha) if isinstance(cita.fecha, str) else cita.fecha
+    hora = parse_time(cita.hora) if isinstance(cita.hora, str) else cita.hora
+    return Notificaciones(
+        id_cita_id=cita.pk,
+        tipo=tipo,
+        mensaje=redactar(tipo, cita.especialidad, fecha, hora, getattr(cita, 'refcita', None)),
+        destinatario=destinatario or cita.id_paciente.email,
+    )
+
+
+def encolar_notificacion(cita, tipo):
+    """Guarda una notificación pendiente; se llama dentro de la transacción que modifica la cita."""
+    return nueva_notificacion(cita, tipo).save()
+
+
+def tipo_modificacion(anterior, cita):
+    """
+    Tipo de notificación de un cambio de cita (None si no hay que avisar).
+    `anterior` es (fecha, hora, estado) antes del cambio.
+    """
+    fecha, hora, estado = anterior
+    if cita.estado in ESTADOS_LIBRES and estado not in ESTADOS_LIBRES:
+        return 'cancelacion'
+    if cita.estado not in ESTADOS_LIBRES and (fecha, hora) != (cita.fecha, cita.hora):
+        return 'reprogramacion'
+    return None
+
+
+# --- Recordatorios ---
+
+# Expresiones SQL (PostgreSQL) y parámetros de los campos de las plantillas
+CAMPOS_SQL = {
+    'especialidad': ("COALESCE(NULLIF(c.especialidad, ''), %s)", [ESPECIALIDAD_GENERICA]),
+    'fecha': ("to_char(c.fecha, 'DD/MM/YYYY')", []),
+    'hora': ("to_char(c.hora, 'HH24:MI')", []),
+}
+
+
+def generar_recordatorios(fecha, tamano_lote=RECORDATORIOS_LOTE):
+    """
+    Crea los recordatorios de las citas de `fecha` en RECORDATORIOS_ESTADOS.
+    Devuelve (citas encontradas, recordatorios creados).
+
+    Cada recordatorio lleva la clave "recordatorio:<id_cita>:<fecha y hora>":
+    volver a ejecutarlo no duplica nada y una cita movida a otro horario
+    recibe un recordatorio nuevo.
+    En PostgreSQL se crean todos con una sola sentencia INSERT ... SELECT
+    (índice cita (fecha, estado)); en otros motores, por lotes con bulk_create.
+    """
+    citas = Cita.objects.filter(fecha=fecha, estado__in=RECORDATORIOS_ESTADOS)
+    refcita = ('refcita',) if any(f.name == 'refcita' for f in Cita._meta.fields) else ()
+    if connection.vendor == 'postgresql':
+        return citas.count(), _insertar_recordatorios(fecha, refcita)
+
+    filas = (
+        citas.order_by()
+        .values_list('id_cita', 'hora', 'especialidad', 'id_paciente__email', *refcita)
+        .iterator(chunk_size=tamano_lote)
+    )
+    total = creados = 0
+    while lote := list(islice(filas, tamano_lote)):
+        total += len(lote)
+        claves = {f'recordatorio:{fila[0]}:{fecha:%Y%m%d}{fila[1]:%H%M}': fila for fila in lote}
+        existentes = set(Notificaciones.objects.filter(clave__in=list(claves)).values_list('clave', flat=True))
+        nuevas = [
+            Notificaciones(
+                id_cita_id=id_cita,
+                tipo='recordatorio',
+                mensaje=redactar('recordatorio', especialidad, fecha, hora, *resto),
+                destinatario=email,
+                clave=clave,
+            )
+            for clave, (id_cita, hora, especialidad, email, *resto) in claves.items()
+            if clave not in existentes
+        ]
+        creados += _crear_nuevas(nuevas, tamano_lote)
+    return total, creados
+
+
+def _crear_nuevas(nuevas, tamano_lote):
+    # Otra ejecución simultánea puede haber insertado alguna de las mismas
+    # claves: se descartan y se reintenta, de modo que el resultado es el
+    # número de filas realmente creadas (ignore_conflicts no lo devuelve)
+    while nuevas:
+        try:
+            with transaction.atomic():
+                Notificaciones.objects.bulk_create(nuevas, batch_size=tamano_lote)
+            return len(nuevas)
+        except IntegrityError:
+            claves = {notificacion.clave for notificacion in nuevas}
+            existentes = set(Notificaciones.objects.filter(clave__in=claves).values_list('clave', flat=True))
+            if not existentes:
+                raise
+            nuevas = [notificacion for notificacion in nuevas if notificacion.clave not in existentes]
+            for notificacion in nuevas:
+                notificacion.pk = None  # Asignada por un lote anterior deshecho
+                notificacion._state.adding = True
+    return 0
+
+
+def _insertar_recordatorios(fecha, refcita):
+    # Mismo texto y clave que redactar() y el camino con bulk_create, calculados en SQL
+    mensaje, params = [], []
+    for literal, campo, _, _ in string.Formatter().parse(PLANTILLAS['recordatorio'][1]):
+        if literal:
+            mensaje.append('%s')
+            params.append(literal)
+        if campo:
+            expresion, parametros = CAMPOS_SQL[campo]
+            mensaje.append(expresion)
+            params.extend(parametros)
+    if refcita:
+        mensaje.append("COALESCE(' Referencia: ' || NULLIF(c.refcita, '') || '.', '')")
+
+    estados = ', '.join(['%s'] * len(RECORDATORIOS_ESTADOS))
+    sql = f"""
+        INSERT INTO notificaciones (id_cita, tipo, mensaje, destinatario, intentos, proximo_intento, clave)
+        SELECT c.id_cita, 'recordatorio', {' || '.join(mensaje)}, p.email, 0, %s,
+               'recordatorio:' || c.id_cita || ':' || to_char(c.fecha, 'YYYYMMDD') || to_char(c.hora, 'HH24MI')
+        FROM cita c JOIN paciente p ON p.id_paciente = c.id_paciente
+        WHERE c.fecha = %s AND c.estado IN ({estados})
+        ON CONFLICT (clave) DO NOTHING
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, timezone.now(), fecha, *RECORDATORIOS_ESTADOS])
+        return cursor.rowcount
+
+
+# --- Transportes ---
+
+class Transporte(abc.ABC):
+    """
+    Medio de envío de notificaciones (settings.NOTIFICACIONES_TRANSPORTE).
+    Lo comparten los hilos de envío, así que debe poder usarse desde varios a la vez.
+    """
+
+    @abc.abstractmethod
+    def enviar(self, notificaciones):
+        """Envía un lote. Devuelve {id_notificacion: error} con las que han fallado."""
+
+
+class TransporteCorreo(Transporte):
+    """
+    Envío por correo con el backend de Django (EMAIL_BACKEND): SMTP en
+    producción y, en desarrollo, ficheros en EMAIL_FILE_PATH o memoria (locmem).
+    """
+
+    def enviar(self, notificaciones):
+        fallos = {}
+        # Una conexión por lote (una sola sesión SMTP)
+        with get_connection() as conexion:
+            for notificacion in notificaciones:
+                correo = EmailMessage(
+                    PLANTILLAS.get(notificacion.tipo, ('Consultorio',))[0],
+                    notificacion.mensaje,
+                    to=[notificacion.destinatario],
+                    connection=conexion,
+                )
+                try:
+                    correo.send()
+                except Exception as e:
+                    fallos[notificacion.pk] = str(e) or e.__class__.__name__
+        return fallos
+
+
+def cargar_transporte(ruta=None):
+    """Instancia el transporte configurado (ruta de importación de la clase)."""
+    ruta = ruta or getattr(settings, 'NOTIFICACIONES_TRANSPORTE', 'consultorio.notificaciones.TransporteCorreo')
+    return import_string(ruta)()
+
+
+# --- Envío (comando enviar_notificaciones) ---
+
+class MetricasEnvio:
+    """Contadores de envío compartidos por los hilos (rendimiento del comando)."""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self.inicio = time.perf_counter()
+        self.lotes = 0
+        self.enviadas = 0
+        self.fallidas = 0  # Envíos fallidos que se reintentarán
+        self.agotadas = 0  # Notificaciones que han agotado los intentos
+        self.segundos_envio = 0.0  # Tiempo dentro del transporte
+
+    def registrar(self, enviadas, fallidas, agotadas, segundos):
+        with self._bloqueo:
+            self.lotes += 1
+            self.enviadas += enviadas
+            self.fallidas += fallidas
+            self.agotadas += agotadas
+            self.segundos_envio += segundos
+
+    def resumen(self):
+        with self._bloqueo:
+            transcurrido = time.perf_counter() - self.inicio
+            return {
+                'lotes': self.lotes,
+                'enviadas': self.enviadas,
+                'fallidas': self.fallidas,
+                'agotadas': self.agotadas,
+                'segundos': round(transcurrido, 3),
+                'enviadas_por_segundo': round(self.enviadas / transcurrido, 1) if transcurrido else 0.0,
+                'ms_por_lote': round(self.segundos_envio * 1000 / self.lotes, 1) if self.lotes else 0.0,
+            }
+
+
+def retraso_reintento(intentos):
+    """Espera antes del siguiente intento: exponencial, con tope y ±20 % aleatorio."""
+    segundos = min(REINTENTO_BASE * 2 ** (intentos - 1), REINTENTO_MAX)
+    return datetime.timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def reservar_lote(tamano_lote=LOTE):
+    """
+    Toma hasta `tamano_lote` notificaciones listas para enviar y las aparta
+    RESERVA segundos (proximo_intento en el futuro) para el hilo que las envía.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        lote = list(
+            Notificaciones.objects.select_for_update(skip_locked=True)
+            .filter(fecha_envio__isnull=True, intentos__lt=MAX_INTENTOS, proximo_intento__lte=ahora)
+            .order_by('proximo_intento')[:tamano_lote]
+        )
+        Notificaciones.objects.filter(pk__in=[notificacion.pk for notificacion in lote]).update(
+            proximo_intento=ahora + datetime.timedelta(seconds=RESERVA)
+        )
+    return lote
+
+
+def enviar_pendientes(transporte, metricas, tamano_lote=LOTE):
+    """
+    Envía un lote de notificaciones pendientes. Devuelve cuántas se han
+    procesado (0 si no había ninguna lista para enviar).
+
+    El lote se reserva con SELECT ... FOR UPDATE SKIP LOCKED (cada hilo o
+    proceso toma un lote distinto sin esperar a los demás) y el bloqueo se
+    libera antes de enviar: el envío puede tardar lo que tarde el servidor SMTP.
+    """
+    lote = reservar_lote(tamano_lote)
+    if not lote:
+        return 0
+
+    inicio = time.perf_counter()
+    try:
+        fallos = transporte.enviar(lote)
+    except Exception as e:  # Fallo del transporte (p. ej. servidor SMTP caído): se reintenta todo el lote
+        fallos = {notificacion.pk: str(e) or e.__class__.__name__ for notificacion in lote}
+    segundos = time.perf_counter() - inicio
+
+    enviadas = [notificacion.pk for notificacion in lote if notificacion.pk not in fallos]
+    fallidas = [notificacion for notificacion in lote if notificacion.pk in fallos]
+    ahora = timezone.now()
+    for notificacion in fallidas:
+        notificacion.intentos += 1
+        notificacion.error = fallos[notificacion.pk][:1000]
+        notificacion.proximo_intento = ahora + retraso_reintento(notificacion.intentos)
+    with transaction.atomic():
+        Notificaciones.objects.filter(pk__in=enviadas).update(fecha_envio=ahora, error=None)
+        Notificaciones.objects.bulk_update(fallidas, ['intentos', 'error', 'proximo_intento'])
+
+    agotadas = sum(1 for notificacion in fallidas if notificacion.intentos >= MAX_INTENTOS)
+    metricas.registrar(len(enviadas), len(fallidas), agotadas, segundos)
+    return len(lote)
@@ -0,0 +1,202 @@
+import cProfile
+import datetime
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from .instrumentacion import ContadorConsultas
+
+# Perfilado de una petición concreta, a demanda (también en producción).
+#
+# Solo se perfilan las peticiones con la cabecera X-Perfilar, y solo si su
+# valor es una firma válida (comando firmar_perfilado, caduca a los
+# PERFILADO_VALIDEZ segundos) o la petición viene de una sesión de staff.
+# Sin la cabecera el coste es una búsqueda en request.META.
+#
+# X-Perfilar-Modo elige el perfilador:
+# - determinista (por defecto): cProfile, fichero .prof para pstats,
+#   snakeviz o flameprof;
+# - muestreo: la pila del hilo de la petición cada PERFILADO_INTERVALO
+#   segundos, fichero .txt en formato "collapsed" (flamegraph.pl, speedscope).
+# Los ficheros se escriben en PERFILADO_DIRECTORIO con la fecha, la vista, el
+# número de consultas SQL y la duración en el nombre, que se devuelve en la
+# cabecera X-Perfil. Con el servidor ASGI el perfil se toma en el hilo donde
+# la petición ejecuta su código síncrono (vistas síncronas y consultas del ORM
+# asíncrono, con sync_to_async): el bucle de eventos, compartido con las demás
+# peticiones, no se perfila, así que el código de las corrutinas no aparece.
+
+DIRECTORIO = getattr(settings, 'PERFILADO_DIRECTORIO', None)
+VALIDEZ = getattr(settings, 'PERFILADO_VALIDEZ', 3600)  # Segundos
+INTERVALO = getattr(settings, 'PERFILADO_INTERVALO', 0.001)  # Segundos entre muestras
+
+CABECERA = 'HTTP_X_PERFILAR'
+CABECERA_MODO = 'HTTP_X_PERFILAR_MODO'
+SAL = 'consultorio.perfilado'
+VALOR_FIRMADO = 'perfilar'
+
+# Un perfil a la vez: desde Python 3.12 no puede haber dos cProfile activos
+_perfilando = threading.Lock()
+
+
+def firma_perfilado():
+    """Valor de la cabecera X-Perfilar (válido durante PERFILADO_VALIDEZ segundos)."""
+    return signing.TimestampSigner(salt=SAL).sign(VALOR_FIRMADO)
+
+
+def _firma_valida(valor):
+    try:
+        return signing.TimestampSigner(salt=SAL).unsign(valor, max_age=VALIDEZ) == VALOR_FIRMADO
+    except signing.BadSignature:
+        return False
+
+
+def _staff(user):
+    return bool(user and user.is_active and user.is_staff)
+
+
+class Muestreo:
+    """Perfilador por muestreo: cuenta las pilas del hilo que lo arranca."""
+
+    def __init__(self, intervalo=INTERVALO):
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._hilo = None
+        self._fin = threading.Event()
+        self._muestreador = threading.Thread(target=self._muestrear, name='perfilado', daemon=True)
+
+    def enable(self):
+        self._hilo = threading.get_ident()  # Hilo que se muestrea
+        self._muestreador.start()
+
+    def disable(self):
+        self._fin.set()
+        self._muestreador.join()
+
+    def _muestrear(self):
+        while not self._fin.wait(self.intervalo):
+            marco = sys._current_frames().get(self._hilo)
+            pila = []
+            while marco is not None:
+                pila.append(f'{marco.f_globals.get("__name__", "?")}:{marco.f_code.co_name}')
+                marco = marco.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def dump_stats(self, fichero):
+        with open(fichero, 'w', encoding='utf-8') as f:
+            for pila, muestras in self.pilas.most_common():
+                f.write(f'{pila} {muestras}\n')
+
+
+PERFILADORES = {
+    # modo: (clase, extensión del fichero)
+    'determinista': (cProfile.Profile, 'prof'),
+    'muestreo': (Muestreo, 'txt'),
+}
+
+
+class PerfiladoMiddleware(MiddlewareMixin):
+    """
+    Perfila las peticiones con la cabecera X-Perfilar autorizada. Se activa
+    con settings.PERFILADO_DIRECTORIO; va después de AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not DIRECTORIO:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        valor = request.META.get(CABECERA)
+        if valor is None:
+            return self.get_response(request)
+        autorizada = _firma_valida(valor) or _staff(getattr(request, 'user', None))
+        if not autorizada or not _perfilando.acquire(blocking=False):
+            return self.get_response(request)
+        with Perfil(request) as perfil:
+            perfil.response = self.get_response(request)
+        return perfil.response
+
+    async def __acall__(self, request):
+        valor = request.META.get(CABECERA)
+        if valor is None:
+            return await self.get_response(request)
+        autorizada = _firma_valida(valor) or (hasattr(request, 'auser') and _staff(await request.auser()))
+        if not autorizada or not _perfilando.acquire(blocking=False):
+            return await self.get_response(request)
+        # Las consultas no se ejecutan en el hilo del bucle de eventos sino en
+        # el de sync_to_async de la petición (ThreadSensitiveContext de
+        # ASGIHandler): el perfil y el contador de consultas se activan en ese
+        # hilo, que es también donde se ejecutan las vistas síncronas
+        perfil = Perfil(request)
+        await sync_to_async(perfil.__enter__)()
+        try:
+            perfil.response = await self.get_response(request)
+        finally:
+            await sync_to_async(perfil.__exit__)(*sys.exc_info())
+        return perfil.response
+
+
+class Perfil:
+    """
+    Contexto que perfila un bloque y escribe el resultado en
+    PERFILADO_DIRECTORIO. Al salir libera _perfilando (adquirido antes).
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.response = None
+        self.modo = request.META.get(CABECERA_MODO, 'determinista')
+        if self.modo not in PERFILADORES:
+            self.modo = 'determinista'
+        clase, self.extension = PERFILADORES[self.modo]
+        self.perfilador = clase()
+        self.consultas = ContadorConsultas()
+        self._pila = ExitStack()
+
+    def __enter__(self):
+        # Consultas de todas las bases de datos (conexiones de este hilo: con
+        # ASGI, el de sync_to_async de la petición)
+        for alias in connections:
+            self._pila.enter_context(connections[alias].execute_wrapper(self.consultas))
+        self.inicio = time.perf_counter()
+        self.perfilador.enable()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.perfilador.disable()
+            duracion = (time.perf_counter() - self.inicio) * 1000
+            self._pila.close()
+            fichero = self.guardar(duracion)
+        finally:
+            _perfilando.release()
+        if self.response is not None:
+            self.response['X-Perfil'] = fichero.name
+        return False
+
+    def guardar(self, duracion):
+        match = self.request.resolver_match
+        vista = re.sub(r'[^\w.-]+', '_', match.view_name if match else 'sin_vista')
+        nombre = (
+            f'{datetime.datetime.now():%Y%m%d-%H%M%S-%f}-{self.request.method}-{vista}'
+            f'-{self.consultas.total}consultas-{duracion:.0f}ms.{self.extension}'
+        )
+        directorio = Path(DIRECTORIO)
+        directorio.mkdir(parents=True, exist_ok=True)
+        fichero = directorio / nombre
+        self.perfilador.dump_stats(fichero)
+        return fichero
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# Referencias de cita (refcita, Actividad 3).
+#
+# Cada referencia codifica un número único en base32 de Crockford (sin I, L,
+# O ni U, que se confunden al dictarlas) con 11 caracteres y un carácter de
+# control (Luhn mod 32) que detecta un carácter mal copiado y la mayoría de
+# las transposiciones. Los números salen de la secuencia cita_refcita_seq:
+# no se repiten nunca, así que no hay colisiones contra el índice único, y
+# como crecen con el tiempo las inserciones van al final del índice en lugar
+# de repartirse por páginas aleatorias. Al ser de ancho fijo y el alfabeto
+# estar en orden ASCII, el orden alfabético coincide con el numérico.
+#
+# Los números se reservan por bloques (una consulta por cada RESERVA
+# referencias) y los lotes piden todas las suyas en una sola consulta.
+
+ALFABETO = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+LONGITUD = 11  # Caracteres del número (55 bits) sin el de control
+SECUENCIA = 'cita_refcita_seq'
+
+RESERVA = getattr(settings, 'REFCITA_RESERVA', 50)  # Números que se piden a la secuencia de una vez
+
+# Lecturas ambiguas que se aceptan al buscar una referencia
+_EQUIVALENCIAS = str.maketrans({'I': '1', 'L': '1', 'O': '0', '-': None, ' ': None})
+
+# Sin secuencias (SQLite, desarrollo): milisegundos desde 2024 y un contador
+# de 12 bits, crecientes dentro del proceso
+EPOCA_MS = 1_704_067_200_000
+
+_bloqueo = threading.Lock()
+_reservados = []
+_ultimo = 0
+
+
+def _control(digitos):
+    # Luhn mod 32: se duplica uno de cada dos dígitos empezando por el último
+    suma, factor = 0, 2
+    for digito in reversed(digitos):
+        producto = digito * factor
+        suma += producto // 32 + producto % 32
+        factor = 3 - factor
+    return (32 - suma % 32) % 32
+
+
+def codificar_refcita(numero):
+    """Referencia de 12 caracteres para `numero` (0 <= numero < 32**11)."""
+    digitos = []
+    for _ in range(LONGITUD):
+        numero, resto = divmod(numero, 32)
+        digitos.append(resto)
+    if numero:
+        raise ValueError('El número no cabe en una referencia.')
+    digitos.reverse()
+    return ''.join(ALFABETO[d] for d in digitos) + ALFABETO[_control(digitos)]
+
+
+def normalizar_refcita(valor):
+    """Mayúsculas, sin guiones ni espacios y con I/L -> 1 y O -> 0."""
+    return valor.upper().translate(_EQUIVALENCIAS)
+
+
+def refcita_valida(valor):
+    """Indica si `valor` es una referencia completa con el carácter de control correcto."""
+    valor = normalizar_refcita(valor)
+    if len(valor) != LONGITUD + 1 or any(c not in ALFABETO for c in valor):
+        return False
+    digitos = [ALFABETO.index(c) for c in valor]
+    return _control(digitos[:-1]) == digitos[-1]
+
+
+def _numeros_secuencia(cantidad):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nextval('{SECUENCIA}') FROM generate_series(1, %s)", [cantidad])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _numeros_tiempo(cantidad):
+    global _ultimo
+    numeros = []
+    for _ in range(cantidad):
+        _ultimo = max(_ultimo + 1, (int(time.time() * 1000) - EPOCA_MS) << 12)
+        numeros.append(_ultimo)
+    return numeros
+
+
+def generar_refcitas(cantidad):
+    """Devuelve `cantidad` referencias nuevas, distintas entre sí y de todas las anteriores."""
+    with _bloqueo:
+        if connection.vendor != 'postgresql':
+            return [codificar_refcita(n) for n in _numeros_tiempo(cantidad)]
+        if len(_reservados) < cantidad:
+            _reservados.extend(_numeros_secuencia(max(cantidad - len(_reservados), RESERVA)))
+        numeros = _reservados[:cantidad]
+        del _reservados[:cantidad]
+    return [codificar_refcita(n) for n in numeros]
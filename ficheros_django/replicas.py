@@ -0,0 +1,134 @@
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+
+# Réplicas de lectura.
+#
+# RouterReplicas envía las lecturas a una de las réplicas (settings.REPLICAS,
+# alias de DATABASES) y las escrituras a la principal. Lee de la principal:
+# - dentro de una transacción de la principal (p. ej. select_for_update);
+# - durante el resto de la petición tras una escritura, y en las peticiones
+#   POST/PUT/PATCH/DELETE (ReplicasMiddleware);
+# - en las peticiones que siguen a una escritura del mismo cliente durante
+#   REPLICAS_RETRASO_MAXIMO segundos (cookie), para que vea sus cambios;
+# - si ninguna réplica responde con un retraso menor que REPLICAS_RETRASO_MAXIMO.
+#
+# Para probarlo en local basta con dos ficheros SQLite: DATABASES['replica1']
+# con una copia de la base de datos y REPLICAS = ['replica1'] (sin replicación,
+# el retraso se considera 0).
+
+REPLICAS = getattr(settings, 'REPLICAS', [])  # Alias de DATABASES
+RETRASO_MAXIMO = getattr(settings, 'REPLICAS_RETRASO_MAXIMO', 5)  # Segundos
+COMPROBACION = getattr(settings, 'REPLICAS_COMPROBACION', 2)  # Segundos entre comprobaciones del retraso
+
+COOKIE = 'consultorio_primaria'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+# Retraso de la réplica en segundos (0 si ha aplicado todo lo recibido de la
+# principal) o NULL si no está recibiendo WAL: sin el proceso walreceiver
+# conectado (principal caída, réplica desconectada o promovida) lo recibido
+# coincide con lo aplicado aunque la principal haya seguido escribiendo.
+# La columna status solo es visible con el rol pg_read_all_stats; sin él basta
+# con que exista el proceso.
+SQL_RETRASO = """
+    SELECT CASE WHEN NOT EXISTS (
+                    SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'
+                ) THEN NULL
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+_primaria = ContextVar('consultorio_primaria', default=False)
+_replica = ContextVar('consultorio_replica', default=None)  # Réplica elegida para la petición
+_estado = {}  # alias: (momento de la comprobación, disponible)
+
+
+@contextmanager
+def primaria():
+    """Dentro del bloque todas las lecturas van a la base de datos principal."""
+    token = _primaria.set(True)
+    try:
+        yield
+    finally:
+        _primaria.reset(token)
+
+
+def retraso(alias):
+    """Segundos de retraso de la réplica `alias` respecto a la principal (infinito si no replica)."""
+    if connections[alias].vendor != 'postgresql':
+        return 0
+    with connections[alias].cursor() as cursor:
+        cursor.execute(SQL_RETRASO)
+        segundos = cursor.fetchone()[0]
+    return math.inf if segundos is None else float(segundos)
+
+
+def replica_disponible(alias):
+    # El resultado se reutiliza COMPROBACION segundos: no hay una consulta extra por petición
+    ahora = time.monotonic()
+    comprobado, disponible = _estado.get(alias, (None, False))
+    if comprobado is not None and ahora - comprobado < COMPROBACION:
+        return disponible
+    _estado[alias] = (ahora, disponible)  # Los demás hilos usan el valor anterior mientras tanto
+    try:
+        disponible = retraso(alias) <= RETRASO_MAXIMO
+    except DatabaseError:
+        disponible = False  # Réplica caída: se vuelve a probar tras COMPROBACION segundos
+    _estado[alias] = (ahora, disponible)
+    return disponible
+
+
+class RouterReplicas:
+    """Router de settings.DATABASE_ROUTERS: lecturas a las réplicas, escrituras a la principal."""
+
+    def db_for_read(self, model, **hints):
+        if _primaria.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Toda la petición lee de la misma réplica: con varias, la versión de
+        # una tabla (ETag) y sus datos podrían venir de réplicas con distinto retraso
+        alias = _replica.get()
+        if alias is None or not replica_disponible(alias):
+            disponibles = [alias for alias in REPLICAS if replica_disponible(alias)]
+            if not disponibles:
+                return DEFAULT_DB_ALIAS
+            alias = random.choice(disponibles)
+            _replica.set(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _primaria.set(True)  # El resto de la petición lee lo que acaba de escribir
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Mismos datos en todas las bases de datos
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicasMiddleware(MiddlewareMixin):
+    """
+    Decide al empezar cada petición si sus lecturas pueden ir a las réplicas
+    y marca con una cookie a los clientes que acaban de escribir.
+    """
+
+    def __init__(self, get_response):
+        if not REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        _replica.set(None)
+        _primaria.set(request.method not in METODOS_SEGUROS or COOKIE in request.COOKIES)
+
+    def process_response(self, request, response):
+        if request.method not in METODOS_SEGUROS:
+            response.set_cookie(COOKIE, '1', max_age=math.ceil(RETRASO_MAXIMO), httponly=True, samesite='Lax')
+        return response
@@ -1,32 +1,60 @@
+from datetime import date
+
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
+from .instrumentacion import ListaMedida, SerializacionMedidaMixin
 from .models import Cita, Medico, Paciente
 
+ESTADOS_RESERVA = ('confirmada', 'pendiente')  # Estados con los que se puede reservar una cita
+
+
+def fecha_no_pasada(value):
+    """Validador de campos de fecha: rechaza las fechas anteriores a hoy."""
+    if value < date.today():  # Verifica si la fecha es pasada
+        raise serializers.ValidationError("La fecha no puede ser en el pasado.")
+
 
 # Serializer para el modelo Paciente
-class PacienteSerializer(serializers.ModelSerializer):
+class PacienteSerializer(SerializacionMedidaMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo Paciente.
     Convierte instancias de Paciente en datos JSON y viceversa.
     """
     class Meta:
         model = Paciente  # Modelo asociado al serializer
+        list_serializer_class = ListaMedida  # Tiempo de serialización en Server-Timing
         fields = '__all__'  # Incluye todos los campos del modelo
 
 
+# Serializer para la importación masiva de pacientes
+class PacienteImportacionSerializer(PacienteSerializer):
+    """
+    Igual que PacienteSerializer pero sin los validadores de unicidad
+    (email, DNI...), que lanzan una consulta por fila. En la importación
+    masiva la unicidad se comprueba por lotes con una sola consulta.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        for campo in fields.values():
+            campo.validators = [v for v in campo.validators if not isinstance(v, UniqueValidator)]
+        return fields
+
+
 # Serializer para el modelo Medico
-class MedicoSerializer(serializers.ModelSerializer):
+class MedicoSerializer(SerializacionMedidaMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo Medico.
     Convierte instancias de Medico en datos JSON y viceversa.
     """
     class Meta:
         model = Medico  # Modelo asociado al serializer
+        list_serializer_class = ListaMedida  # Tiempo de serialización en Server-Timing
         fields = '__all__'  # Incluye todos los campos del modelo
 
 
 # Serializer para el modelo Cita
-class CitaSerializer(serializers.ModelSerializer):
+class CitaSerializer(SerializacionMedidaMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo Cita.
     Incluye validaciones personalizadas para los campos `fecha` y `hora`.
@@ -44,17 +72,24 @@ class CitaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cita  # Modelo asociado al serializer
+        list_serializer_class = ListaMedida  # Tiempo de serialización en Server-Timing
         fields = '__all__'  # Incluye todos los campos del modelo
         read_only_fields = ['id_cita']  # El campo `id_cita` es de solo lectura
 
+    @staticmethod
+    def optimizar_queryset(queryset):
+        """
+        Carga paciente y médico en la misma consulta (JOIN).
+        Sin esto, cada cita serializada lanza dos consultas adicionales.
+        """
+        return queryset.select_related('id_paciente', 'id_medico')
+
     def validate_fecha(self, value):
         """
         Validación personalizada para el campo `fecha`.
         Se asegura de que la fecha no sea anterior a la fecha actual.
         """
-        from datetime import date
-        if value < date.today():  # Verifica si la fecha es pasada
-            raise serializers.ValidationError("La fecha no puede ser en el pasado.")
+        fecha_no_pasada(value)
         return value  # Retorna la fecha si es válida
 
     def validate_hora(self, value):
@@ -68,3 +103,65 @@ class CitaSerializer(serializers.ModelSerializer):
         if value < datetime.time(9, 0) or value > datetime.time(17, 0):
             raise serializers.ValidationError("La hora debe estar entre las 09:00 y las 17:00.")
         return value  # Retorna la hora si es válida
+
+
+# Serializer resumido para el modelo Cita
+class CitaResumenSerializer(SerializacionMedidaMixin, serializers.ModelSerializer):
+    """
+    Representación "ligera" de una cita para listados.
+    Devuelve solo los IDs y el nombre visible del paciente y del médico
+    en lugar de los objetos completos.
+    """
+    id_paciente = serializers.IntegerField(source='id_paciente_id', read_only=True)  # ID del paciente
+    paciente = serializers.SerializerMethodField()  # Nombre y apellido del paciente
+    id_medico = serializers.IntegerField(source='id_medico_id', read_only=True)  # ID del médico
+    medico = serializers.CharField(source='id_medico.nombre', read_only=True)  # Nombre del médico
+
+    class Meta:
+        model = Cita  # Modelo asociado al serializer
+        list_serializer_class = ListaMedida  # Tiempo de serialización en Server-Timing
+        fields = ['id_cita', 'id_paciente', 'paciente', 'id_medico', 'medico', 'fecha', 'hora', 'estado']
+        read_only_fields = fields  # Solo lectura
+
+    def get_paciente(self, obj):
+        return f"{obj.id_paciente.nombre} {obj.id_paciente.apellido}"
+
+    # Columnas de la cita que se cargan: las del resumen y las de ordenación del
+    # listado, que la paginación por cursor lee de cada cita para formar el
+    # cursor (si se difirieran, sería una consulta más por cita)
+    CAMPOS_CITA = ('id_cita', 'fecha', 'hora', 'estado', 'especialidad', 'refcita')
+
+    @classmethod
+    def optimizar_queryset(cls, queryset):
+        """
+        Carga en un único JOIN solo las columnas necesarias para el resumen.
+        """
+        existentes = {campo.name for campo in Cita._meta.concrete_fields}  # refcita solo en Actividad 3
+        return queryset.select_related('id_paciente', 'id_medico').only(
+            *(campo for campo in cls.CAMPOS_CITA if campo in existentes),
+            'id_paciente', 'id_paciente__nombre', 'id_paciente__apellido',
+            'id_medico', 'id_medico__nombre',
+        )
+
+
+# Serializers para la cita automática (búsqueda y reserva del primer hueco libre)
+class HuecosSerializer(serializers.Serializer):
+    """Parámetros de la búsqueda de los próximos huecos libres de una especialidad."""
+    especialidad = serializers.CharField(max_length=100)  # Especialidad (sin distinguir mayúsculas)
+    id_medico = serializers.IntegerField(required=False)  # Opcional: un único médico
+    desde = serializers.DateField(required=False, validators=[fecha_no_pasada])  # Primera fecha (por defecto hoy)
+    hora_desde = serializers.TimeField(required=False)  # Franja horaria preferida
+    hora_hasta = serializers.TimeField(required=False)  # (hora_hasta excluida)
+    cantidad = serializers.IntegerField(required=False, default=1, min_value=1)  # Huecos a devolver
+
+    def validate(self, data):
+        if data.get('hora_desde') and data.get('hora_hasta') and data['hora_hasta'] <= data['hora_desde']:
+            raise serializers.ValidationError({'hora_hasta': ["Debe ser posterior a hora_desde."]})
+        return data
+
+
+class ReservaAutomaticaSerializer(HuecosSerializer):
+    """Datos de una cita automática: el paciente y las preferencias de la búsqueda."""
+    id_paciente = serializers.PrimaryKeyRelatedField(queryset=Paciente.objects.all())  # Paciente de la cita
+    estado = serializers.ChoiceField(choices=ESTADOS_RESERVA, required=False, default='confirmada')  # Estado de la cita
+    cantidad = None  # Siempre se reserva un único hueco
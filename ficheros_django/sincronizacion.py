@@ -0,0 +1,115 @@
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .condicional import estado_versiones, respuesta_tablas
+from .models import Cambio
+
+# Sincronización incremental de listados (?since=<versión>).
+#
+# Los triggers de la tabla `cambio` anotan la transacción que insertó,
+# modificó o borró por última vez cada fila. Un cliente que ya tiene el
+# listado envía la versión que recibió la vez anterior y solo obtiene las
+# filas creadas o modificadas desde entonces (`cambios`) y los IDs de las
+# borradas (`eliminados`), con el coste de esos cambios y no del listado completo.
+#
+# La versión es el horizonte de transacciones (condicional.estado_versiones):
+# las anteriores ya han terminado y sus cambios están en los datos enviados.
+# Las posteriores pueden confirmarse después en cualquier orden, así que se
+# devuelven los cambios de transacciones >= la versión del cliente (alguno
+# puede repetirse; aplicarlo otra vez no cambia nada).
+# Con since=0, una versión mal formada o anterior al último TRUNCATE de alguna
+# de las tablas se devuelve el listado completo (`completo: true`) y el
+# cliente debe sustituir sus datos en lugar de aplicar los cambios.
+#
+# Los cambios (o el listado completo) se envían por páginas con cursor
+# (`siguiente`: URL de la página siguiente o null). El cliente conserva la
+# versión de la primera página: lo que cambie mientras pide las demás llega
+# en la próxima sincronización.
+
+PARAMETRO = 'since'
+
+
+def estado_tablas(tablas):
+    """Devuelve (horizonte, [transacción del último TRUNCATE de cada tabla])."""
+    horizonte, estado = estado_versiones(tablas)
+    return horizonte, [estado.get(tabla, (0,))[0] for tabla in tablas]
+
+
+def leer_version(valor):
+    """Convierte la versión en un entero o devuelve None si no es válida."""
+    valor = str(valor)
+    return int(valor) if valor.isdigit() else None
+
+
+class PaginacionSincronizacion(CursorPagination):
+    """Páginas de la sincronización en orden de clave primaria."""
+    page_size = 500
+    ordering = 'pk'
+
+
+def cambios_desde(tabla, version, operaciones=None):
+    """Subconsulta con los IDs de las filas de `tabla` cambiadas en transacciones >= `version`."""
+    cambios = Cambio.objects.filter(tabla=tabla, version__gte=version)
+    if operaciones:
+        cambios = cambios.filter(operacion__in=operaciones)
+    return cambios.values('id_registro')
+
+
+class SincronizacionMixin:
+    """
+    Mixin para ViewSets: `list` con ?since=<versión> devuelve solo los
+    cambios desde esa versión.
+
+    La primera tabla de `tablas_version` es la del modelo del ViewSet; para
+    las demás, `relaciones_sincronizacion` indica el campo que las relaciona
+    (p. ej. una cita se reenvía si cambia su paciente). La sincronización
+    no aplica filtros y pagina con `paginacion_sincronizacion`.
+    """
+    tablas_version = ()
+    relaciones_sincronizacion = {}
+    paginacion_sincronizacion = PaginacionSincronizacion
+
+    def list(self, request, *args, **kwargs):
+        if PARAMETRO not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.sincronizar(request)
+
+    def sincronizar(self, request):
+        # 304 si el cliente ya tiene la respuesta a esta misma versión
+        return respuesta_tablas(request, self.tablas_version, lambda: Response(
+            self.datos_sincronizacion(request.query_params[PARAMETRO], request)
+        ))
+
+    def datos_sincronizacion(self, desde, request):
+        tablas = self.tablas_version
+        # El horizonte se lee antes que los cambios: lo confirmado antes de
+        # él es visible en las consultas siguientes (y lo posterior se
+        # reenvía en la próxima sincronización)
+        horizonte, reinicios = estado_tablas(tablas)
+        desde = leer_version(desde)
+        queryset = self.get_queryset()
+
+        # Un TRUNCATE que no había terminado al leer la versión del cliente
+        # (transacción >= desde) pudo borrar filas que el cliente aún tiene
+        completo = not desde or desde > horizonte or any(desde <= reiniciado for reiniciado in reinicios)
+        eliminados = []
+        if not completo:
+            filtro = Q(pk__in=cambios_desde(tablas[0], desde, ('I', 'U')))
+            for tabla in tablas[1:]:
+                campo = self.relaciones_sincronizacion[tabla]
+                filtro |= Q(**{f'{campo}__in': cambios_desde(tabla, desde)})
+            queryset = queryset.filter(filtro)
+            # Los borrados van enteros en la primera página
+            if self.paginacion_sincronizacion.cursor_query_param not in request.query_params:
+                eliminados = list(cambios_desde(tablas[0], desde, ('D',)).values_list('id_registro', flat=True))
+
+        paginador = self.paginacion_sincronizacion()
+        pagina = paginador.paginate_queryset(queryset, request, view=self)
+        return {
+            'version': str(horizonte),
+            'completo': completo,
+            'cambios': self.get_serializer(pagina, many=True).data,
+            'eliminados': eliminados,
+            'siguiente': paginador.get_next_link(),
+        }
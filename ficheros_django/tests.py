@@ -0,0 +1,982 @@
+import datetime
+import gzip
+import io
+import pstats
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core import mail
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from . import compresion, metricas, notificaciones, perfilado, referencias as referencias_cita, replicas
+from .disponibilidad import reconstruir_ocupacion
+from .models import Cambio, Cita, Medico, Notificaciones, OcupacionMedico, Paciente
+from .sincronizacion import PaginacionSincronizacion
+
+# Pruebas de la aplicación consultorio (Actividad 2 y Actividad 3).
+#
+# Los modelos son `managed = False`: el esquema lo crean los scripts de
+# ficheros_desarrollo y las migraciones solo lo amplían. En SQLite las tablas
+# que faltan se crean al cargar el módulo de pruebas; en PostgreSQL la base de
+# datos de pruebas debe partir de una plantilla con el esquema
+# (DB_TEST_TEMPLATE, base de datos creada con consultorio.sql).
+# Las pruebas de vistas que no existen en el proyecto (p. ej. CitaViewSet en
+# Actividad 2) se omiten.
+
+# Índice único parcial de consultorio.sql (una cita activa por médico y hora)
+SQL_HORARIO_UNICO = (
+    'CREATE UNIQUE INDEX IF NOT EXISTS cita_medico_horario_unico '
+    "ON cita (id_medico, fecha, hora) WHERE estado <> 'cancelada'"
+)
+
+
+# Réplica de ReplicasTests: otra base de datos SQLite (en memoria) que el
+# ejecutor de pruebas crea junto a la de pruebas
+REPLICA_PRUEBAS = 'replica_pruebas'
+connections.settings.setdefault(REPLICA_PRUEBAS, {
+    **connections.settings[DEFAULT_DB_ALIAS],
+    'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:', 'HOST': '', 'PORT': '', 'USER': '', 'PASSWORD': '',
+    'OPTIONS': {}, 'TEST': {'NAME': None, 'MIGRATE': False, 'MIRROR': None, 'CHARSET': None, 'COLLATION': None},
+})
+
+
+def crear_tablas(conexion):
+    existentes = set(conexion.introspection.table_names())
+    with conexion.schema_editor() as editor:
+        for modelo in apps.get_app_config('consultorio').get_models():
+            if modelo._meta.db_table not in existentes:
+                editor.create_model(modelo)
+        editor.execute(SQL_HORARIO_UNICO)
+
+
+def setUpModule():
+    crear_tablas(connection)
+
+
+def crear(modelo, **campos):
+    """Crea una fila con los campos que existen en el modelo de este proyecto."""
+    existentes = {campo.name for campo in modelo._meta.concrete_fields}
+    return modelo.objects.create(**{k: v for k, v in campos.items() if k in existentes})
+
+
+def url(nombre, **kwargs):
+    try:
+        return reverse(nombre, kwargs=kwargs)
+    except NoReverseMatch:
+        return None
+
+
+class DatosConsultorio:
+    """Un paciente y dos médicos de la misma especialidad."""
+
+    @classmethod
+    def crear_datos(cls):
+        cls.paciente = crear(
+            Paciente, nombre='Ana', apellido='García', email='ana@ejemplo.es', telefono='600000000',
+            contrasena='x', dni='12345678Z',
+        )
+        cls.medicos = [
+            crear(Medico, nombre=f'Médico {n}', especialidad='Cardiología', correo=f'medico{n}@ejemplo.es',
+                  email=f'medico{n}@ejemplo.es', ncolegiado=f'2800{n}')
+            for n in range(2)
+        ]
+        cls.manana = datetime.date.today() + datetime.timedelta(days=1)
+
+    @classmethod
+    def crear_citas(cls, cantidad, desde=0):
+        # Citas en horas distintas (una por médico, hora y día)
+        for n in range(desde, desde + cantidad):
+            dia, resto = divmod(n, 2 * 8)
+            medico, hora = divmod(resto, 8)
+            crear(
+                Cita, id_paciente=cls.paciente, id_medico=cls.medicos[medico],
+                fecha=cls.manana + datetime.timedelta(days=dia), hora=datetime.time(9 + hora),
+                especialidad=f'Especialidad {n % 3}', estado='confirmada',
+            )
+
+
+class ConsultasListadoCitasTests(DatosConsultorio, TestCase):
+    """
+    Los listados de citas cargan paciente y médico con JOIN: el número de
+    consultas no depende del número de citas devueltas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def consultas(self, ruta, parametros):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(ruta, parametros)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content[:200])
+        return len(contexto.captured_queries)
+
+    def comprobar_constante(self, ruta, parametros):
+        self.crear_citas(3)
+        pocas = self.consultas(ruta, parametros)
+        self.crear_citas(20, desde=3)
+        with self.assertNumQueries(pocas):
+            self.client.get(ruta, parametros)
+
+    def test_citas_paciente(self):
+        ruta = url('cancelar_reprogramar_cita')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 2')
+        self.comprobar_constante(ruta, {'id_paciente': self.paciente.pk})
+
+    def test_citas_paciente_resumen(self):
+        ruta = url('cancelar_reprogramar_cita')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 2')
+        self.comprobar_constante(ruta, {'id_paciente': self.paciente.pk, 'vista': 'resumen'})
+
+    def test_listado(self):
+        ruta = url('cita-list')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        self.comprobar_constante(ruta, {'page_size': 100})
+
+    def test_listado_resumen_ordenado(self):
+        ruta = url('cita-list')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        # La paginación por cursor lee de la primera y la última cita de la
+        # página los campos de ordenación: con cualquier orden, las mismas
+        # consultas que con el orden por defecto
+        self.crear_citas(25)
+        Cita.objects.update(especialidad='Cardiología')
+        parametros = {'vista': 'resumen', 'page_size': 10}
+        base = self.consultas(ruta, {**parametros, 'ordering': 'id_cita'})
+        for orden in ('especialidad', '-refcita', 'fecha', 'estado', 'paciente'):
+            with self.subTest(ordering=orden), self.assertNumQueries(base):
+                self.client.get(ruta, {**parametros, 'ordering': orden})
+
+    def test_cursor_recorre_todas_las_citas(self):
+        ruta = url('cita-list')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        # Más citas por valor repetido que por página: el cursor debe avanzar
+        # por (campo, id_cita) y no repetir ni saltarse ninguna cita
+        self.crear_citas(23)
+        Cita.objects.filter(pk__in=Cita.objects.order_by('pk').values('pk')[:5]).update(especialidad=None)
+        esperadas = sorted(Cita.objects.values_list('pk', flat=True))
+        for orden in ('estado', 'especialidad', '-especialidad', 'fecha', '-fecha', 'paciente', 'medico', '-refcita'):
+            with self.subTest(ordering=orden):
+                vistas, paginas = [], []
+                siguiente = self.client.get(ruta, {'ordering': orden, 'page_size': 4}).json()
+                while True:
+                    paginas.append([cita['id_cita'] for cita in siguiente['results']])
+                    vistas += paginas[-1]
+                    if not siguiente['next']:
+                        break
+                    siguiente = self.client.get(siguiente['next']).json()
+                self.assertEqual(sorted(vistas), esperadas)
+                # Hacia atrás, las mismas páginas en orden inverso
+                while siguiente['previous']:
+                    siguiente = self.client.get(siguiente['previous']).json()
+                    paginas.pop()
+                    self.assertEqual([cita['id_cita'] for cita in siguiente['results']], paginas[-1])
+                self.assertEqual(len(paginas), 1)
+
+    def test_cursor_no_valido(self):
+        ruta = url('cita-list')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        self.assertEqual(self.client.get(ruta, {'cursor': 'no-valido'}).status_code, 404)
+
+
+class ReservasConcurrentesTests(DatosConsultorio, TransactionTestCase):
+    """
+    Reservas simultáneas desde varios hilos (cada uno con su conexión): el
+    índice único cita_medico_horario_unico deja pasar una sola reserva por
+    horario y el resto recibe 409, sin citas duplicadas.
+    """
+    HILOS = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Con la base de datos en memoria los hilos no pueden escribir a la vez
+            # ("database table is locked"): hace falta un fichero (TEST['NAME'])
+            self.skipTest('SQLite en memoria')
+        self.crear_datos()
+        self.ruta = url('agendar_cita') or url('cita-list')
+
+    def tearDown(self):
+        # TransactionTestCase solo vacía las tablas de los modelos gestionados
+        for modelo in (Notificaciones, Cita, OcupacionMedico, Medico, Paciente):
+            modelo.objects.all().delete()
+
+    def reservar_a_la_vez(self, reservas):
+        barrera = threading.Barrier(len(reservas))
+        estados = []
+
+        def reservar(datos):
+            try:
+                barrera.wait()  # Todas las peticiones salen a la vez
+                estados.append(Client().post(self.ruta, datos, content_type='application/json').status_code)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar, args=(datos,)) for datos in reservas]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return sorted(estados)
+
+    def reserva(self, medico, hora):
+        return {
+            'id_paciente_id': self.paciente.pk, 'id_medico_id': medico.pk, 'fecha': self.manana.isoformat(),
+            'hora': hora, 'especialidad': medico.especialidad, 'estado': 'confirmada',
+        }
+
+    def test_mismo_horario(self):
+        for intento in range(3):
+            hora = f'{10 + intento}:00:00'
+            with self.subTest(hora=hora):
+                estados = self.reservar_a_la_vez([self.reserva(self.medicos[0], hora)] * self.HILOS)
+                self.assertEqual(estados, [201] + [409] * (self.HILOS - 1))
+                activas = Cita.objects.filter(id_medico=self.medicos[0], fecha=self.manana, hora=hora)
+                self.assertEqual(activas.exclude(estado='cancelada').count(), 1)
+
+    def test_horarios_distintos(self):
+        # Sin falsos conflictos: cada médico y hora admite su propia reserva
+        reservas = [self.reserva(medico, f'{9 + n}:00:00') for medico in self.medicos for n in range(4)]
+        self.assertEqual(self.reservar_a_la_vez(reservas), [201] * len(reservas))
+        self.assertEqual(Cita.objects.count(), len(reservas))
+
+
+class CatalogoMedicosTests(TestCase):
+    """Fichas de médico servidas desde la caché del catálogo (MedicoViewSet)."""
+
+    def test_id_no_numerico(self):
+        ruta = url('medico-detail', pk='abc')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        self.assertEqual(self.client.get(ruta).status_code, 404)
+
+
+class SincronizacionTests(TestCase):
+    """Sincronización de listados con ?since= (SincronizacionMixin)."""
+
+    def setUp(self):
+        self.ruta = url('paciente-list')
+        if self.ruta is None:
+            self.skipTest('Vista de Actividad 3')
+
+    @mock.patch.object(PaginacionSincronizacion, 'page_size', 2)
+    def test_completo_paginado(self):
+        for n in range(5):
+            crear(Paciente, nombre=f'Paciente {n}', apellido='Ruiz', email=f'p{n}@ejemplo.es', contrasena='x',
+                  dni=f'0000000{n}')
+        respuesta = self.client.get(self.ruta, {'since': 0}).json()
+        self.assertTrue(respuesta['completo'])
+        paginas = [respuesta]
+        while paginas[-1]['siguiente']:
+            paginas.append(self.client.get(paginas[-1]['siguiente']).json())
+        self.assertEqual([len(pagina['cambios']) for pagina in paginas], [2, 2, 1])
+        ids = [paciente['id_paciente'] for pagina in paginas for paciente in pagina['cambios']]
+        self.assertEqual(sorted(ids), list(Paciente.objects.order_by('pk').values_list('pk', flat=True)))
+
+
+class CitaAutomaticaTests(DatosConsultorio, TestCase):
+    """Validación de la reserva del primer hueco libre (POST huecos)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        self.ruta = url('cita_automatica') or url('cita-huecos')
+
+    def reservar(self, **datos):
+        return self.client.post(self.ruta, {
+            'id_paciente': self.paciente.pk, 'especialidad': 'Cardiología', **datos,
+        }, content_type='application/json')
+
+    def test_estado_no_valido(self):
+        respuesta = self.reservar(estado='cancelada')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('estado', respuesta.json())
+        self.assertFalse(Cita.objects.exists())
+
+    def test_desde_pasado(self):
+        respuesta = self.reservar(desde=(datetime.date.today() - datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('desde', respuesta.json())
+
+
+class LotesCitasTests(DatosConsultorio, TestCase):
+    """Operaciones por lotes sobre citas (POST /cita/lote/, lotes.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+
+    def setUp(self):
+        self.ruta = url('cita-lote')
+        if self.ruta is None:
+            self.skipTest('Vista de Actividad 3')
+
+    def crear(self, hora, medico=0, dia=0):
+        return {
+            'operacion': 'crear', 'id_paciente_id': self.paciente.pk, 'id_medico_id': self.medicos[medico].pk,
+            'fecha': (self.manana + datetime.timedelta(days=dia)).isoformat(), 'hora': f'{hora:02d}:00',
+        }
+
+    def lote(self, operaciones):
+        respuesta = self.client.post(self.ruta, operaciones, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 207, respuesta.content[:200])
+        return [resultado['status'] for resultado in respuesta.json()['resultados']]
+
+    def test_mismo_horario_en_el_lote(self):
+        self.assertEqual(self.lote([self.crear(9), self.crear(9), self.crear(9, medico=1)]), [201, 409, 201])
+        self.assertEqual(Cita.objects.count(), 2)
+
+    def test_cancelar_y_reservar_el_mismo_horario(self):
+        self.crear_citas(1)
+        cita = Cita.objects.get()
+        self.assertEqual(self.lote([{'operacion': 'cancelar', 'id_cita': cita.pk}, self.crear(9)]), [200, 201])
+        self.assertEqual(
+            list(Cita.objects.order_by('pk').values_list('estado', flat=True)), ['cancelada', 'confirmada']
+        )
+
+    def test_reprogramar_al_horario_que_deja_otra(self):
+        self.crear_citas(2)
+        primera, segunda = Cita.objects.order_by('pk')
+        manana = self.manana.isoformat()
+        self.assertEqual(self.lote([
+            {'operacion': 'reprogramar', 'id_cita': segunda.pk, 'fecha': manana, 'hora': '11:00'},
+            {'operacion': 'reprogramar', 'id_cita': primera.pk, 'fecha': manana, 'hora': '10:00'},
+            self.crear(9),
+        ]), [200, 200, 201])
+        self.assertEqual(
+            list(Cita.objects.order_by('pk').values_list('hora', 'estado')),
+            [(datetime.time(10), 'confirmada'), (datetime.time(11), 'confirmada'), (datetime.time(9), 'confirmada')],
+        )
+
+    def test_conflicto_con_citas_existentes(self):
+        self.crear_citas(2)  # Médico 0, mañana a las 9:00 y a las 10:00
+        primera, segunda = Cita.objects.order_by('pk')
+        resultados = self.lote([
+            self.crear(9),
+            {'operacion': 'reprogramar', 'id_cita': segunda.pk, 'fecha': self.manana.isoformat(), 'hora': '09:00'},
+            self.crear(11),
+            {'operacion': 'cancelar', 'id_cita': 0},
+        ])
+        self.assertEqual(resultados, [409, 409, 201, 404])
+        segunda.refresh_from_db()
+        self.assertEqual(segunda.hora, datetime.time(10))
+        self.assertEqual(Cita.objects.count(), 3)
+
+    def test_ocupacion_coincide_con_reconstruccion(self):
+        self.crear_citas(4)
+        reconstruir_ocupacion()
+        citas = list(Cita.objects.order_by('pk'))
+        self.lote([
+            {'operacion': 'cancelar', 'id_cita': citas[0].pk},
+            {'operacion': 'reprogramar', 'id_cita': citas[1].pk, 'fecha': self.manana.isoformat(), 'hora': '15:00'},
+            {'operacion': 'reprogramar', 'id_cita': citas[2].pk, 'fecha': self.manana.isoformat(), 'hora': '09:00'},
+            self.crear(12, dia=1),
+            self.crear(10, medico=1),
+        ])
+        ocupacion = lambda: sorted(OcupacionMedico.objects.values_list('id_medico', 'fecha', 'ocupados'))
+        tras_lote = ocupacion()
+        reconstruir_ocupacion()
+        self.assertEqual(tras_lote, ocupacion())
+
+    def test_mil_operaciones(self):
+        # Las mismas lecturas sea cual sea el tamaño del lote: solo crece el
+        # número de INSERT en bloque (SQLite admite menos parámetros por sentencia)
+        operaciones = [self.crear(9 + n % 8, medico=n // 8 % 2, dia=n // 16) for n in range(1000)]
+        with CaptureQueriesContext(connection) as pocas:
+            self.assertEqual(self.lote(operaciones[:16]), [201] * 16)
+        Cita.objects.all().delete()
+        OcupacionMedico.objects.all().delete()
+        Notificaciones.objects.all().delete()
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as muchas:
+            self.assertEqual(self.lote(operaciones), [201] * 1000)
+        segundos = time.perf_counter() - inicio
+        self.assertEqual(Cita.objects.count(), 1000)
+        self.assertEqual(Notificaciones.objects.count(), 1000)
+        lecturas = lambda contexto: [q for q in contexto.captured_queries if not q['sql'].startswith('INSERT')]
+        self.assertEqual(len(lecturas(muchas)), len(lecturas(pocas)))
+        self.assertLess(segundos, 1)
+
+
+class BusquedaTests(TestCase):
+    """Autocompletado de pacientes y médicos (GET /paciente/buscar/ y /medico/buscar/, busqueda.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mariana = crear(Paciente, nombre='Mariana', apellido='Ruiz', email='m.ruiz@ejemplo.es',
+                            telefono='611000000', contrasena='x', dni='11111111H')
+        cls.luis = crear(Paciente, nombre='Luis', apellido='García', email='ana.l@ejemplo.es',
+                         telefono='600112233', contrasena='x', dni='22222222J')
+        cls.ana = crear(Paciente, nombre='Ana', apellido='García', email='ana.garcia@ejemplo.es',
+                        telefono='699000000', contrasena='x', dni='33333333P')
+        cls.cardiologo = crear(Medico, nombre='Pedro Sanz', especialidad='Cardiología', email='p@ejemplo.es',
+                               correo='p@ejemplo.es', ncolegiado='28001234')
+        cls.dermatologa = crear(Medico, nombre='Elena Sanz', especialidad='Dermatología', email='e@ejemplo.es',
+                                correo='e@ejemplo.es', ncolegiado='28009999')
+
+    def setUp(self):
+        self.pacientes, self.medicos = url('paciente-buscar'), url('medico-buscar')
+        if self.pacientes is None:
+            self.skipTest('Vista de Actividad 3')
+
+    def buscar(self, ruta, q, **parametros):
+        respuesta = self.client.get(ruta, {'q': q, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        clave = 'id_paciente' if ruta == self.pacientes else 'id_medico'
+        return [fila[clave] for fila in respuesta.json()]
+
+    def test_prefijo_telefono_y_email(self):
+        self.assertEqual(self.buscar(self.pacientes, '600 11'), [self.luis.pk])
+        self.assertEqual(self.buscar(self.pacientes, 'M.RUIZ@'), [self.mariana.pk])
+        self.assertEqual(self.buscar(self.pacientes, '3333'), [self.ana.pk])  # DNI
+        self.assertEqual(self.buscar(self.medicos, '2800'), [self.cardiologo.pk, self.dermatologa.pk])
+        self.assertEqual(self.buscar(self.medicos, '280099'), [self.dermatologa.pk])
+
+    def test_coincidencias_exactas_primero(self):
+        # "ana" es el principio de dos correos y parte del nombre de Mariana y Ana
+        resultado = self.buscar(self.pacientes, 'ana')
+        self.assertCountEqual(resultado[:2], [self.luis.pk, self.ana.pk])
+        self.assertEqual(resultado[2:], [self.mariana.pk])
+
+    def test_longitud_minima(self):
+        for q in ('', 'a', ' a '):
+            with self.subTest(q=q):
+                self.assertEqual(self.buscar(self.pacientes, q), [])
+                self.assertEqual(self.buscar(self.medicos, q), [])
+
+    def test_limite(self):
+        Paciente.objects.bulk_create(
+            Paciente(nombre=f'Paciente {n}', apellido='Ruiz', email=f'p{n}@ejemplo.es', contrasena='x',
+                     dni=f'9{n:07d}X')
+            for n in range(60)
+        )
+        for limite, cantidad in (('3', 3), ('0', 1), ('-5', 1), ('no', 10), ('1000', 50)):
+            with self.subTest(limite=limite):
+                self.assertEqual(len(self.buscar(self.pacientes, 'ruiz', limite=limite)), cantidad)
+
+    def test_palabras_en_varios_campos(self):
+        # Sin PostgreSQL cada palabra debe aparecer en alguno de los campos
+        if connection.vendor == 'postgresql':
+            self.skipTest('Búsqueda sin pg_trgm')
+        self.assertEqual(self.buscar(self.pacientes, 'garc ana'), [self.ana.pk])
+        self.assertEqual(self.buscar(self.pacientes, 'ana ruiz'), [self.mariana.pk])
+        self.assertEqual(self.buscar(self.pacientes, 'luis ruiz'), [])
+        self.assertEqual(self.buscar(self.medicos, 'sanz card'), [self.cardiologo.pk])
+        self.assertEqual(self.buscar(self.medicos, 'sanz'), [self.dermatologa.pk, self.cardiologo.pk])
+
+
+class RespuestasCondicionalesTests(TestCase):
+    """ETag y 304 de los listados (condicional.py) y compresión de las respuestas (compresion.py)."""
+
+    def setUp(self):
+        self.ruta = url('paciente-list') or url('gestionar_paciente')
+
+    def crear_pacientes(self, cantidad, desde=0):
+        pacientes = [
+            crear(Paciente, nombre=f'Paciente {n}', apellido='Ruiz', email=f'p{n}@ejemplo.es', telefono='600000000',
+                  contrasena='x', dni=f'{n:08d}T')
+            for n in range(desde, desde + cantidad)
+        ]
+        if connection.vendor != 'postgresql':
+            # Sin los triggers de PostgreSQL: lo que anota registrar_cambios
+            version = (Cambio.objects.aggregate(Max('version'))['version__max'] or 0) + 1
+            Cambio.objects.bulk_create(
+                Cambio(tabla='paciente', id_registro=p.pk, operacion='I', version=version, modificado=timezone.now())
+                for p in pacientes
+            )
+        return pacientes
+
+    def test_etag_y_304(self):
+        self.crear_pacientes(1)
+        respuesta = self.client.get(self.ruta)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Cache-Control'], 'no-cache')
+        etag = respuesta['ETag']
+
+        respuesta = self.client.get(self.ruta, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+        # Cada URL (filtros, página) tiene su propio ETag
+        self.assertNotEqual(self.client.get(self.ruta, {'page_size': 5})['ETag'], etag)
+
+    def test_version_tras_escritura(self):
+        self.crear_pacientes(1)
+        etag = self.client.get(self.ruta)['ETag']
+        nuevo, = self.crear_pacientes(1, desde=1)
+        respuesta = self.client.get(self.ruta, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertIn(nuevo.email, respuesta.content.decode())
+
+    def test_catalogo_tras_escritura(self):
+        ruta = url('medico-list')
+        if ruta is None:
+            self.skipTest('Vista de Actividad 3')
+        etag = self.client.get(ruta)['ETag']
+        self.assertEqual(self.client.get(ruta, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):  # La versión cambia tras el COMMIT
+            respuesta = self.client.post(ruta, {
+                'nombre': 'Elena Sanz', 'especialidad': 'Dermatología', 'email': 'e@ejemplo.es',
+                'ncolegiado': '28009999',
+            }, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.content[:200])
+        respuesta = self.client.get(ruta, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Elena Sanz', respuesta.content.decode())
+
+    def test_gzip(self):
+        self.crear_pacientes(30)
+        respuesta = self.client.get(self.ruta, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        self.assertEqual(self.client.get(self.ruta).content, gzip.decompress(respuesta.content))
+        # El ETag pasa a ser débil y sigue valiendo para el 304
+        etag = respuesta['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        respuesta = self.client.get(self.ruta, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_brotli(self):
+        if compresion.brotli is None:
+            self.skipTest('brotli no instalado')
+        self.crear_pacientes(30)
+        respuesta = self.client.get(self.ruta, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(respuesta['Content-Encoding'], 'br')
+        self.assertTrue(respuesta['ETag'].startswith('W/"'))
+        self.assertEqual(self.client.get(self.ruta).content, compresion.brotli.decompress(respuesta.content))
+
+    def test_respuesta_pequena_sin_comprimir(self):
+        self.crear_pacientes(1)
+        respuesta = self.client.get(self.ruta, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertLess(len(respuesta.content), compresion.TAMANO_MINIMO)
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+
+
+class RecordatoriosTests(DatosConsultorio, TestCase):
+    """Recordatorios de las citas de un día (generar_recordatorios)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.crear_citas(5)  # Todas mañana
+        Cita.objects.filter(pk=Cita.objects.order_by('pk')[0].pk).update(estado='cancelada')
+
+    def test_segunda_ejecucion_sin_duplicados(self):
+        self.assertEqual(notificaciones.generar_recordatorios(self.manana, 2), (4, 4))
+        self.assertEqual(notificaciones.generar_recordatorios(self.manana, 2), (4, 0))
+        self.assertEqual(Notificaciones.objects.filter(tipo='recordatorio').count(), 4)
+
+    def test_cita_movida_recibe_otro_recordatorio(self):
+        notificaciones.generar_recordatorios(self.manana)
+        cita = Cita.objects.filter(estado='confirmada').order_by('pk').last()
+        Cita.objects.filter(pk=cita.pk).update(hora=datetime.time(17), especialidad=None)
+        self.assertEqual(notificaciones.generar_recordatorios(self.manana), (4, 1))
+        nuevo = Notificaciones.objects.get(clave=f'recordatorio:{cita.pk}:{self.manana:%Y%m%d}1700')
+        self.assertIn('su cita de consulta', nuevo.mensaje)
+        self.assertIn('a las 17:00', nuevo.mensaje)
+
+
+class TransporteFallido(notificaciones.Transporte):
+    """Transporte de prueba: falla con los destinatarios de `fallan` o, sin ellos, con todo el lote."""
+
+    def __init__(self, fallan=None):
+        self.fallan = fallan
+
+    def enviar(self, lote):
+        if self.fallan is None:
+            raise ConnectionError('Servidor SMTP no disponible')
+        return {n.pk: 'Buzón lleno' for n in lote if n.destinatario in self.fallan}
+
+
+class EnvioNotificacionesTests(DatosConsultorio, TestCase):
+    """Bandeja de salida de notificaciones (reservar_lote y enviar_pendientes)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos()
+        cls.crear_citas(6)
+        for cita in Cita.objects.order_by('pk'):
+            notificaciones.encolar_notificacion(cita, 'reserva')
+
+    def enviar(self, transporte, tamano_lote=10):
+        return notificaciones.enviar_pendientes(transporte, notificaciones.MetricasEnvio(), tamano_lote)
+
+    def test_envio_con_correo_local(self):
+        # En las pruebas Django usa el backend de correo en memoria (locmem)
+        self.assertEqual(self.enviar(notificaciones.TransporteCorreo()), 6)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[0].to, [self.paciente.email])
+        self.assertFalse(Notificaciones.objects.filter(fecha_envio__isnull=True).exists())
+        self.assertEqual(self.enviar(notificaciones.TransporteCorreo()), 0)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_reserva_sin_repetidos(self):
+        # Un lote reservado no vuelve a entregarse hasta que caduca la reserva
+        lotes = [notificaciones.reservar_lote(4), notificaciones.reservar_lote(4), notificaciones.reservar_lote(4)]
+        ids = [n.pk for lote in lotes for n in lote]
+        self.assertEqual([len(lote) for lote in lotes], [4, 2, 0])
+        self.assertCountEqual(ids, Notificaciones.objects.values_list('pk', flat=True))
+        reserva = timezone.now() + datetime.timedelta(seconds=notificaciones.RESERVA)
+        for proximo in Notificaciones.objects.values_list('proximo_intento', flat=True):
+            self.assertAlmostEqual(proximo, reserva, delta=datetime.timedelta(seconds=5))
+
+    def test_reintento_con_espera_exponencial(self):
+        base = notificaciones.REINTENTO_BASE
+        for intentos in (1, 2, 3):
+            Notificaciones.objects.update(proximo_intento=timezone.now())  # Espera cumplida
+            antes = timezone.now()
+            self.assertEqual(self.enviar(TransporteFallido()), 6)
+            for notificacion in Notificaciones.objects.all():
+                self.assertEqual(notificacion.intentos, intentos)
+                self.assertEqual(notificacion.error, 'Servidor SMTP no disponible')
+                self.assertIsNone(notificacion.fecha_envio)
+                espera = (notificacion.proximo_intento - antes).total_seconds()
+                self.assertGreaterEqual(espera, base * 2 ** (intentos - 1) * 0.8 - 1)
+                self.assertLessEqual(espera, base * 2 ** (intentos - 1) * 1.2 + 1)
+            # Hasta que pasa la espera no se vuelven a intentar
+            self.assertEqual(self.enviar(TransporteFallido()), 0)
+
+    def test_fallos_parciales_y_agotadas(self):
+        Notificaciones.objects.filter(pk=Notificaciones.objects.order_by('pk')[0].pk).update(
+            destinatario='lleno@ejemplo.es', intentos=notificaciones.MAX_INTENTOS - 1,
+        )
+        metricas = notificaciones.MetricasEnvio()
+        self.assertEqual(notificaciones.enviar_pendientes(TransporteFallido({'lleno@ejemplo.es'}), metricas, 10), 6)
+        self.assertEqual(Notificaciones.objects.filter(fecha_envio__isnull=False).count(), 5)
+        self.assertEqual((metricas.enviadas, metricas.fallidas, metricas.agotadas), (5, 1, 1))
+        # Con MAX_INTENTOS fallos no se vuelve a reservar
+        Notificaciones.objects.update(proximo_intento=timezone.now())
+        self.assertEqual(notificaciones.reservar_lote(10), [])
+
+    def test_clave_idempotente(self):
+        cita = Cita.objects.order_by('pk').first()
+        nueva = lambda clave: Notificaciones(
+            id_cita=cita, tipo='recordatorio', mensaje='-', destinatario=self.paciente.email, clave=clave,
+        )
+        self.assertEqual(notificaciones._crear_nuevas([nueva('a'), nueva('b')], 10), 2)
+        # Otra ejecución ya creó "b": se crean solo las demás, sin error
+        self.assertEqual(notificaciones._crear_nuevas([nueva('b'), nueva('c')], 10), 1)
+        self.assertEqual(Notificaciones.objects.filter(clave__isnull=False).count(), 3)
+
+
+class ReservaNotificacionesConcurrenteTests(DatosConsultorio, TransactionTestCase):
+    """
+    Varios hilos reservan lotes a la vez (SELECT ... FOR UPDATE SKIP LOCKED):
+    cada notificación se entrega a un solo hilo.
+    """
+    HILOS = 8
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('SKIP LOCKED requiere PostgreSQL')
+        self.crear_datos()
+        self.crear_citas(40)
+        for cita in Cita.objects.order_by('pk'):
+            for _ in range(5):
+                notificaciones.encolar_notificacion(cita, 'reserva')
+
+    def tearDown(self):
+        for modelo in (Notificaciones, Cita, OcupacionMedico, Medico, Paciente):
+            modelo.objects.all().delete()
+
+    def test_sin_repetidos(self):
+        barrera = threading.Barrier(self.HILOS)
+        reservadas = []
+
+        def reservar():
+            try:
+                barrera.wait()
+                while lote := notificaciones.reservar_lote(7):
+                    reservadas.extend(n.pk for n in lote)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(reservadas), len(set(reservadas)))
+        self.assertCountEqual(reservadas, Notificaciones.objects.values_list('pk', flat=True))
+
+
+@override_settings(DATABASE_ROUTERS=['consultorio.replicas.RouterReplicas'])
+class ReplicasTests(TransactionTestCase):
+    """
+    Lecturas a las réplicas (RouterReplicas y ReplicasMiddleware). La réplica
+    es otra base de datos SQLite con las mismas tablas y sin filas: un listado
+    vacío indica que se ha leído de ella.
+    """
+    REPLICA = REPLICA_PRUEBAS
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        crear_tablas(connections[cls.REPLICA])
+
+    def setUp(self):
+        self.ruta = url('paciente-list') or url('gestionar_paciente')
+        parche = mock.patch.object(replicas, 'REPLICAS', [self.REPLICA])
+        parche.start()
+        self.addCleanup(parche.stop)
+        replicas._estado.clear()
+        self.paciente = crear(Paciente, nombre='Ana', apellido='García', email='ana@ejemplo.es', contrasena='x',
+                              dni='12345678Z')
+        self.router = replicas.RouterReplicas()
+        self.middleware = replicas.ReplicasMiddleware(lambda request: HttpResponse())
+
+    def tearDown(self):
+        Paciente.objects.all().delete()
+
+    def listado(self):
+        respuesta = self.client.get(self.ruta)
+        self.assertEqual(respuesta.status_code, 200)
+        return self.paciente.email in respuesta.content.decode()
+
+    def peticion(self, metodo='get', **cookies):
+        # Estado de una petición nueva (ReplicasMiddleware.process_request)
+        peticion = getattr(RequestFactory(), metodo)('/')
+        peticion.COOKIES.update(cookies)
+        self.middleware.process_request(peticion)
+
+    def test_lecturas_en_la_replica(self):
+        self.assertFalse(self.listado())
+        self.peticion()
+        self.assertEqual(self.router.db_for_read(Paciente), self.REPLICA)
+
+    def test_principal_tras_escritura(self):
+        self.peticion()
+        self.assertEqual(self.router.db_for_read(Paciente), self.REPLICA)
+        self.assertEqual(self.router.db_for_write(Paciente), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Paciente), DEFAULT_DB_ALIAS)  # Resto de la petición
+        self.peticion('post')
+        self.assertEqual(self.router.db_for_read(Paciente), DEFAULT_DB_ALIAS)
+
+    def test_principal_en_transaccion(self):
+        self.peticion()
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Paciente), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Paciente), self.REPLICA)
+
+    def test_cookie_tras_escritura(self):
+        respuesta = self.client.post(self.ruta, {
+            'nombre': 'Luis', 'apellido': 'Ruiz', 'email': 'luis@ejemplo.es', 'contrasena': 'x', 'dni': '87654321X',
+        }, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.content[:200])
+        self.assertIn(replicas.COOKIE, respuesta.cookies)
+        self.assertTrue(self.listado())  # El cliente lleva la cookie: lee de la principal
+        self.client.cookies.clear()
+        self.assertFalse(self.listado())
+        self.peticion(**{replicas.COOKIE: '1'})
+        self.assertEqual(self.router.db_for_read(Paciente), DEFAULT_DB_ALIAS)
+
+    def test_replica_no_disponible(self):
+        with mock.patch.object(replicas, 'RETRASO_MAXIMO', -1):  # Cualquier retraso es excesivo
+            self.assertTrue(self.listado())
+            self.peticion()
+            self.assertEqual(self.router.db_for_read(Paciente), DEFAULT_DB_ALIAS)
+
+
+class ReferenciasCitaTests(TestCase):
+    """Referencias de cita (referencias.py): base32 de Crockford con carácter de control."""
+    NUMEROS = (0, 1, 31, 32, 123456789, 32 ** 11 - 1)
+
+    def test_ida_y_vuelta(self):
+        referencias = [referencias_cita.codificar_refcita(n) for n in self.NUMEROS]
+        for referencia in referencias:
+            self.assertEqual(len(referencia), 12)
+            self.assertTrue(referencias_cita.refcita_valida(referencia), referencia)
+        # Ancho fijo: el orden alfabético es el numérico
+        self.assertEqual(sorted(referencias), referencias)
+        self.assertEqual(referencias_cita.codificar_refcita(0)[:11], '0' * 11)
+
+    def test_un_caracter_cambiado(self):
+        referencia = referencias_cita.codificar_refcita(123456789)
+        for posicion, original in enumerate(referencia):
+            for caracter in referencias_cita.ALFABETO.replace(original, ''):
+                cambiada = referencia[:posicion] + caracter + referencia[posicion + 1:]
+                self.assertFalse(referencias_cita.refcita_valida(cambiada), cambiada)
+
+    def test_transposicion(self):
+        # Luhn mod 32 detecta todas las transposiciones de caracteres contiguos salvo 0 <-> Z
+        for numero in (123456789, 987654321012, 32 ** 11 - 12345):
+            referencia = referencias_cita.codificar_refcita(numero)
+            for posicion in range(len(referencia) - 1):
+                a, b = referencia[posicion], referencia[posicion + 1]
+                if a == b or {a, b} == {'0', 'Z'}:
+                    continue
+                transpuesta = referencia[:posicion] + b + a + referencia[posicion + 2:]
+                self.assertFalse(referencias_cita.refcita_valida(transpuesta), transpuesta)
+
+    def test_normalizar(self):
+        self.assertEqual(referencias_cita.normalizar_refcita('ab-cd ef'), 'ABCDEF')
+        self.assertEqual(referencias_cita.normalizar_refcita('iLo'), '110')
+        referencia = referencias_cita.codificar_refcita(32 ** 10 + 1)  # 1000000000 1 + control
+        self.assertEqual(referencia[:11], '10000000001')
+        for escrita in (referencia.lower(), f'{referencia[:4]}-{referencia[4:8]}-{referencia[8:]}',
+                        'I' + referencia[1:].replace('0', 'O'), f' l{referencia[1:]} '):
+            with self.subTest(escrita=escrita):
+                self.assertTrue(referencias_cita.refcita_valida(escrita))
+        self.assertFalse(referencias_cita.refcita_valida(referencia[:-1]))
+        self.assertFalse(referencias_cita.refcita_valida(referencia + '0'))
+        self.assertFalse(referencias_cita.refcita_valida('U' + referencia[1:]))
+
+    def test_numero_demasiado_grande(self):
+        for numero in (32 ** 11, -1):
+            with self.assertRaises(ValueError):
+                referencias_cita.codificar_refcita(numero)
+
+    def test_generar(self):
+        referencias = referencias_cita.generar_refcitas(200) + referencias_cita.generar_refcitas(3)
+        self.assertEqual(len(set(referencias)), 203)
+        self.assertTrue(all(referencias_cita.refcita_valida(r) for r in referencias))
+        self.assertEqual(sorted(referencias), referencias)  # Crecientes
+
+    def test_cargar_datos(self):
+        if not any(campo.name == 'refcita' for campo in Cita._meta.concrete_fields):
+            self.skipTest('Esquema de Actividad 2 (sin refcita)')
+        call_command('cargar_datos', '--sin-fixtures', '--medicos=2', '--pacientes=3', '--citas=20', '--lote=7',
+                     stdout=io.StringIO())
+        referencias = list(Cita.objects.values_list('refcita', flat=True))
+        self.assertEqual(len(set(referencias)), 20)
+        self.assertTrue(all(referencias_cita.refcita_valida(r) for r in referencias))
+
+
+class ImportacionPacientesTests(TestCase):
+    """Importación en streaming (NDJSON y CSV) de PacienteListCreateView."""
+
+    def setUp(self):
+        self.ruta = url('gestionar_paciente')
+        if self.ruta is None:
+            self.skipTest('Vista de Actividad 2')
+
+    def test_ndjson(self):
+        cuerpo = '{"nombre": "Ana", "apellido": "Ruiz", "email": "ana@ejemplo.es", "contrasena": "x"}\n{"nombre": ""}\n'
+        respuesta = self.client.post(self.ruta, cuerpo, content_type='application/x-ndjson')
+        self.assertEqual(respuesta.status_code, 207)
+        self.assertEqual(respuesta.json()['creados'], 1)
+        self.assertEqual([error['fila'] for error in respuesta.json()['errores']], [2])
+
+    def test_cuerpo_vacio(self):
+        respuesta = self.client.post(self.ruta, b'', content_type='text/csv')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_codificacion_no_valida(self):
+        cuerpo = 'nombre,apellido,email,contrasena\nJosé,Núñez,jose@ejemplo.es,x\n'.encode('latin-1')
+        respuesta = self.client.post(self.ruta, cuerpo, content_type='text/csv')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['creados'], 0)
+        self.assertFalse(Paciente.objects.exists())
+
+
+class MetricasTests(TestCase):
+    """Acceso a /metrics (METRICAS_IPS y METRICAS_TOKEN) y formato de texto de Prometheus."""
+
+    def setUp(self):
+        self.ruta = url('metricas')
+        for nombre, valor in (('ACTIVAS', True), ('IPS', ['127.0.0.1']), ('TOKEN', None)):
+            parche = mock.patch.object(metricas, nombre, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def test_ip_permitida(self):
+        respuesta = self.client.get(self.ruta, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], metricas.TIPO_CONTENIDO)
+
+    def test_ip_no_permitida(self):
+        self.assertEqual(self.client.get(self.ruta, REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    def test_token(self):
+        with mock.patch.object(metricas, 'TOKEN', 'secreto'):
+            self.assertEqual(self.client.get(self.ruta).status_code, 403)
+            self.assertEqual(self.client.get(self.ruta, HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+            self.assertEqual(self.client.get(self.ruta, HTTP_AUTHORIZATION='secreto').status_code, 403)
+            self.assertEqual(self.client.get(self.ruta, HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+            # El token no sustituye a la lista de IPS
+            respuesta = self.client.get(self.ruta, REMOTE_ADDR='10.0.0.1', HTTP_AUTHORIZATION='Bearer secreto')
+            self.assertEqual(respuesta.status_code, 403)
+
+    def test_formato(self):
+        # Etiquetas propias de la prueba: los valores del registro se acumulan entre pruebas
+        metricas.citas_conflictos.inc(2, operacion='prueba "formato"')
+        metricas.disponibilidad_segundos.observar(0.003, consulta='prueba_formato')
+        metricas.disponibilidad_segundos.observar(7, consulta='prueba_formato')
+        lineas = self.client.get(self.ruta).content.decode().splitlines()
+
+        inicio = lineas.index('# HELP consultorio_citas_conflictos_total '
+                              'Reservas y reprogramaciones rechazadas porque el horario ya estaba ocupado.')
+        self.assertEqual(lineas[inicio + 1], '# TYPE consultorio_citas_conflictos_total counter')
+        self.assertIn('consultorio_citas_conflictos_total{operacion="prueba \\"formato\\""} 2', lineas)
+
+        self.assertIn('# TYPE consultorio_disponibilidad_segundos histogram', lineas)
+        serie = [linea for linea in lineas if 'consulta="prueba_formato"' in linea]
+        self.assertEqual(serie[:3], [
+            'consultorio_disponibilidad_segundos_bucket{consulta="prueba_formato",le="0.001"} 0',
+            'consultorio_disponibilidad_segundos_bucket{consulta="prueba_formato",le="0.0025"} 0',
+            'consultorio_disponibilidad_segundos_bucket{consulta="prueba_formato",le="0.005"} 1',
+        ])
+        self.assertEqual(serie[-4:], [
+            'consultorio_disponibilidad_segundos_bucket{consulta="prueba_formato",le="5"} 1',
+            'consultorio_disponibilidad_segundos_bucket{consulta="prueba_formato",le="+Inf"} 2',
+            'consultorio_disponibilidad_segundos_sum{consulta="prueba_formato"} 7.003',
+            'consultorio_disponibilidad_segundos_count{consulta="prueba_formato"} 2',
+        ])
+        for linea in lineas:
+            if not linea.startswith('#'):
+                float(linea.rsplit(' ', 1)[1])  # Cada muestra termina en un número
+
+
+class PerfiladoTests(TestCase):
+    """PerfiladoMiddleware: número de consultas y funciones del perfil, con WSGI y con ASGI."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        parche = mock.patch.object(perfilado, 'DIRECTORIO', directorio.name)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.directorio = Path(directorio.name)
+        self.peticion = RequestFactory().get('/', HTTP_X_PERFILAR=perfilado.firma_perfilado())
+
+    def comprobar(self, respuesta):
+        fichero = self.directorio / respuesta['X-Perfil']
+        self.assertIn('-2consultas-', fichero.name)
+        self.assertIn('consultar', {funcion for _, _, funcion in pstats.Stats(str(fichero)).stats})
+
+    @staticmethod
+    def consultar():
+        return list(Medico.objects.all()), Paciente.objects.count()
+
+    def test_sincrono(self):
+        def vista(request):
+            self.consultar()
+            return HttpResponse()
+        self.comprobar(perfilado.PerfiladoMiddleware(vista)(self.peticion))
+
+    async def test_asincrono(self):
+        # La vista se ejecuta en el bucle de eventos y las consultas en el hilo de sync_to_async
+        async def vista(request):
+            await sync_to_async(self.consultar)()
+            return HttpResponse()
+        self.comprobar(await perfilado.PerfiladoMiddleware(vista)(self.peticion))
@@ -14,12 +14,25 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
+from . import asincrono
+from .metricas import exponer_metricas
 from .views import (AgendarCitaView, CancelarReprogramarCitaView,
-                    DisponibilidadHorariosView, PacienteListCreateView,
-                    index_view)
+                    CitaAutomaticaView, DisponibilidadHorariosView,
+                    PacienteListCreateView, index_view)
+
+if settings.CONSULTORIO_ASINCRONO:
+    # Servidor ASGI: las lecturas con el ORM asíncrono, las escrituras con DRF
+    disponibilidad_view = asincrono.disponibilidad_horarios
+    gestionar_cita_view = asincrono.lecturas_asincronas(
+        asincrono.consultar_citas, CancelarReprogramarCitaView.as_view()
+    )
+else:
+    disponibilidad_view = DisponibilidadHorariosView.as_view()
+    gestionar_cita_view = CancelarReprogramarCitaView.as_view()
 
 # Aquí cargamos las URLs que vayamos a usar para las pruebas.
 urlpatterns = [
@@ -27,6 +40,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('citas/paciente/', PacienteListCreateView.as_view(), name='gestionar_paciente'),
     path('citas/agendar/', AgendarCitaView.as_view(), name='agendar_cita'),
-    path('citas/disponibilidad/', DisponibilidadHorariosView.as_view(), name='disponibilidad_horarios'),
-    path('citas/gestionarcita/', CancelarReprogramarCitaView.as_view(), name='cancelar_reprogramar_cita'),
+    path('citas/disponibilidad/', disponibilidad_view, name='disponibilidad_horarios'),
+    path('citas/huecos/', CitaAutomaticaView.as_view(), name='cita_automatica'),  # Primer hueco libre
+    path('citas/gestionarcita/', gestionar_cita_view, name='cancelar_reprogramar_cita'),
+    path('metrics', exponer_metricas, name='metricas'),  # Prometheus (METRICAS_IPS y METRICAS_TOKEN)
 ]
\ No newline at end of file
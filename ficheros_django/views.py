@@ -1,5 +1,6 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.shortcuts import render
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.generics import (ListCreateAPIView,
@@ -7,8 +8,24 @@ from rest_framework.generics import (ListCreateAPIView,
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Cita, Medico, Paciente
-from .serializers import CitaSerializer, MedicoSerializer, PacienteSerializer
+from .asignacion import reservar_primer_hueco
+from .condicional import ListadoCondicionalMixin
+from .disponibilidad import (DISPONIBILIDAD_MAX_DIAS, ESTADOS_LIBRES,
+                             HUECOS_MAX_DIAS, es_conflicto_horario,
+                             horarios_disponibles, horarios_disponibles_rango,
+                             liberar_horario, mascara_a_horas, ocupar_horario,
+                             proximos_huecos)
+from .importacion import (TAMANO_LOTE, TAMANO_LOTE_MAX, CodificacionNoValida,
+                          decodificar_lineas, importar_pacientes, leer_csv,
+                          leer_json, leer_ndjson)
+from .instrumentacion import contar_consultas
+from .metricas import (citas_canceladas, citas_conflictos, citas_reprogramadas,
+                       citas_reservadas)
+from .models import Cita, Paciente
+from .notificaciones import encolar_notificacion
+from .serializers import (CitaResumenSerializer, CitaSerializer,
+                          HuecosSerializer, MedicoSerializer,
+                          PacienteSerializer, ReservaAutomaticaSerializer)
 
 
 # Vista principal
@@ -20,31 +37,47 @@ def index_view(request):
     except Exception as e:
         return Response({"error": f"Error al cargar la página: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Tipos de contenido que se importan en streaming
+TIPOS_STREAMING = ('application/x-ndjson', 'application/ndjson', 'text/csv')
+
 # Permite listar y crear instancias de Paciente.
-class PacienteListCreateView(ListCreateAPIView):
+class PacienteListCreateView(ListadoCondicionalMixin, ListCreateAPIView):
 
-    # GET: Lista todos los pacientes.
+    # GET: Lista todos los pacientes (304 si la tabla no ha cambiado desde la última petición).
     # POST: Crea uno o varios pacientes.
 
     queryset = Paciente.objects.all()
     serializer_class = PacienteSerializer
+    tablas_version = ('paciente',)
 
     def create(self, request, *args, **kwargs):
         
         # Sobrescribe el método create para permitir creación masiva de pacientes.
+        # - Lista JSON: importación por lotes, devuelve los pacientes creados.
+        # - NDJSON (application/x-ndjson) o CSV (text/csv): el cuerpo se lee en
+        #   streaming, línea a línea, sin cargarlo entero en memoria.
+        # ?lote=N ajusta el número de filas por lote.
+        try:
+            tamano_lote = min(max(int(request.query_params.get('lote', TAMANO_LOTE)), 1), TAMANO_LOTE_MAX)
+        except ValueError:
+            return Response({"error": "El parámetro 'lote' debe ser un número entero."}, status=status.HTTP_400_BAD_REQUEST)
+
+        tipo = (request.content_type or '').split(';')[0].strip()
+        if tipo in TIPOS_STREAMING:
+            if request.stream is None:  # Sin cuerpo (Content-Length: 0)
+                return Response({"error": "El cuerpo de la petición está vacío."}, status=status.HTTP_400_BAD_REQUEST)
+            lineas = decodificar_lineas(request.stream)
+            filas = leer_csv(lineas) if tipo == 'text/csv' else leer_ndjson(lineas)
+            try:
+                resultado = importar_pacientes(filas, tamano_lote)
+            except CodificacionNoValida as e:
+                return Response({"error": str(e), "creados": e.creados}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(resultado, status=status.HTTP_207_MULTI_STATUS)
+
         data = request.data
         if isinstance(data, list):  # Múltiples JSON
-            with transaction.atomic():
-                errores = []
-                resultados = []
-                for paciente_data in data:
-                    serializer = self.get_serializer(data=paciente_data)
-                    if serializer.is_valid():
-                        serializer.save()
-                        resultados.append(serializer.data)
-                    else:
-                        errores.append({"error": serializer.errors})
-                return Response({"resultados": resultados, "errores": errores}, status=status.HTTP_207_MULTI_STATUS)
+            resultado = importar_pacientes(leer_json(data), tamano_lote, devolver_datos=True)
+            return Response(resultado, status=status.HTTP_207_MULTI_STATUS)
         return super().create(request, *args, **kwargs)
 
 
@@ -68,55 +101,130 @@ class AgendarCitaView(APIView):
         }, status=200)
 
     # POST: Crea una nueva cita médica.
+    # La existencia de paciente y médico ya la comprueba el serializer
+    # (PrimaryKeyRelatedField), así que una reserva correcta solo hace esas
+    # dos lecturas, el INSERT de la cita, la actualización del índice y el
+    # INSERT de la notificación (la envía después enviar_notificaciones).
+    @contar_consultas
     def post(self, request):
         serializer = CitaSerializer(data=request.data)
         if serializer.is_valid():
-            with transaction.atomic():
-                id_paciente = serializer.validated_data['id_paciente']
-                id_medico = serializer.validated_data['id_medico']
-                fecha = serializer.validated_data['fecha']
-                hora = serializer.validated_data['hora']
-
-                # Validación de existencia de paciente y médico
-                if not Paciente.objects.filter(id_paciente=id_paciente.id_paciente).exists():
-                    return Response({"error": "El paciente no existe."}, status=status.HTTP_404_NOT_FOUND)
-
-                if not Medico.objects.filter(id_medico=id_medico.id_medico).exists():
-                    return Response({"error": "El médico no existe."}, status=status.HTTP_404_NOT_FOUND)
-
-                # Validación de citas duplicadas
-                if Cita.objects.filter(id_paciente=id_paciente, id_medico=id_medico, fecha=fecha, hora=hora).exists():
-                    return Response({"error": "Ya existe una cita en este horario."}, status=status.HTTP_400_BAD_REQUEST)
-
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            try:
+                with transaction.atomic():
+                    # Las citas duplicadas las rechaza la base de datos (índice único
+                    # cita_medico_horario_unico), también con peticiones concurrentes
+                    cita = serializer.save()
+                    ocupar_horario(cita)  # Actualiza el índice de disponibilidad
+                    encolar_notificacion(cita, 'reserva')
+            except IntegrityError as e:
+                if es_conflicto_horario(e):
+                    citas_conflictos.inc(operacion='reserva')
+                    return Response({"error": "Ya existe una cita en este horario."}, status=status.HTTP_409_CONFLICT)
+                raise
+            citas_reservadas.inc(origen='individual')
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Convierte una fecha 'YYYY-MM-DD' en date (None si no es válida).
+def parse_fecha(valor):
+    try:
+        return parse_date(valor) if valor else None
+    except ValueError:  # Formato correcto pero fecha inexistente
+        return None
+
 # Consulta la disponibilidad de horarios para una especialidad y fecha específicas.
 class DisponibilidadHorariosView(APIView):
 
-    # GET: Devuelve los horarios disponibles.
+    # GET: Devuelve los horarios disponibles (en total y por médico).
+    # Con fecha_desde/fecha_hasta devuelve todos los días del rango en una sola respuesta.
     def get(self, request):
         especialidad = request.query_params.get('especialidad')
         fecha = request.query_params.get('fecha')
+        id_medico = request.query_params.get('id_medico')  # Opcional: un único médico
 
         # Validación de parámetros
         if not especialidad:
             return Response({"error": "El parámetro 'especialidad' es obligatorio."}, status=status.HTTP_400_BAD_REQUEST)
+        if 'fecha_desde' in request.query_params or 'fecha_hasta' in request.query_params:
+            return self.get_rango(request, especialidad, id_medico)
         if not fecha:
             return Response({"error": "El parámetro 'fecha' es obligatorio."}, status=status.HTTP_400_BAD_REQUEST)
 
+        fecha = parse_fecha(fecha)
+        if not fecha:
+            return Response({"error": "El parámetro 'fecha' debe tener el formato YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            ocupados = Cita.objects.filter(id_medico__especialidad=especialidad, fecha=fecha).values_list('hora', flat=True)
-            horarios_ocupados = [hora.strftime("%H:%M:%S") for hora in ocupados]
+            # Lectura del índice de ocupación por médico (sin recorrer la tabla cita)
+            por_medico = horarios_disponibles(especialidad, fecha, id_medico)
 
-            horarios_totales = ["09:00:00", "10:00:00", "11:00:00", "13:00:00", "14:00:00", "15:00:00"]
-            disponibles = [h for h in horarios_totales if h not in horarios_ocupados]
+            # Una hora está disponible si al menos un médico la tiene libre
+            disponibles = sorted({h for horas in por_medico.values() for h in horas})
 
-            return Response({"disponibles": disponibles}, status=status.HTTP_200_OK)
+            return Response({"disponibles": disponibles, "medicos": por_medico}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": f"Error al consultar disponibilidad: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # Disponibilidad de un rango de fechas (semana, mes...).
+    # Por cada día devuelve las horas libres y, por médico, la máscara de bits
+    # de sus horas libres (bit 9 = 09:00, bit 10 = 10:00...).
+    def get_rango(self, request, especialidad, id_medico):
+        fecha_desde = parse_fecha(request.query_params.get('fecha_desde'))
+        fecha_hasta = parse_fecha(request.query_params.get('fecha_hasta'))
+
+        if not fecha_desde or not fecha_hasta:
+            return Response({"error": "Los parámetros 'fecha_desde' y 'fecha_hasta' son obligatorios (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        if fecha_hasta < fecha_desde:
+            return Response({"error": "'fecha_hasta' no puede ser anterior a 'fecha_desde'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (fecha_hasta - fecha_desde).days + 1 > DISPONIBILIDAD_MAX_DIAS:
+            return Response({"error": f"El rango no puede superar {DISPONIBILIDAD_MAX_DIAS} días."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            dias = horarios_disponibles_rango(especialidad, fecha_desde, fecha_hasta, id_medico)
+            respuesta = {}
+            for fecha, por_medico in dias.items():
+                libres = 0
+                for mascara in por_medico.values():
+                    libres |= mascara
+                respuesta[fecha.isoformat()] = {"disponibles": mascara_a_horas(libres), "medicos": por_medico}
+
+            return Response({
+                "fecha_desde": fecha_desde.isoformat(),
+                "fecha_hasta": fecha_hasta.isoformat(),
+                "dias": respuesta,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": f"Error al consultar disponibilidad: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Cita automática: busca o reserva el primer hueco libre de una especialidad.
+class CitaAutomaticaView(APIView):
+
+    # GET: Los primeros huecos libres entre los médicos de la especialidad, sin
+    # recorrer la disponibilidad día a día (opcionales: id_medico, desde,
+    # hora_desde, hora_hasta y cantidad).
+    def get(self, request):
+        parametros = HuecosSerializer(data=request.query_params)
+        if not parametros.is_valid():
+            return Response(parametros.errors, status=status.HTTP_400_BAD_REQUEST)
+        huecos = proximos_huecos(**parametros.validated_data)
+        return Response({
+            "huecos": [
+                {"fecha": fecha.isoformat(), "hora": hora.strftime("%H:%M:%S"), "id_medico": id_medico}
+                for fecha, hora, id_medico in huecos
+            ]
+        }, status=status.HTTP_200_OK)
+
+    # POST: Reserva para id_paciente el primer hueco con las mismas preferencias.
+    @contar_consultas
+    def post(self, request):
+        datos = ReservaAutomaticaSerializer(data=request.data)
+        if not datos.is_valid():
+            return Response(datos.errors, status=status.HTTP_400_BAD_REQUEST)
+        cita = reservar_primer_hueco(**datos.validated_data)
+        if cita is None:
+            return Response({"error": f"No hay huecos libres en los próximos {HUECOS_MAX_DIAS} días."}, status=status.HTTP_409_CONFLICT)
+        return Response(CitaSerializer(cita).data, status=status.HTTP_201_CREATED)
+
 # Permite consultar, reprogramar o cancelar citas médicas.
 class CancelarReprogramarCitaView(APIView):
 
@@ -130,8 +238,11 @@ class CancelarReprogramarCitaView(APIView):
         if not (id_cita or id_paciente or id_medico):
             return Response({"error": "Debe proporcionar al menos un parámetro (id_cita, id_paciente o id_medico)."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Con ?vista=resumen se devuelven solo los IDs y nombres
+        serializer_class = CitaResumenSerializer if request.query_params.get('vista') == 'resumen' else CitaSerializer
+
         try:
-            citas = Cita.objects.all()
+            citas = serializer_class.optimizar_queryset(Cita.objects.all())
             if id_cita:
                 citas = citas.filter(id_cita=id_cita)
             if id_paciente:
@@ -139,7 +250,7 @@ class CancelarReprogramarCitaView(APIView):
             if id_medico:
                 citas = citas.filter(id_medico=id_medico)
 
-            serializer = CitaSerializer(citas, many=True)
+            serializer = serializer_class(citas, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": f"Error al consultar citas: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -151,7 +262,7 @@ class CancelarReprogramarCitaView(APIView):
             return Response({"error": "Debe proporcionar id_cita."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            cita = Cita.objects.get(id_cita=id_cita)
+            cita = Cita.objects.select_related('id_paciente').get(id_cita=id_cita)
         except Cita.DoesNotExist:
             return Response({"error": "Cita no encontrada."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -165,14 +276,22 @@ class CancelarReprogramarCitaView(APIView):
             with transaction.atomic():
                 if (cita.fecha == nueva_fecha and cita.hora == nueva_hora):
                     return Response({"error": "El nuevo horario es el mismo que el actual."}, status=status.HTTP_400_BAD_REQUEST)
-                if Cita.objects.filter(fecha=nueva_fecha, hora=nueva_hora).exclude(id_cita=id_cita).exists():
-                    return Response({"error": "El nuevo horario ya está ocupado."}, status=status.HTTP_400_BAD_REQUEST)
+                # Si el nuevo horario está ocupado, el UPDATE viola cita_medico_horario_unico
+                liberar_horario(cita)  # Libera el horario anterior en el índice
                 cita.fecha = nueva_fecha
                 cita.hora = nueva_hora
                 cita.save()
-                return Response({"mensaje": "Cita reprogramada exitosamente."}, status=status.HTTP_200_OK)
+                ocupar_horario(cita)  # Ocupa el nuevo horario
+                encolar_notificacion(cita, 'reprogramacion')
+        except IntegrityError as e:
+            if es_conflicto_horario(e):
+                citas_conflictos.inc(operacion='reprogramacion')
+                return Response({"error": "El nuevo horario ya está ocupado."}, status=status.HTTP_409_CONFLICT)
+            return Response({"error": f"Error al reprogramar cita: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             return Response({"error": f"Error al reprogramar cita: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        citas_reprogramadas.inc(origen='individual')  # Tras el commit
+        return Response({"mensaje": "Cita reprogramada exitosamente."}, status=status.HTTP_200_OK)
 
     # DELETE: Cancela una cita.
     def delete(self, request):
@@ -181,8 +300,13 @@ class CancelarReprogramarCitaView(APIView):
             return Response({"error": "Debe proporcionar id_cita."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            cita = Cita.objects.get(id_cita=id_cita)
-            cita.delete()
+            cita = Cita.objects.select_related('id_paciente').get(id_cita=id_cita)
+            with transaction.atomic():
+                liberar_horario(cita)  # Libera el horario en el índice
+                cita.delete()
+                if cita.estado not in ESTADOS_LIBRES:
+                    encolar_notificacion(cita, 'cancelacion')  # Sin cita (ya borrada)
+            citas_canceladas.inc(origen='individual')
             return Response({"mensaje": "Cita cancelada exitosamente."}, status=status.HTTP_200_OK)
         except Cita.DoesNotExist:
             return Response({"error": "Cita no encontrada."}, status=status.HTTP_404_NOT_FOUND)